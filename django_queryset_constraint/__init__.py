@@ -1,2 +1,7 @@
 from django_queryset_constraint.constraints import QuerysetConstraint
+from django_queryset_constraint.exceptions import QuerysetConstraintViolation
 from django_queryset_constraint.utils import M
+
+default_app_config = (
+    "django_queryset_constraint.apps.DjangoQuerysetConstraintConfig"
+)
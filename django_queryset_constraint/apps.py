@@ -2,7 +2,21 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class DjangoQuerysetConstraintConfig(AppConfig):
     name = "django_queryset_constraint"
+
+    def ready(self):
+        from django_queryset_constraint import sqlite
+
+        # SQLite tables read by triggers can only be remade while suspended
+        pre_migrate.connect(
+            sqlite.suspend_app_triggers,
+            dispatch_uid=sqlite.__name__ + ".suspend_app_triggers",
+        )
+        post_migrate.connect(
+            sqlite.install_app_triggers,
+            dispatch_uid=sqlite.__name__ + ".install_app_triggers",
+        )
@@ -0,0 +1,253 @@
+"""Per-vendor implementations of installing QuerysetConstraints.
+
+Backends are looked up by the vendor of the schema editor's connection, see
+:code:`get_backend`, the SQLite backend being defined in the sqlite module.
+"""
+from django_queryset_constraint import generated, sqlite, strategies
+from django_queryset_constraint.partitions import (
+    create_trigger_sql,
+    drop_trigger_sql,
+)
+
+
+class PostgreSQLBackend:
+    """Install constraints as deferred constraint triggers.
+
+    The triggers call plpgsql functions checking the constraint queryset,
+    compiled by :code:`QuerysetConstraint._function_sql`, unless the
+    constraint is installed as a CHECK constraint, see the strategies module.
+    """
+
+    def check_supported(self, constraint):
+        """Raise ValueError if constraint cannot be installed."""
+
+    def compile_query(self, queryset, connection):
+        """Render queryset as SQL, with its parameters inlined."""
+        compiler = queryset.query.get_compiler(connection=connection)
+        sql, sql_params = compiler.as_sql()
+        with connection.cursor() as cursor:
+            return cursor.mogrify(sql, sql_params).decode()
+
+    def install_function(self, constraint, schema_editor, model, error=None):
+        """Replace the trigger functions, leaving the triggers in place."""
+        connection = schema_editor.connection
+        strategy = strategies.resolve_strategy(constraint, model, connection)
+        if strategy == "check":
+            if constraint.mode != "enforce":
+                raise ValueError(
+                    "Constraint '{}' is installed as a CHECK constraint, "
+                    "which only supports 'enforce' mode, see "
+                    "reevaluate_strategies".format(constraint.name)
+                )
+            return None
+        sql = constraint._function_sql(
+            model, error=error, connection=connection, strategy=strategy
+        )
+        return schema_editor.execute(sql, params=None)
+
+    def install_trigger(
+        self, constraint, schema_editor, model, defer=True, error=None
+    ):
+        """Install the triggers, and the functions they call."""
+        table = model._meta.db_table
+        function_name, trigger_name = constraint._generate_names(table)
+        deferrable = "DEFERRABLE INITIALLY DEFERRED" if defer else ""
+        connection = schema_editor.connection
+
+        record = ""
+        strategy = constraint.strategy
+        if strategy == "auto":
+            decision = strategies.recorded_decision(
+                constraint, model, connection
+            ) or strategies.decide(constraint, model, connection, defer=defer)
+            strategy = decision.strategy
+            record = strategies.record_sql(constraint, model, decision)
+        if strategy == "check":
+            expression = strategies.check_expression(
+                constraint, model, connection
+            )
+            if expression is None:
+                raise ValueError(
+                    "Constraint '{}' is not row-local, thus cannot use "
+                    "strategy='check'".format(constraint.name)
+                )
+            # Existing rows are not validated, as with the triggers
+            sql = "ALTER TABLE {} ADD CONSTRAINT {} CHECK ({}) NOT VALID;".format(
+                schema_editor.quote_name(table),
+                constraint._check_name(table),
+                expression,
+            )
+            return schema_editor.execute(sql + record, params=None)
+
+        # Install the generated columns read by the functions
+        queryset = constraint.get_queryset(model, using=connection.alias)
+        generated_sql = ""
+        if constraint.materialize:
+            generated_sql = generated.install_sql(
+                model,
+                queryset,
+                generated.find_generated_columns(constraint, model, queryset),
+                connection,
+            )
+
+        # Install functions, compiled for the strategy decided above
+        function = constraint._function_sql(
+            model, error=error, connection=connection, strategy=strategy
+        )
+        # Install trigger
+        trigger = create_trigger_sql(
+            schema_editor.connection,
+            trigger_name,
+            "INSERT OR UPDATE",
+            table,
+            deferrable,
+            function_name,
+        ) + constraint._firing_trigger_sql(connection, trigger_name, table)
+        # Install triggers re-checking the rows referencing updated rows of
+        # the tables read via. joins
+        for dep_table, path, columns in constraint._get_dependencies(
+            model, queryset
+        ):
+            dep_function_name, dep_trigger_name = constraint._generate_names(
+                table + ":" + path
+            )
+            trigger += create_trigger_sql(
+                schema_editor.connection,
+                dep_trigger_name,
+                "UPDATE OF "
+                + ", ".join('"{}"'.format(column) for column in columns),
+                dep_table,
+                deferrable,
+                dep_function_name,
+            ) + constraint._firing_trigger_sql(
+                connection, dep_trigger_name, dep_table
+            )
+        # Install triggers re-checking the groups of deleted rows
+        for name, del_table, events, _, _ in constraint._get_delete_checks(
+            model, queryset, schema_editor.connection
+        ):
+            del_function_name, del_trigger_name = constraint._generate_names(
+                name
+            )
+            trigger += create_trigger_sql(
+                schema_editor.connection,
+                del_trigger_name,
+                events,
+                del_table,
+                deferrable,
+                del_function_name,
+            ) + constraint._firing_trigger_sql(
+                connection, del_trigger_name, del_table
+            )
+        # Without params, as the SQL may contain literal '%' characters
+        return schema_editor.execute(
+            generated_sql + function + trigger + record, params=None
+        )
+
+    def remove_trigger(self, constraint, schema_editor, model):
+        """Remove the triggers, and the functions they call."""
+        table = model._meta.db_table
+        if constraint.name.startswith("dct__"):
+            hashed_name = constraint.name.split("__")[2]
+        else:
+            hashed_name = constraint._hash_name(table)
+        function_name = "__".join(["dct", "func", hashed_name]) + "()"
+        trigger_name = "__".join(["dct", "trig", hashed_name])
+        record = ""
+        strategy = constraint.strategy
+        if constraint.name.startswith("dct__"):
+            # Only triggers are installed under hashed names
+            strategy = "statement"
+        elif strategy == "auto":
+            record = strategies.forget_sql(constraint, model)
+            decision = strategies.recorded_decision(
+                constraint, model, schema_editor.connection
+            )
+            # Without a record of the install, drop whatever it may have
+            # installed, rather than deciding anew
+            strategy = decision.strategy if decision is not None else None
+        check = "ALTER TABLE {} DROP CONSTRAINT {}{};".format(
+            schema_editor.quote_name(table),
+            "IF EXISTS " if strategy is None else "",
+            constraint._check_name(table),
+        )
+        if strategy == "check":
+            return schema_editor.execute(check + record, params=None)
+        # Remove trigger, and the sequence capping shadow mode, if any
+        sql = (
+            drop_trigger_sql(
+                schema_editor.connection,
+                trigger_name,
+                table,
+                if_exists=strategy is None,
+            )
+            + constraint._drop_firing_trigger_sql(trigger_name, table)
+            + "DROP FUNCTION {}{};".format(
+                "IF EXISTS " if strategy is None else "", function_name
+            )
+            + "DROP SEQUENCE IF EXISTS dct__seq__{};".format(hashed_name)
+        )
+        if strategy is None:
+            sql = check + sql
+        # Remove the triggers of the tables read via. joins
+        if not constraint.name.startswith("dct__"):
+            queryset = constraint.get_queryset(
+                model, using=schema_editor.connection.alias
+            )
+            for dep_table, path, _ in constraint._get_dependencies(
+                model, queryset
+            ):
+                dep_function_name, dep_trigger_name = constraint._generate_names(
+                    table + ":" + path
+                )
+                sql += drop_trigger_sql(
+                    schema_editor.connection,
+                    dep_trigger_name,
+                    dep_table,
+                    if_exists=True,
+                )
+                sql += constraint._drop_firing_trigger_sql(
+                    dep_trigger_name, dep_table
+                )
+                sql += "DROP FUNCTION IF EXISTS {};".format(dep_function_name)
+            for name, del_table, _, _, _ in constraint._get_delete_checks(
+                model, queryset, schema_editor.connection
+            ):
+                del_function_name, del_trigger_name = constraint._generate_names(
+                    name
+                )
+                sql += drop_trigger_sql(
+                    schema_editor.connection,
+                    del_trigger_name,
+                    del_table,
+                    if_exists=True,
+                )
+                sql += constraint._drop_firing_trigger_sql(
+                    del_trigger_name, del_table
+                )
+                sql += "DROP FUNCTION IF EXISTS {};".format(del_function_name)
+            if constraint.materialize:
+                sql += generated.remove_sql(
+                    model,
+                    generated.find_generated_columns(
+                        constraint, model, queryset
+                    ),
+                    schema_editor.connection,
+                )
+        return schema_editor.execute(sql + record, params=None)
+
+    def constraint_sql(self, constraint, model, schema_editor):
+        """Generate the SQL declaring constraint within CREATE TABLE."""
+        # The triggers are installed by create_sql, once the table exists
+        return ""
+
+
+BACKENDS = {"postgresql": PostgreSQLBackend(), "sqlite": sqlite.SQLiteBackend()}
+
+
+def get_backend(connection):
+    """Find the backend installing constraints upon connection.
+
+    Vendors without a backend of their own use the PostgreSQL backend.
+    """
+    return BACKENDS.get(connection.vendor, BACKENDS["postgresql"])
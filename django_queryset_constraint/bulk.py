@@ -0,0 +1,136 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.transaction import TransactionManagementError
+from django.db.utils import IntegrityError
+
+from django_queryset_constraint.checkpoint import (
+    constraint_checkpoint,
+    get_trigger_names,
+    resolve_constraints,
+)
+from django_queryset_constraint.constraints import BULK_LOAD_SETTING
+from django_queryset_constraint.exceptions import QuerysetConstraintViolation
+
+
+@contextmanager
+def bulk_load(constraints=None, using=DEFAULT_DB_ALIAS):
+    """Bypass per-row constraint checks, checking once per constraint instead.
+
+    Runs the block in a transaction, wherein the triggers of the given
+    constraints return immediately. Before the transaction commits, each of
+    the constraints is checked once using its full queryset, thus the
+    invariants are still verified, at the cost of a single set-based query
+    rather than one query per row written.
+
+    As the triggers stay bypassed until commit, the block must be the
+    outermost atomic block. Constraints referring to the trigger's NEW/OLD row
+    cannot be checked set-based and are thus never bypassed, neither are
+    constraints in shadow mode, which never raise.
+
+    Args:
+        constraints (list of QuerysetConstraint or str, optional):
+            Constraints, or constraint names, to bypass. Defaults to all
+            installed QuerysetConstraints.
+        using (str, optional):
+            Database alias to load into.
+
+    Raises:
+        QuerysetConstraintViolation: On exit, if any of the constraints are
+            violated.
+    """
+    if connections[using].in_atomic_block:
+        raise TransactionManagementError(
+            "bulk_load() must be the outermost atomic block."
+        )
+    pairs = [
+        (model, constraint)
+        for model, constraint in resolve_constraints(constraints)
+        if constraint.mode == "enforce"
+        and not constraint._uses_trigger_row(constraint.get_queryset(model))
+    ]
+    trigger_names = [
+        constraint._generate_names(model._meta.db_table)[1]
+        for model, constraint in pairs
+    ]
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config(%s, %s, true);",
+                [BULK_LOAD_SETTING, " ".join(trigger_names)],
+            )
+        yield
+        for model, constraint in pairs:
+            if constraint.get_queryset(model, using=using).exists():
+                raise QuerysetConstraintViolation(
+                    "Invariant broken: " + constraint.name,
+                    constraint_name=constraint.name,
+                    table=model._meta.db_table,
+                )
+
+
+def bulk_create_isolating(model, objs, batch_size=1000, using=DEFAULT_DB_ALIAS):
+    """Create objs in batches, isolating the rows violating constraints.
+
+    Each batch is created in a savepoint, and checked before releasing it.
+    Failing batches are rolled back and bisected, until the failing rows are
+    isolated, such that all other rows are created. Rows are only isolated
+    if they fail by themselves, thus rows violating a grouped constraint
+    along with rows created before them are the ones isolated.
+
+    Runs in a transaction, committed on return if this is the outermost
+    atomic block.
+
+    Args:
+        model (Model):
+            The model to create rows of.
+        objs (list of Model):
+            The rows to create.
+        batch_size (int, optional):
+            Number of rows to create at a time.
+        using (str, optional):
+            Database alias to create the rows in.
+
+    Returns:
+        list of tuple: The rows which were not created, along with their
+            :code:`IntegrityError`, a :code:`QuerysetConstraintViolation` if
+            the row violates a QuerysetConstraint.
+    """
+    if batch_size < 1:
+        raise ValueError("'batch_size' should be a positive integer")
+    manager = model._base_manager.using(using)
+    # Rows of failed batches keep the primary keys assigned to them
+    assigned = {id(obj) for obj in objs if obj.pk is None}
+    failed = []
+    # Only the triggers of model's table fire, resolved once for all batches
+    trigger_names = get_trigger_names(
+        using=using, tables=[model._meta.db_table]
+    )
+
+    def create(batch):
+        try:
+            with transaction.atomic(using=using):
+                manager.bulk_create(batch)
+                constraint_checkpoint(using=using, trigger_names=trigger_names)
+        except IntegrityError as exc:
+            if len(batch) > 1:
+                middle = len(batch) // 2
+                create(batch[:middle])
+                create(batch[middle:])
+            else:
+                failed.append(
+                    (
+                        batch[0],
+                        QuerysetConstraintViolation.from_error(exc) or exc,
+                    )
+                )
+
+    with transaction.atomic(using=using):
+        for start in range(0, len(objs), batch_size):
+            create(objs[start : start + batch_size])
+    for obj, _ in failed:
+        if id(obj) in assigned:
+            obj.pk = None
+        obj._state.adding = True
+        obj._state.db = None
+    return failed
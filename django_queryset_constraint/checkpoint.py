@@ -0,0 +1,116 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from django_queryset_constraint.constraints import get_queryset_constraints
+
+
+def resolve_constraints(constraints=None):
+    """Resolve constraints to (model, constraint) pairs.
+
+    Args:
+        constraints (list of QuerysetConstraint or str, optional):
+            Constraints, or constraint names, to resolve. Defaults to all
+            installed QuerysetConstraints.
+    """
+    return [
+        (model, constraint)
+        for model, constraint in get_queryset_constraints()
+        if constraints is None
+        or constraint.name in constraints
+        or any(constraint is other for other in constraints)
+    ]
+
+
+def get_trigger_names(constraints=None, using=DEFAULT_DB_ALIAS, tables=None):
+    """Resolve constraints to the names of their constraint triggers.
+
+    These are the triggers of the constraints' own tables, of the tables
+    read via. joins, and those re-checking the groups of deleted rows, which
+    are installed on the database using. Constraints
+    installed as CHECK constraints have no triggers, nor do databases other
+    than PostgreSQL have deferred ones. See :code:`resolve_constraints` for
+    the constraints.
+
+    Args:
+        tables (list of str, optional):
+            Only list the triggers installed upon these tables, e.g. those
+            fired by writing to them. Defaults to all tables.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return []
+    names = [
+        name
+        for model, constraint in resolve_constraints(constraints)
+        for name in constraint._get_trigger_names(model, connection)
+    ]
+    if not names:
+        return []
+    sql = (
+        "SELECT DISTINCT t.tgname FROM pg_trigger t "
+        "JOIN pg_class c ON c.oid = t.tgrelid WHERE t.tgname = ANY(%s)"
+    )
+    params = [names]
+    if tables is not None:
+        sql += " AND c.relname = ANY(%s)"
+        params.append(list(tables))
+    with connection.cursor() as cursor:
+        cursor.execute(sql + ";", params)
+        installed = {row[0] for row in cursor.fetchall()}
+    return [name for name in names if name in installed]
+
+
+class constraint_checkpoint:
+    """Run the pending deferred constraint checks now, rather than at commit.
+
+    PostgreSQL queues a deferred trigger event for every row written, which
+    are only processed at commit. Making checkpoints in long transactions
+    drains the queue, bounding its memory usage, and surfaces violations as
+    soon as possible. Violations raise :code:`IntegrityError` at the
+    checkpoint.
+
+    Can be called as a function, making a single checkpoint, or used as a
+    context manager, making a checkpoint on entry and on successful exit::
+
+        with transaction.atomic():
+            for batch in batches:
+                with constraint_checkpoint():
+                    Model.objects.bulk_create(batch)
+    """
+
+    def __init__(
+        self, constraints=None, using=DEFAULT_DB_ALIAS, trigger_names=None
+    ):
+        """Make a checkpoint.
+
+        Args:
+            constraints (list of QuerysetConstraint or str, optional):
+                Constraints, or constraint names, to check. Defaults to all
+                installed QuerysetConstraints.
+            using (str, optional):
+                Database alias of the transaction.
+            trigger_names (list of str, optional):
+                Names of the triggers to check, as resolved by
+                :code:`get_trigger_names`, rather than resolving those of
+                constraints, e.g. when making many checkpoints.
+        """
+        if trigger_names is None:
+            trigger_names = get_trigger_names(constraints, using)
+        self.trigger_names = trigger_names
+        self.using = using
+        self.checkpoint()
+
+    def checkpoint(self):
+        if not self.trigger_names:
+            return
+        names = ", ".join(self.trigger_names)
+        with connections[self.using].cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS {} IMMEDIATE;".format(names))
+            cursor.execute("SET CONSTRAINTS {} DEFERRED;".format(names))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # The transaction is likely aborted if an exception was raised
+        if exc_type is None:
+            self.checkpoint()
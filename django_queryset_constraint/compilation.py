@@ -0,0 +1,102 @@
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from django_queryset_constraint import constraints, strategies
+
+
+def _initialize(using=None, settings_dict=None):
+    # Spawned, rather than forked, workers start without Django configured
+    if not apps.ready:
+        django.setup()
+    # Connect as the caller does, e.g. to its test database
+    if settings_dict is not None:
+        connections.databases[using] = settings_dict
+        connections[using].settings_dict = settings_dict
+
+
+def _compile(app_label, model_name, constraint, error, using):
+    """Compile the trigger functions of constraint, runs in a worker."""
+    model = apps.get_model(app_label, model_name)
+    constraint = pickle.loads(constraint)
+    connection = connections[using]
+    try:
+        strategy = strategies.resolve_strategy(constraint, model, connection)
+        key, partition_columns = constraint._function_sql_key(
+            model, error, connection, strategy
+        )
+        sql = constraint._compile_function_sql(
+            model, error, connection, partition_columns, strategy
+        )
+    finally:
+        # Workers exit without closing their connections
+        connection.close()
+    return key, sql
+
+
+def compile_constraints(
+    model_constraints, using=DEFAULT_DB_ALIAS, processes=None
+):
+    """Compile the trigger functions of many constraints on a process pool.
+
+    The compiled SQL is stored in the compilation cache, such that schema
+    editors installing the constraints afterwards need not compile them.
+    Constraints are sent to the workers pickled, and their models looked up
+    by label in the current registry. Models, e.g. historical models of a
+    migration's state, whose columns differ from their current counterparts
+    are skipped, and left to be compiled by the schema editor.
+
+    Workers are spawned, rather than forked, thus share no connections with
+    the calling process, which keeps its connections open.
+
+    Args:
+        model_constraints (list of tuple):
+            The models and QuerysetConstraints to compile.
+        using (str, optional):
+            Database alias to compile for.
+        processes (int, optional):
+            Number of worker processes, defaults to the number of CPUs.
+
+    Returns:
+        int: The number of compiled constraints.
+    """
+    connection = connections[using]
+    # Pickled upfront, as pickling evaluates any querysets nested within
+    # expressions, which must not happen over the connections of the
+    # executor's threads.
+    tasks = []
+    for model, constraint in model_constraints:
+        try:
+            current = apps.get_model(model._meta.label)
+        except LookupError:
+            # Since deleted, left to be compiled by the schema editor
+            continue
+        if constraint._get_field_signature(
+            model, connection
+        ) != constraint._get_field_signature(current, connection):
+            continue
+        tasks.append(
+            (
+                model._meta.app_label,
+                model._meta.model_name,
+                pickle.dumps(constraint),
+                None,
+                using,
+            )
+        )
+    if not tasks:
+        return 0
+    with ProcessPoolExecutor(
+        processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_initialize,
+        initargs=(using, connection.settings_dict),
+    ) as executor:
+        results = list(executor.map(_compile, *zip(*tasks)))
+    with constraints._function_sql_lock:
+        constraints._function_sql_cache.update(results)
+    return len(results)
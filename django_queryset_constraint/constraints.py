@@ -1,19 +1,227 @@
+import copy
 import hashlib
+import re
+import threading
 
-from django.db import connection
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import ForeignObject
 from django.db.models.constraints import BaseConstraint
+from django.db.models.expressions import Col, RawSQL, Ref, Subquery
+from django.db.models.fields.reverse_related import ForeignObjectRel
+from django.db.models.sql.constants import LOUTER
+from django.db.models.sql.datastructures import Join
+from django.db.models.sql.query import Query
+from django.db.models.sql.where import WhereNode
+from django.utils.module_loading import import_string
 
+from django_queryset_constraint import generated, strategies
+from django_queryset_constraint.backends import get_backend
+from django_queryset_constraint.partitions import (
+    get_partition_columns,
+    is_partitioned,
+)
+from django_queryset_constraint.predicates import compile_predicate
 from django_queryset_constraint.utils import M
 
+# Setting listing the triggers to bypass during bulk loads, see bulk_load()
+BULK_LOAD_SETTING = "dqc.bulk_load"
+# Compiled trigger functions, see QuerysetConstraint._function_sql
+_function_sql_cache = {}
+_function_sql_lock = threading.Lock()
+# Unlogged table recording the groups checked by the running transactions
+CHECKED_TABLE = "dct__checked"
+# Setting counting the write statements of the transaction, and the function
+# of the statement triggers incrementing it, see _dedupe_sql
+FIRING_SETTING = "dqc.firing"
+FIRING_FUNCTION = "dct__next_firing()"
+# Unlogged table recording the checks of constraints in shadow mode
+SHADOW_LOG_TABLE = "dct__shadow_log"
+# Hint of the violations raised by the triggers
+VIOLATION_HINT = (
+    "The groups of rows with the keys in DETAIL violate the constraint, the "
+    "audit_constraints command lists them."
+)
+# Lookups upon aggregates, which cannot be matched by deleting rows
+DELETE_SAFE_LOOKUPS = {
+    "Count": ("gt", "gte"),
+    "Max": ("gt", "gte"),
+    "Min": ("lt", "lte"),
+}
+# Maximum number of keys of violating groups attached to violations
+MAX_VIOLATION_KEYS = 100
+# Table queueing the keys to check for constraints in async mode
+QUEUE_TABLE = "dct__queue"
+MODES = ("enforce", "shadow", "async")
+CONCURRENCY = (None, "advisory_lock")
+STRATEGIES = ("statement", "row", "check", "auto")
+
+
+def _quote(value):
+    """Quote value as an SQL string literal."""
+    return "'{}'".format(value.replace("'", "''"))
+
+
+def _iter_expressions(node):
+    """Walk an expression or where-node tree, yielding every node."""
+    yield node
+    if hasattr(node, "children"):
+        children = node.children
+    elif hasattr(node, "get_source_expressions"):
+        children = node.get_source_expressions()
+    else:
+        children = []
+    for child in children:
+        yield from _iter_expressions(child)
+
+
+def _reads_other_rows(query):
+    """Check whether query filters rows by the presence of other rows.
+
+    That is, whether it contains subqueries or combinators, whose results
+    may change as rows are deleted.
+    """
+    if query.combinator:
+        return True
+    for node in _iter_expressions(query.where):
+        if isinstance(node, (Subquery, Query)):
+            return True
+    return any(
+        isinstance(node, (Subquery, Query))
+        for annotation in query.annotations.values()
+        for node in _iter_expressions(annotation)
+    )
+
+
+def _deletes_match_aggregates(node, negated=False):
+    """Check whether deleting rows may match node's filters of aggregates.
+
+    Filters matching groups with too many rows, too large maxima or too
+    small minima only turn false as rows are removed from a group, any other
+    filter of an aggregate may turn true.
+    """
+    if isinstance(node, WhereNode):
+        negated = negated != node.negated
+        return any(
+            _deletes_match_aggregates(child, negated) for child in node.children
+        )
+    lhs = getattr(node, "lhs", None)
+    if isinstance(lhs, Ref):
+        lhs = lhs.source
+    if not getattr(lhs, "contains_aggregate", False):
+        return False
+    safe_lookups = DELETE_SAFE_LOOKUPS.get(type(lhs).__name__, ())
+    return negated or node.lookup_name not in safe_lookups
+
 
 class QuerysetConstraint(BaseConstraint):
-    def __init__(self, queryset, name):
+    def __init__(
+        self,
+        queryset,
+        name,
+        mode="enforce",
+        sample_rate=1.0,
+        max_rows=None,
+        concurrency=None,
+        check_deletes=False,
+        strategy="statement",
+        materialize=False,
+    ):
+        """Declare a constraint forbidding the rows returned by queryset.
+
+        Args:
+            queryset (M, callable or str):
+                The queryset returning the rows violating the constraint.
+                Either an M object, or a callable returning one, or the
+                dotted path of either. Callables and paths are evaluated on
+                first use, rather than as the model is imported.
+            name (str):
+                Name of the constraint.
+            mode (str, optional):
+                Either 'enforce', raising on violations, 'shadow', merely
+                recording checks and violations in the unlogged
+                :code:`dct__shadow_log` table, or 'async', queueing the
+                written keys in the :code:`dct__queue` table, to be checked
+                by the :code:`process_constraint_queue` command.
+            sample_rate (float, optional):
+                Fraction of the writes to check in shadow mode.
+            max_rows (int, optional):
+                Maximum number of checks to record in shadow mode.
+            concurrency (str, optional):
+                Set to 'advisory_lock' to serialize the checks of concurrent
+                transactions writing to the same group, by taking a
+                transaction-level advisory lock on the group's key.
+            check_deletes (bool, optional):
+                Whether to also check the constraint as rows are deleted,
+                if deleting rows may violate it, e.g. if it requires a
+                minimum number of rows per group. See
+                :code:`_get_delete_checks`.
+            strategy (str, optional):
+                How the constraint is enforced, either 'statement', checking
+                the entire queryset once per statement, 'row', checking the
+                group of each written row, 'check', installing a native CHECK
+                constraint, for row-local constraints only, or 'auto',
+                choosing the cheapest as the constraint is installed. See
+                :code:`strategies.decide`.
+            materialize (bool, optional):
+                Whether to materialize the row-local annotations filtered on
+                as indexed generated columns, such that the check probes an
+                index rather than evaluating the annotations of every row.
+                See :code:`generated.find_generated_columns`.
+        """
         super().__init__(name)
-        if not isinstance(queryset, M):
-            raise ValueError("'queryset' should be an M object")
-        self.m_object = queryset
+        if not isinstance(queryset, (M, str)) and not callable(queryset):
+            raise ValueError(
+                "'queryset' should be an M object, a callable returning one "
+                "or a dotted path"
+            )
+        if mode not in MODES:
+            raise ValueError("'mode' should be one of " + ", ".join(MODES))
+        if not 0 < sample_rate <= 1:
+            raise ValueError("'sample_rate' should be within (0, 1]")
+        if max_rows is not None and max_rows < 1:
+            raise ValueError("'max_rows' should be a positive integer")
+        if concurrency not in CONCURRENCY:
+            raise ValueError("'concurrency' should be None or 'advisory_lock'")
+        if strategy not in STRATEGIES:
+            raise ValueError(
+                "'strategy' should be one of " + ", ".join(STRATEGIES)
+            )
+        if strategy == "check" and (mode != "enforce" or concurrency):
+            raise ValueError(
+                "strategy='check' only supports 'enforce' mode, without "
+                "'concurrency'"
+            )
+        self._queryset = queryset
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.max_rows = max_rows
+        self.concurrency = concurrency
+        self.check_deletes = check_deletes
+        self.strategy = strategy
+        self.materialize = materialize
+        self._finalized_m_object = None
+        self._predicates = {}
 
-    def _generate_names(self, table):
+    @property
+    def m_object(self):
+        """The M object recording the queryset, evaluated on first use."""
+        if not isinstance(self._queryset, M):
+            queryset = self._queryset
+            if isinstance(queryset, str):
+                queryset = import_string(queryset)
+            if not isinstance(queryset, M):
+                queryset = queryset()
+            if not isinstance(queryset, M):
+                raise ValueError(
+                    "'queryset' of constraint '{}' should evaluate to an M "
+                    "object".format(self.name)
+                )
+            self._queryset = queryset
+        return self._queryset
+
+    def _hash_name(self, table):
         # We cannot include trigger_name + table as it may be too long.
         # Thus we need to truncate. Postgres limits us to 63 characters.
         # We know our prefix is 13 characters, thus we need to limit to 50.
@@ -21,77 +229,963 @@ class QuerysetConstraint(BaseConstraint):
         hasher = hashlib.sha256()
         hasher.update(self.name.encode("utf8"))
         hasher.update(table.encode("utf8"))
-        hashed_name = hasher.hexdigest()[3 : 40 + 3]
+        return hasher.hexdigest()[3 : 40 + 3]
+
+    def _generate_names(self, table):
+        hashed_name = self._hash_name(table)
         # Prepare function and trigger name
         function_name = "__".join(["dct", "func", hashed_name]) + "()"
         trigger_name = "__".join(["dct", "trig", hashed_name])
         return function_name, trigger_name
 
-    def _install_trigger(self, schema_editor, model, defer=True, error=None):
+    def _get_trigger_names(self, model, connection):
+        """List the names of the constraint triggers of the constraint.
+
+        That is, the trigger of the model's table, those of the tables read
+        via. joins, and those re-checking the groups of deleted rows, whether
+        installed or not.
+        """
         table = model._meta.db_table
-        function_name, trigger_name = self._generate_names(table)
+        names = [self._generate_names(table)[1]]
+        queryset = self.get_queryset(model, using=connection.alias)
+        for _, path, _ in self._get_dependencies(model, queryset):
+            names.append(self._generate_names(table + ":" + path)[1])
+        for name, _, _, _, _ in self._get_delete_checks(
+            model, queryset, connection
+        ):
+            names.append(self._generate_names(name)[1])
+        return names
+
+    def _check_name(self, table):
+        return "__".join(["dct", "check", self._hash_name(table)])
+
+    def get_queryset(self, model, using=None):
+        """Reconstruct the constraint queryset against the given model."""
+        # M objects recorded on the model (rather than loaded from a
+        # migration) must be finalized before they can be replayed.
+        if self._finalized_m_object is None:
+            if self.m_object.finalized:
+                self._finalized_m_object = self.m_object
+            else:
+                self._finalized_m_object = copy.deepcopy(self.m_object)
         app_label = model._meta.app_label
         model_name = model._meta.object_name
+        queryset = self._finalized_m_object.construct_queryset(
+            app_label, model_name
+        )
+        if using is not None:
+            queryset = queryset.using(using)
+        return queryset
 
-        # No error message - Default to 'Invariant broken'
-        if error is None:
-            error = "Invariant broken: " + self.name
+    def iter_violations(self, model, using=None, chunk_size=2000):
+        """Stream the rows violating the constraint.
 
-        # Run through all operations to generate our queryset
-        result = self.m_object.construct_queryset(app_label, model_name)
-        # Generate query from result
-        cursor = connection.cursor()
-        sql, sql_params = result.query.get_compiler(using=result.db).as_sql()
-        query = cursor.mogrify(sql, sql_params)
-
-        # Install function
-        function = """
-            CREATE FUNCTION {}
-            RETURNS TRIGGER
-            AS $$
-            BEGIN
+        Rows are fetched through a server-side cursor in batches of
+        chunk_size, such that memory usage is bounded regardless of the
+        number of violations.
+
+        Args:
+            model (Model):
+                The model upon which the constraint is installed.
+            using (str, optional):
+                Database alias to query.
+            chunk_size (int, optional):
+                Number of rows to fetch from the cursor at a time.
+
+        Yields:
+            dict: Each violating row, as returned by :code:`values()`.
+        """
+        queryset = self.get_queryset(model, using=using)
+        if queryset._fields is None:
+            queryset = queryset.values()
+        yield from queryset.iterator(chunk_size=chunk_size)
+
+    def get_predicate(self, model):
+        """Compile the constraint to a Python predicate, if row-local.
+
+        See :code:`django_queryset_constraint.predicates.compile_predicate`.
+
+        Returns:
+            Predicate: The compiled predicate, or :code:`None` if the
+                constraint cannot be evaluated row by row.
+        """
+        label = model._meta.label
+        if label not in self._predicates:
+            try:
+                predicate = compile_predicate(model, self.m_object)
+            except ValueError:
+                predicate = None
+            self._predicates[label] = predicate
+        return self._predicates[label]
+
+    def _get_key_field(self, model, queryset):
+        """Find the field which partitions the rows checked by queryset.
+
+        Every violation reported by the queryset is contained within the rows
+        sharing a value of this field. For plain querysets this is the primary
+        key, while for grouped querysets (:code:`values().annotate()`) it is
+        the first grouping field, as all rows of a group share its value.
+
+        Returns :code:`None` if no such field can be determined, in which case
+        the queryset can only be evaluated as a whole.
+        """
+        query = queryset.query
+        if not query.can_filter() or query.combinator:
+            return None
+        if query.group_by is None or not query.values_select:
+            return model._meta.pk
+        try:
+            field = model._meta.get_field(query.values_select[0])
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.many_to_many:
+            return None
+        return field
+
+    def _get_referenced_fields(self, model, queryset):
+        """Find the names of the fields on model read by queryset."""
+        query = queryset.query
+        names = set(query.values_select)
+        expressions = [query.where] + list(query.annotations.values())
+        for expression in expressions:
+            for node in _iter_expressions(expression):
+                if not isinstance(node, Col):
+                    continue
+                if node.alias == query.base_table:
+                    names.add(node.target.name)
+                    continue
+                # Columns of joined tables, e.g. topping__name, are read via.
+                # the relation of model the join starts from
+                join = query.alias_map.get(node.alias)
+                while (
+                    isinstance(join, Join)
+                    and join.parent_alias != query.base_table
+                ):
+                    join = query.alias_map.get(join.parent_alias)
+                if isinstance(join, Join):
+                    names.add(join.join_field.name)
+        return names
+
+    def _uses_trigger_row(self, queryset):
+        """Check whether queryset refers to the trigger's NEW or OLD row.
+
+        Such querysets can only be evaluated from within the trigger.
+        """
+        sql, _ = queryset.query.sql_with_params()
+        return re.search(r"\b(NEW|OLD)\.", sql) is not None
+
+    def _overlay_sql(self, model, instance, connection):
+        """Generate a WITH clause shadowing model's table as if saving instance.
+
+        Within the query following the clause, the table holds its rows other
+        than instance, along with the instance's field values, which are
+        neither written nor checked against the table's own constraints.
+
+        Returns:
+            tuple: The SQL of the clause, and its parameters.
+        """
+        table = connection.ops.quote_name(model._meta.db_table)
+        fields = model._meta.local_concrete_fields
+        source = table
+        if connection.vendor == "sqlite":
+            # Unqualified, the table would refer to the clause itself
+            source = "main." + table
+        sql = "WITH {} AS (SELECT {} FROM {}".format(
+            table,
+            ", ".join(
+                connection.ops.quote_name(field.column) for field in fields
+            ),
+            source,
+        )
+        params = []
+        if instance.pk is not None:
+            pk = model._meta.pk
+            sql += " WHERE {} <> %s".format(
+                connection.ops.quote_name(pk.column)
+            )
+            params.append(pk.get_db_prep_save(instance.pk, connection))
+        sql += " UNION ALL SELECT {}) ".format(
+            ", ".join(
+                "CAST(%s AS {})".format(field.cast_db_type(connection))
+                for field in fields
+            )
+        )
+        params.extend(
+            field.get_db_prep_save(getattr(instance, field.attname), connection)
+            for field in fields
+        )
+        return sql, params
+
+    def validate(self, model, instance, exclude=None, using=DEFAULT_DB_ALIAS):
+        """Check whether saving instance would violate the constraint.
+
+        Nothing is written. The constraint queryset is evaluated against the
+        table as it would be once instance is saved, see _overlay_sql, scoped
+        to the rows sharing the instance's key (see :code:`_get_key_field`),
+        rather than the entire table. This is a cheap pre-check only, the
+        trigger remains responsible for enforcing the constraint.
+
+        Args:
+            model (Model):
+                The model upon which the constraint is installed.
+            instance (Model):
+                The (possibly unsaved) instance to validate.
+            exclude (list of str, optional):
+                Field names to skip validation for. If the constraint reads
+                any of these fields, or relations of these, it is not
+                validated.
+            using (str, optional):
+                Database alias to validate against.
+
+        Raises:
+            ValidationError: If the constraint would be violated.
+        """
+        # Shadow mode constraints only ever record violations
+        if self.mode == "shadow":
+            return
+        queryset = self.get_queryset(model, using=using)
+        if exclude and self._get_referenced_fields(
+            model, queryset
+        ).intersection(exclude):
+            return
+        if self._uses_trigger_row(queryset):
+            return
+
+        connection = connections[using]
+        key = self._get_key_field(model, queryset)
+        if key is not None:
+            queryset = queryset.filter(
+                **{key.attname: getattr(instance, key.attname)}
+            )
+        sql, params = queryset.query.get_compiler(using=using).as_sql()
+        overlay_sql, overlay_params = self._overlay_sql(
+            model, instance, connection
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                overlay_sql + "SELECT EXISTS ({})".format(sql),
+                overlay_params + list(params),
+            )
+            violated = cursor.fetchone()[0]
+        if violated:
+            raise ValidationError(
+                "Invariant broken: " + self.name, code="invariant"
+            )
+
+    def _compile_query(self, queryset, connection):
+        """Render queryset as SQL for the trigger function."""
+        return get_backend(connection).compile_query(queryset, connection)
+
+    def _get_dependencies(self, model, queryset):
+        """Find the other tables read by queryset, via. its joins.
+
+        Only joins following foreign keys from the model, in the outermost
+        query, are considered.
+
+        Returns:
+            list of tuple: The joined table, the lookup path to it from the
+                model, and the columns of the table read by queryset.
+        """
+        query = queryset.query
+        paths = {query.base_table: []}
+        dependencies = []
+        # Joins are created after the joins they depend upon
+        for alias, join in query.alias_map.items():
+            if not isinstance(join, Join) or not query.alias_refcount[alias]:
+                continue
+            field = join.join_field
+            if join.parent_alias not in paths or not isinstance(
+                field, ForeignObject
+            ):
+                continue
+            paths[alias] = paths[join.parent_alias] + [field.name]
+            columns = {column for _, column in join.join_cols}
+            expressions = [query.where] + list(query.annotations.values())
+            for expression in expressions:
+                for node in _iter_expressions(expression):
+                    if isinstance(node, Col) and node.alias == alias:
+                        columns.add(node.target.column)
+            dependencies.append(
+                (join.table_name, "__".join(paths[alias]), sorted(columns))
+            )
+        return dependencies
+
+    def _get_dependency_queryset(self, model, queryset, path, connection):
+        """Restrict queryset to the rows referencing the trigger's NEW row.
+
+        Args:
+            path (str):
+                The lookup path from the model to the table of the trigger.
+
+        Returns:
+            tuple: The restricted queryset, and the SQL selecting the keys
+                of the referencing rows.
+        """
+        field = model._meta.get_field(path.split("__")[0])
+        for name in path.split("__")[1:]:
+            field = field.related_model._meta.get_field(name)
+        target = field.target_field
+        referencing = model._base_manager.filter(
+            **{
+                path
+                + "__"
+                + target.name: RawSQL('NEW."{}"'.format(target.column), ())
+            }
+        )
+        # Rows are matched by key, such that groups are checked in whole
+        key = self._get_key_field(model, queryset)
+        if key is None:
+            return queryset, "SELECT NULL"
+        keys = referencing.values_list(key.attname).distinct()
+        return (
+            queryset.filter(**{key.attname + "__in": keys}),
+            self._compile_query(keys, connection),
+        )
+
+    def _get_row_queryset(self, model, queryset):
+        """Restrict queryset to the group of the trigger's NEW row.
+
+        Only querysets whose violations are confined to the groups written
+        to can be restricted, i.e. those with a key, and without subqueries
+        or combinators, which read other groups.
+
+        Raises:
+            ValueError: If queryset cannot be restricted.
+        """
+        if self._uses_trigger_row(queryset):
+            return queryset
+        key = self._get_key_field(model, queryset)
+        if key is None or _reads_other_rows(queryset.query):
+            raise ValueError(
+                "Constraint '{}' cannot be checked per group, thus cannot use "
+                "strategy='row'".format(self.name)
+            )
+        return queryset.filter(
+            **{key.attname: RawSQL('NEW."{}"'.format(key.column), ())}
+        )
+
+    def _get_delete_checks(self, model, queryset, connection):
+        """Find the checks to run as rows are deleted, if check_deletes.
+
+        Deleting rows of the model only violates constraints filtering
+        aggregates, e.g. requiring a minimum number of rows per group, in
+        which case the group of the deleted row is checked, or filtering by
+        the presence of other rows, e.g. via. subqueries, in which case the
+        entire queryset is checked. Rows moved to another group are checked
+        as deleted from their previous group.
+
+        Deleting rows of the tables joined via. reverse relations, e.g. when
+        counting them or checking their absence, re-checks the groups of the
+        rows they referenced.
+
+        Returns:
+            list of tuple: The name to generate the function and trigger
+                names from, the table and events to trigger on, the checked
+                queryset, and the SQL selecting the keys to queue.
+        """
+        if not self.check_deletes or self._uses_trigger_row(queryset):
+            return []
+        query = queryset.query
+        reads_other_rows = _reads_other_rows(query)
+        matches_aggregates = _deletes_match_aggregates(query.where)
+        table = model._meta.db_table
+        key = self._get_key_field(model, queryset)
+        checks = []
+        if reads_other_rows or (matches_aggregates and key is None):
+            checks.append(
+                (table + ":delete", table, "DELETE", queryset, "SELECT NULL")
+            )
+        elif matches_aggregates and not key.primary_key:
+            # Groups of the primary key are deleted in whole
+            checks.append(
+                (
+                    table + ":delete",
+                    table,
+                    'DELETE OR UPDATE OF "{}"'.format(key.column),
+                    queryset.filter(
+                        **{
+                            key.attname: RawSQL(
+                                'OLD."{}"'.format(key.column), ()
+                            )
+                        }
+                    ),
+                    'SELECT OLD."{}"'.format(key.column),
+                )
+            )
+        for alias, join in query.alias_map.items():
+            field = getattr(join, "join_field", None)
+            if (
+                join.parent_alias != query.base_table
+                or not query.alias_refcount[alias]
+                or not isinstance(field, ForeignObjectRel)
+            ):
+                continue
+            # Outer joins match the rows lacking related rows, e.g. isnull
+            if not (
+                reads_other_rows
+                or matches_aggregates
+                or join.join_type == LOUTER
+            ):
+                continue
+            column = field.field.column
+            referenced = model._base_manager.filter(
+                **{
+                    field.field.target_field.attname: RawSQL(
+                        'OLD."{}"'.format(column), ()
+                    )
+                }
+            )
+            if key is None:
+                dep_queryset, dep_keys = queryset, "SELECT NULL"
+            else:
+                keys = referenced.values_list(key.attname).distinct()
+                dep_queryset = queryset.filter(**{key.attname + "__in": keys})
+                dep_keys = self._compile_query(keys, connection)
+            checks.append(
+                (
+                    table + ":" + join.table_name + ":delete",
+                    join.table_name,
+                    'DELETE OR UPDATE OF "{}"'.format(column),
+                    dep_queryset,
+                    dep_keys,
+                )
+            )
+        return checks
+
+    def _prune_partitions(self, model, queryset, partition_columns):
+        """Restrict queryset to the partition of the trigger's NEW row.
+
+        This is only possible if the queryset is grouped by the partition
+        key, as only then violations never span partitions. Restricting the
+        query allows the planner to prune the other partitions.
+        """
+        query = queryset.query
+        columns = partition_columns
+        if not columns or query.group_by is None or not query.values_select:
+            return queryset
+        # Lookups spanning relations, e.g. "pizza__name", group by the
+        # columns of other tables
+        fields = {
+            field.column: field
+            for field in model._meta.local_concrete_fields
+            if field.name in query.values_select
+            or field.attname in query.values_select
+        }
+        if not set(columns).issubset(fields):
+            return queryset
+        return queryset.filter(
+            **{
+                fields[column].attname: RawSQL('NEW."{}"'.format(column), ())
+                for column in columns
+            }
+        )
+
+    def _shadow_check_sql(self, model, query):
+        """Generate the function body recording, rather than raising."""
+        table = model._meta.db_table
+        # Cap the number of recorded checks via. a sequence, as counting the
+        # rows of the log would itself be a per-row overhead.
+        if self.max_rows is None:
+            cap = ""
+        else:
+            cap = """
+                    IF nextval('dct__seq__{}') > {} THEN
+                        RETURN NULL;
+                    END IF;""".format(
+                self._hash_name(table), self.max_rows
+            )
+        return """
+                IF random() < {} THEN{}
+                    dct_started := clock_timestamp();
+                    dct_violated := EXISTS (
+                        {}
+                    );
+                    INSERT INTO {} (
+                        constraint_name, table_name, violated, duration
+                    ) VALUES (
+                        {}, {}, dct_violated, clock_timestamp() - dct_started
+                    );
+                END IF;""".format(
+            self.sample_rate,
+            cap,
+            query,
+            SHADOW_LOG_TABLE,
+            _quote(self.name),
+            _quote(table),
+        )
+
+    def _async_check_sql(self, model, keys):
+        """Generate the function body queueing the keys selected by keys."""
+        return """
+                INSERT INTO {} (constraint_name, table_name, key)
+                SELECT {}, {}, dct_keys.dct_key::text
+                FROM ({}) AS dct_keys(dct_key);""".format(
+            QUEUE_TABLE, _quote(self.name), _quote(model._meta.db_table), keys
+        )
+
+    def _check_sql(self, model, queryset, keys, error, connection):
+        """Generate the function body checking queryset, as per the mode.
+
+        Args:
+            keys (str):
+                Query selecting the keys to queue in async mode.
+        """
+        if self.mode == "async":
+            return self._async_check_sql(model, keys)
+        query = self._compile_query(queryset, connection)
+        if self.mode == "shadow":
+            return self._shadow_check_sql(model, query)
+        # The keys of the violating groups are attached as JSON, and parsed
+        # into QuerysetConstraintViolation by raise_violations()
+        key = self._get_key_field(model, queryset)
+        values = queryset.query.values_select
+        if key is None or (values and key.name not in values):
+            violating_keys = "NULL"
+        else:
+            violating_keys = """(
+                                SELECT json_agg(dct_keys."{0}")
+                                FROM (
+                                    SELECT dct_violations."{0}"
+                                    FROM ({1}) AS dct_violations
+                                    LIMIT {2}
+                                ) AS dct_keys
+                            )""".format(
+                key.column, query, MAX_VIOLATION_KEYS
+            )
+        return """
                 IF EXISTS (
                     {}
                 ) THEN
-                    RAISE check_violation USING MESSAGE = '{}';
+                    RAISE check_violation USING
+                        MESSAGE = {},
+                        DETAIL = json_build_object(
+                            'constraint', {},
+                            'table', {},
+                            'column', {},
+                            'keys', {}
+                        )::text,
+                        HINT = {};
+                END IF;""".format(
+            query,
+            _quote(error),
+            _quote(self.name),
+            _quote(model._meta.db_table),
+            "NULL" if key is None else _quote(key.column),
+            violating_keys,
+            _quote(VIOLATION_HINT),
+        )
+
+    def _lock_sql(self, model, key):
+        """Generate the statement locking the group of the written row.
+
+        Under READ COMMITTED every statement of the function takes a new
+        snapshot, thus once the lock is acquired, the check sees the rows
+        committed by the previous holder.
+        """
+        table = model._meta.db_table
+        # The constraint's half of the lock key, as a signed 32 bit integer
+        constraint_key = int(self._hash_name(table)[:8], 16) - 2 ** 31
+        # Without a key, all writers are serialized
+        if key is None:
+            key_sql = "0"
+        else:
+            key_sql = 'hashtext(NEW."{}"::text)'.format(key.column)
+        return """
+                PERFORM pg_advisory_xact_lock({}, {});""".format(
+            constraint_key, key_sql
+        )
+
+    def _setup_sql(self, model):
+        """Generate the SQL creating the tables used by the mode."""
+        sql = """
+            CREATE UNLOGGED TABLE IF NOT EXISTS {table} (
+                function_name text NOT NULL,
+                key text NOT NULL,
+                txid bigint NOT NULL,
+                firing bigint NOT NULL,
+                PRIMARY KEY (txid, function_name, key)
+            );
+            CREATE OR REPLACE FUNCTION {function}
+            RETURNS TRIGGER
+            AS $$
+            DECLARE
+                dct_firing text := current_setting('{setting}', true);
+            BEGIN
+                -- Forget the groups checked by finished transactions, of any
+                -- backend, including those which exited. Transactions below
+                -- the snapshot's xmin are finished, and txids are never
+                -- reused. Rows being forgotten by others are skipped, rather
+                -- than waited for.
+                IF coalesce(dct_firing, '') = '' THEN
+                    DELETE FROM {table}
+                    WHERE ctid IN (
+                        SELECT ctid FROM {table}
+                        WHERE txid < txid_snapshot_xmin(txid_current_snapshot())
+                        FOR UPDATE SKIP LOCKED
+                    );
+                    dct_firing := '0';
                 END IF;
+                PERFORM set_config(
+                    '{setting}', (dct_firing::bigint + 1)::text, true
+                );
                 RETURN NULL;
             END
-            $$ LANGUAGE plpgsql;
+            $$ LANGUAGE plpgsql SET search_path FROM CURRENT;
         """.format(
-            function_name, query.decode(), error
-        )
-        # Install trigger
-        trigger = """
-            CREATE CONSTRAINT TRIGGER {}
-            AFTER INSERT OR UPDATE ON {}
-            {}
-            FOR EACH ROW
-                EXECUTE PROCEDURE {};
+            table=CHECKED_TABLE,
+            function=FIRING_FUNCTION,
+            setting=FIRING_SETTING,
+        )
+        if self.mode == "shadow":
+            return (
+                sql
+                + """
+            CREATE UNLOGGED TABLE IF NOT EXISTS {} (
+                id bigserial PRIMARY KEY,
+                constraint_name text NOT NULL,
+                table_name text NOT NULL,
+                checked_at timestamptz NOT NULL DEFAULT now(),
+                violated boolean NOT NULL,
+                duration interval NOT NULL
+            );
+            CREATE SEQUENCE IF NOT EXISTS dct__seq__{};
+            """.format(
+                    SHADOW_LOG_TABLE, self._hash_name(model._meta.db_table)
+                )
+            )
+        if self.mode == "async":
+            return (
+                sql
+                + """
+            CREATE TABLE IF NOT EXISTS {} (
+                id bigserial PRIMARY KEY,
+                constraint_name text NOT NULL,
+                table_name text NOT NULL,
+                key text,
+                queued_at timestamptz NOT NULL DEFAULT now()
+            );
+            """.format(
+                    QUEUE_TABLE
+                )
+            )
+        return sql
+
+    def _wrap_function(self, function_name, trigger_name, body, dedupe=True):
+        """Generate the SQL (re)placing a trigger function running body.
+
+        Args:
+            dedupe (bool, optional):
+                Whether to skip checks already made, see _dedupe_sql.
+        """
+        declare = ""
+        if self.mode == "shadow":
+            declare = """
+            DECLARE
+                dct_started timestamptz;
+                dct_violated boolean;"""
+        # The function is replaced in place, such that switching modes does
+        # not require rebuilding the trigger. The tables it reads are
+        # resolved via. the search path it is created under, not that of the
+        # writer, such that each schema's function checks its own tables.
+        return """
+            CREATE OR REPLACE FUNCTION {}
+            RETURNS TRIGGER
+            AS $${}
+            BEGIN
+                IF position(
+                    '{}' IN current_setting('{}', true)
+                ) > 0 THEN
+                    RETURN NULL;
+                END IF;{}{}
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql SET search_path FROM CURRENT;
         """.format(
-            trigger_name,
-            table,
-            "DEFERRABLE INITIALLY DEFERRED" if defer else "",
             function_name,
+            declare,
+            trigger_name,
+            BULK_LOAD_SETTING,
+            self._dedupe_sql(function_name, body) if dedupe else "",
+            body,
         )
-        return schema_editor.execute(function + trigger)
 
-    def _remove_trigger(self, schema_editor, model):
-        if self.name.startswith("dct__"):
-            hashed_name = self.name.split("__")[2]
-            function_name = "__".join(["dct", "func", hashed_name]) + "()"
-            trigger_name = "__".join(["dct", "trig", hashed_name])
+    def _dedupe_sql(self, function_name, body):
+        """Generate the statements skipping checks already made.
+
+        The checks of a firing, i.e. at the end of a statement, at commit or
+        at :code:`SET CONSTRAINTS ... IMMEDIATE`, all see the same rows, thus
+        the check of each group need only run once per firing, regardless of
+        the number of rows written to it. Groups are identified by the
+        columns of the trigger row read by body, and the checks made are
+        recorded in the unlogged :code:`dct__checked` table, keyed by the
+        transaction, along with the number of write statements it ran so
+        far. The statement triggers of _firing_trigger_sql count these, thus
+        the next statement, and the next firing, checks the group again.
+
+        Returns:
+            str: The statements, empty if body reads the trigger row as a
+                whole, i.e. every row must be checked.
+        """
+        references = re.findall(r'\b(NEW|OLD)\.("[^"]+"|\w+)', body)
+        if len(references) != len(re.findall(r"\b(NEW|OLD)\b", body)):
+            return ""
+        columns = sorted({".".join(reference) for reference in references})
+        key = "ROW({})::text".format(", ".join(columns)) if columns else "''"
+        return """
+                INSERT INTO {table} AS dct_checked
+                    (function_name, key, txid, firing)
+                VALUES ('{function_name}', {key}, txid_current(),
+                    coalesce(
+                        nullif(current_setting('{setting}', true), ''), '0'
+                    )::bigint)
+                ON CONFLICT (txid, function_name, key) DO UPDATE
+                SET firing = EXCLUDED.firing
+                WHERE dct_checked.firing <> EXCLUDED.firing;
+                IF NOT FOUND THEN
+                    RETURN NULL;
+                END IF;""".format(
+            table=CHECKED_TABLE,
+            function_name=function_name,
+            key=key,
+            setting=FIRING_SETTING,
+        )
+
+    def _firing_trigger_sql(self, connection, trigger_name, table):
+        """Generate the SQL creating the trigger counting write statements.
+
+        Statement triggers fire after the row triggers of the statement,
+        thus the firings of the statements of a transaction are told apart,
+        see _dedupe_sql. Statements writing to the partitions of partitioned
+        tables do not fire the triggers of the table, thus the checks of
+        these are never skipped.
+        """
+        if is_partitioned(connection, table):
+            return ""
+        return """
+            CREATE TRIGGER {}
+            AFTER INSERT OR UPDATE OR DELETE ON {}
+            FOR EACH STATEMENT
+                EXECUTE PROCEDURE {};
+        """.format(
+            trigger_name.replace("__trig__", "__stmt__"), table, FIRING_FUNCTION
+        )
+
+    def _drop_firing_trigger_sql(self, trigger_name, table):
+        """Generate the SQL dropping a trigger of _firing_trigger_sql."""
+        return "DROP TRIGGER IF EXISTS {} ON {};".format(
+            trigger_name.replace("__trig__", "__stmt__"), table
+        )
+
+    def _get_digest(self, model):
+        """Digest the definition of the constraint installed upon model."""
+        _, _, kwargs = self.deconstruct()
+        hasher = hashlib.sha256()
+        hasher.update(model._meta.db_table.encode("utf8"))
+        for key, value in sorted(kwargs.items()):
+            if isinstance(value, M):
+                value = value.as_json()
+            hasher.update("{}={!r}".format(key, value).encode("utf8"))
+        return hasher.hexdigest()
+
+    def _get_field_signature(self, model, connection):
+        """Summarize the columns of model, as the compiled SQL depends upon.
+
+        Historical models, e.g. those of a migration's state, differ from
+        their current counterparts in their fields, not their tables.
+        """
+        # Sorted, as migrations add relations after the other fields
+        return tuple(
+            sorted(
+                (
+                    field.column,
+                    field.db_type(connection),
+                    field.null,
+                    field.related_model._meta.db_table
+                    if field.is_relation
+                    else None,
+                )
+                for field in model._meta.concrete_fields
+            )
+        )
+
+    def _get_joined_signature(self, model, connection):
+        """Summarize the tables joined by the constraint's queryset.
+
+        The triggers on, and deduplication of, the joined tables depend upon
+        the fields of their models and whether they are partitioned.
+        """
+        query = self.get_queryset(model, using=connection.alias).query
+        signature = []
+        for alias, join in query.alias_map.items():
+            if not isinstance(join, Join) or not query.alias_refcount[alias]:
+                continue
+            # Both forward and reverse relations point to the joined model,
+            # as of the state of model, e.g. that of a migration
+            related_model = join.join_field.related_model
+            try:
+                related_model = model._meta.apps.get_model(
+                    related_model._meta.label
+                )
+            except LookupError:
+                pass
+            signature.append(
+                (
+                    join.table_name,
+                    is_partitioned(connection, join.table_name),
+                    self._get_field_signature(related_model, connection),
+                )
+            )
+        return tuple(sorted(signature))
+
+    def _function_sql(self, model, error=None, connection=None, strategy=None):
+        """Generate the SQL (re)placing the trigger functions.
+
+        The SQL is cached per constraint definition, the fields of the model
+        and of the joined models, the partitioning of their tables, database
+        vendor and server version, thus installing a constraint into many
+        databases compiles its queryset only once.
+
+        Args:
+            connection (DatabaseWrapper, optional):
+                Connection to compile for, defaults to the default database.
+            strategy (str, optional):
+                The strategy decided upon by the install, resolved if not
+                given, see :code:`strategies.resolve_strategy`.
+        """
+        if connection is None:
+            connection = connections[DEFAULT_DB_ALIAS]
+        if strategy is None:
+            strategy = strategies.resolve_strategy(self, model, connection)
+        key, partition_columns = self._function_sql_key(
+            model, error, connection, strategy
+        )
+        # Concurrent installs of the same constraint wait for one compilation
+        with _function_sql_lock:
+            if key not in _function_sql_cache:
+                _function_sql_cache[key] = self._compile_function_sql(
+                    model, error, connection, partition_columns, strategy
+                )
+            return _function_sql_cache[key]
+
+    def _function_sql_key(self, model, error, connection, strategy):
+        """Generate the key of the SQL in the cache.
+
+        Returns:
+            tuple: The key, and the partition columns of the model's table.
+        """
+        partition_columns = get_partition_columns(
+            connection, model._meta.db_table
+        )
+        key = (
+            self._get_digest(model),
+            self._get_field_signature(model, connection),
+            connection.vendor,
+            getattr(connection, "pg_version", None),
+            tuple(partition_columns),
+            self._get_joined_signature(model, connection),
+            error,
+            strategy,
+        )
+        return key, partition_columns
+
+    def _compile_function_sql(
+        self, model, error, connection, partition_columns, strategy
+    ):
+        table = model._meta.db_table
+        function_name, trigger_name = self._generate_names(table)
+
+        # No error message - Default to 'Invariant broken'
+        if error is None:
+            error = "Invariant broken: " + self.name
+
+        # Run through all operations to generate our queryset
+        queryset = self.get_queryset(model, using=connection.alias)
+        if self.mode == "async" and self._uses_trigger_row(queryset):
+            raise ValueError(
+                "Constraint '{}' refers to the trigger row, thus cannot be "
+                "checked asynchronously".format(self.name)
+            )
+        # Without a key the entire table is checked, as marked by NULL
+        key = self._get_key_field(model, queryset)
+        if key is None:
+            keys = "SELECT NULL"
         else:
-            table = model._meta.db_table
-            function_name, trigger_name = self._generate_names(table)
-        # Remove trigger
-        return schema_editor.execute(
-            "DROP TRIGGER {} ON {};".format(trigger_name, table)
-            + "DROP FUNCTION {};".format(function_name)
+            keys = 'SELECT NEW."{}"'.format(key.column)
+        if strategy == "row":
+            checked = self._get_row_queryset(model, queryset)
+        else:
+            checked = self._prune_partitions(model, queryset, partition_columns)
+        if self.materialize:
+            checked = generated.rewrite(
+                checked, generated.find_generated_columns(self, model, queryset)
+            )
+        body = self._check_sql(model, checked, keys, error, connection)
+        if self.concurrency == "advisory_lock" and self.mode != "async":
+            body = self._lock_sql(model, key) + body
+        sql = self._setup_sql(model) + self._wrap_function(
+            function_name, trigger_name, body, dedupe=not partition_columns
+        )
+
+        # Functions of the tables read via. joins, bypassed along with the
+        # constraint's own trigger during bulk loads.
+        for dep_table, path, _ in self._get_dependencies(model, queryset):
+            dep_function_name, _ = self._generate_names(table + ":" + path)
+            dep_queryset, dep_keys = self._get_dependency_queryset(
+                model, queryset, path, connection
+            )
+            body = self._check_sql(
+                model, dep_queryset, dep_keys, error, connection
+            )
+            sql += self._wrap_function(
+                dep_function_name,
+                trigger_name,
+                body,
+                dedupe=not is_partitioned(connection, dep_table),
+            )
+
+        # Functions re-checking the groups of deleted rows
+        for (
+            name,
+            del_table,
+            _,
+            del_queryset,
+            del_keys,
+        ) in self._get_delete_checks(model, queryset, connection):
+            del_function_name, _ = self._generate_names(name)
+            body = self._check_sql(
+                model, del_queryset, del_keys, error, connection
+            )
+            sql += self._wrap_function(
+                del_function_name,
+                trigger_name,
+                body,
+                dedupe=not is_partitioned(connection, del_table),
+            )
+        return sql
+
+    def _install_function(self, schema_editor, model, error=None):
+        """Replace the trigger functions, leaving the triggers in place."""
+        return get_backend(schema_editor.connection).install_function(
+            self, schema_editor, model, error=error
+        )
+
+    def _install_trigger(self, schema_editor, model, defer=True, error=None):
+        return get_backend(schema_editor.connection).install_trigger(
+            self, schema_editor, model, defer=defer, error=error
+        )
+
+    def _remove_trigger(self, schema_editor, model):
+        return get_backend(schema_editor.connection).remove_trigger(
+            self, schema_editor, model
         )
 
     def constraint_sql(self, model, schema_editor):
-        return ""
+        connection = getattr(schema_editor, "connection", None)
+        if connection is None:
+            return ""
+        return get_backend(connection).constraint_sql(
+            self, model, schema_editor
+        )
 
     def create_sql(self, model, schema_editor):
         return self._install_trigger(schema_editor, model=model)
@@ -99,14 +1193,75 @@ class QuerysetConstraint(BaseConstraint):
     def remove_sql(self, model, schema_editor):
         return self._remove_trigger(schema_editor, model=model)
 
+    def __getstate__(self):
+        # Compiled predicates are closures, recompiled after unpickling
+        state = self.__dict__.copy()
+        state["_predicates"] = {}
+        # Callables, such as lambdas, may not be picklable
+        state["_queryset"] = self.m_object
+        return state
+
     def __eq__(self, other):
         if not isinstance(other, QuerysetConstraint):
             return NotImplemented
-        return self.name == other.name and self.m_object == other.m_object
+        return self.deconstruct() == other.deconstruct()
 
     def __str__(self):
         return self.name + " : " + str(self.m_object)
 
     def deconstruct(self):
         path = "%s.%s" % (self.__class__.__module__, self.__class__.__name__)
-        return path, [], {"name": self.name, "queryset": self.m_object}
+        kwargs = {"name": self.name, "queryset": self.m_object}
+        if self.mode != "enforce":
+            kwargs["mode"] = self.mode
+        if self.sample_rate != 1.0:
+            kwargs["sample_rate"] = self.sample_rate
+        if self.max_rows is not None:
+            kwargs["max_rows"] = self.max_rows
+        if self.concurrency is not None:
+            kwargs["concurrency"] = self.concurrency
+        if self.check_deletes:
+            kwargs["check_deletes"] = True
+        if self.strategy != "statement":
+            kwargs["strategy"] = self.strategy
+        if self.materialize:
+            kwargs["materialize"] = True
+        return path, [], kwargs
+
+    def clone(self, **kwargs):
+        """Copy the constraint, overriding the given keyword arguments."""
+        _, args, options = self.deconstruct()
+        options.update(kwargs)
+        return self.__class__(*args, **options)
+
+
+def get_queryset_constraint(model, name):
+    """Find the QuerysetConstraint named name on model."""
+    for constraint in model._meta.constraints:
+        if (
+            isinstance(constraint, QuerysetConstraint)
+            and constraint.name == name
+        ):
+            return constraint
+    raise ValueError(
+        "Model {} has no QuerysetConstraint named '{}'".format(
+            model._meta.label, name
+        )
+    )
+
+
+def get_queryset_constraints(models=None):
+    """List (model, constraint) pairs for every installed QuerysetConstraint.
+
+    Args:
+        models (list of Model, optional):
+            Models to consider, defaults to all installed models.
+    """
+    if models is None:
+        models = apps.get_models()
+    return [
+        (model, constraint)
+        for model in models
+        for constraint in model._meta.constraints
+        if isinstance(constraint, QuerysetConstraint)
+    ]
@@ -0,0 +1,376 @@
+import random
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.utils import IntegrityError
+
+from django_queryset_constraint.constraints import get_queryset_constraint
+from django_queryset_constraint.testing import bypass_triggers
+
+# Values written by the generated writes, small enough to collide often
+VALUES = range(4)
+# Maximum number of rows inserted by a single statement
+MAX_BATCH = 3
+OPERATIONS = ["insert", "update", "update_where", "delete"]
+
+Counterexample = namedtuple(
+    "Counterexample", ["writes", "baseline", "alternative"]
+)
+# Variants expected to reject the same writes, along with the keyword
+# arguments of find_counterexample comparing them
+Case = namedtuple("Case", ["baseline", "alternative", "options"])
+
+
+def _grouped_cases():
+    """Compare constraints of the test models with their checks per group.
+
+    Covers joins, grouping and checks on deletes, which no CheckConstraint
+    can express. The written rows refer to fixtures, created per search.
+    """
+    # Imported here, as models require the app registry to be ready
+    from django_queryset_constraint.models import (
+        Order,
+        OrderLine,
+        Pizza,
+        PizzaTopping,
+        Topping,
+    )
+
+    pizzas = [Pizza(name=name) for name in ["Margherita", "Hawaii"]]
+    toppings = [Topping(name=name) for name in ["Cheese", "Ham", "Pineapple"]]
+    pizza_toppings = dict(
+        field=("pizza", "topping"),
+        values=[(pizza, topping) for pizza in pizzas for topping in toppings],
+        fixtures=pizzas + toppings,
+    )
+    orders = [Order(reference=reference) for reference in ["1", "2"]]
+    order_lines = dict(
+        field=("order", "quantity"),
+        values=[(order, quantity) for order in orders for quantity in range(3)],
+        fixtures=orders,
+    )
+    return [
+        Case(
+            model,
+            (model, get_queryset_constraint(model, name).clone(strategy="row")),
+            options,
+        )
+        for model, name, options in [
+            (PizzaTopping, "No pineapple", pizza_toppings),
+            (OrderLine, "At most 3 lines per order", order_lines),
+            (OrderLine, "At least 2 items per order", order_lines),
+        ]
+    ]
+
+
+def seed_corpus(app_label="django_queryset_constraint"):
+    """Collect the variants of the test models which should be equivalent.
+
+    Models named :code:`<Name>CC` enforce their rule via. a CheckConstraint,
+    and :code:`<Name>QC` via. a QuerysetConstraint, e.g.
+    :code:`Disallow1CC` and :code:`Disallow1QC`. For app_label's own test
+    models, constraints of :code:`PizzaTopping` and :code:`OrderLine` are
+    also compared with their :code:`strategy="row"` clones. Search each case
+    via.::
+
+        find_counterexample(case.baseline, case.alternative, **case.options)
+
+    Returns:
+        list of Case: The (CC model, QC model) pairs, by name, followed by
+            the grouped cases.
+    """
+    models = {
+        model.__name__: model
+        for model in apps.get_app_config(app_label).get_models()
+    }
+    cases = [
+        Case(model, models[name[:-2] + "QC"], {})
+        for name, model in sorted(models.items())
+        if name.endswith("CC") and name[:-2] + "QC" in models
+    ]
+    if app_label == "django_queryset_constraint":
+        cases += _grouped_cases()
+    return cases
+
+
+def _generate_write(rng, operation, values):
+    if operation == "insert":
+        return (
+            operation,
+            tuple(rng.choice(values) for _ in range(rng.randint(1, MAX_BATCH))),
+        )
+    if operation == "update":
+        return (operation, rng.randrange(100), rng.choice(values))
+    if operation == "update_where":
+        return (operation, rng.choice(values), rng.choice(values))
+    return (operation, rng.randrange(100))
+
+
+def generate_writes(rng, length, values=VALUES, statements=1):
+    """Generate a random sequence of writes.
+
+    Writes are tuples of the operation and its arguments:
+
+    * :code:`("insert", values)`, inserting a row per value, in one statement.
+    * :code:`("update", index, value)`, updating the index'th live row.
+    * :code:`("update_where", old, new)`, updating all rows of a value.
+    * :code:`("delete", index)`, deleting the index'th live row.
+    * :code:`("transaction", writes)`, running 2 or more of the above in a
+      single transaction, if statements is above 1.
+
+    Indices are taken modulo the number of live rows, thus are valid for
+    any sequence of outcomes.
+
+    Args:
+        statements (int, optional):
+            Maximum number of statements per transaction.
+    """
+    values = list(values)
+    operations = OPERATIONS + (["transaction"] if statements > 1 else [])
+    writes = []
+    for _ in range(length):
+        operation = rng.choice(operations)
+        if operation == "transaction":
+            writes.append(
+                (
+                    operation,
+                    tuple(
+                        _generate_write(rng, rng.choice(OPERATIONS), values)
+                        for _ in range(rng.randint(2, statements))
+                    ),
+                )
+            )
+        else:
+            writes.append(_generate_write(rng, operation, values))
+    return writes
+
+
+def _fields(field, value):
+    """Map field, or a tuple of fields, to value."""
+    if isinstance(field, tuple):
+        return dict(zip(field, value))
+    return {field: value}
+
+
+def _write(model, write, rows, field, using):
+    """Run write, tracking the primary keys of the live rows in rows."""
+    manager = model._base_manager.using(using)
+    operation = write[0]
+    if operation == "transaction":
+        for statement in write[1]:
+            _write(model, statement, rows, field, using)
+    elif operation == "insert":
+        created = manager.bulk_create(
+            [model(**_fields(field, value)) for value in write[1]]
+        )
+        rows.extend(obj.pk for obj in created)
+    elif operation == "update_where":
+        manager.filter(**_fields(field, write[1])).update(
+            **_fields(field, write[2])
+        )
+    elif rows:
+        pk = rows[write[1] % len(rows)]
+        if operation == "update":
+            manager.filter(pk=pk).update(**_fields(field, write[2]))
+        else:
+            manager.filter(pk=pk).delete()
+            rows.remove(pk)
+
+
+def apply_writes(
+    model, writes, field="age", immediate=False, using=DEFAULT_DB_ALIAS
+):
+    """Apply writes to model's table, each in a transaction of its own.
+
+    The table is emptied afterwards, bypassing the constraint triggers.
+
+    Args:
+        field (str or tuple of str, optional):
+            Field written to, or fields, written to by tuples of values.
+        immediate (bool, optional):
+            Check the deferred constraints as each statement runs, rather
+            than at commit, as native constraints are.
+
+    Returns:
+        tuple of bool: Whether each write was accepted, i.e. committed,
+            rather than rejected by a constraint.
+    """
+    rows = []
+    outcomes = []
+    try:
+        for write in writes:
+            # Rolled back along with the transaction
+            live = list(rows)
+            try:
+                with transaction.atomic(using=using):
+                    if immediate:
+                        with connections[using].cursor() as cursor:
+                            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE;")
+                    _write(model, write, live, field, using)
+            except IntegrityError:
+                outcomes.append(False)
+            else:
+                rows = live
+                outcomes.append(True)
+    finally:
+        with bypass_triggers(using), transaction.atomic(using=using):
+            model._base_manager.using(using).all().delete()
+    return tuple(outcomes)
+
+
+@contextmanager
+def created(fixtures, using=DEFAULT_DB_ALIAS):
+    """Create fixtures within the block, bypassing the constraint triggers.
+
+    Fixtures are deleted afterwards, in reverse, and may be created again.
+    """
+    with bypass_triggers(using), transaction.atomic(using=using):
+        for obj in fixtures:
+            obj.pk = None
+            obj.save(using=using)
+    try:
+        yield
+    finally:
+        with bypass_triggers(using), transaction.atomic(using=using):
+            for obj in reversed(fixtures):
+                type(obj)._base_manager.using(using).filter(pk=obj.pk).delete()
+
+
+@contextmanager
+def installed(model, constraint, using=DEFAULT_DB_ALIAS):
+    """Install constraint in place of model's constraint of the same name."""
+    if constraint is None:
+        yield
+        return
+    original = get_queryset_constraint(model, constraint.name)
+    with connections[using].schema_editor() as editor:
+        editor.remove_constraint(model, original)
+        editor.add_constraint(model, constraint)
+    try:
+        yield
+    finally:
+        with connections[using].schema_editor() as editor:
+            editor.remove_constraint(model, constraint)
+            editor.add_constraint(model, original)
+
+
+def _outcomes(variant, sequences, field, immediate, using):
+    """Apply each sequence of writes to variant, installing it only once."""
+    model, constraint = variant
+    with installed(model, constraint, using):
+        return [
+            apply_writes(model, writes, field, immediate, using)
+            for writes in sequences
+        ]
+
+
+def _candidates(writes):
+    """Remove a write, or a statement of a transaction, from writes."""
+    for index, write in enumerate(writes):
+        yield writes[:index] + writes[index + 1 :]
+        if write[0] == "transaction":
+            statements = write[1]
+            for inner in range(len(statements)):
+                remaining = statements[:inner] + statements[inner + 1 :]
+                # A single statement is a transaction of its own
+                if len(remaining) == 1:
+                    replacement = remaining[0]
+                else:
+                    replacement = ("transaction", remaining)
+                yield writes[:index] + [replacement] + writes[index + 1 :]
+
+
+def _shrink(baseline, alternative, writes, field, immediate, using):
+    """Remove writes from a counterexample, while it remains one."""
+    while True:
+        candidates = list(_candidates(writes))
+        expected = _outcomes(baseline, candidates, field, immediate, using)
+        actual = _outcomes(alternative, candidates, field, immediate, using)
+        for candidate, outcome, other in zip(candidates, expected, actual):
+            if candidate and outcome != other:
+                writes = candidate
+                break
+        else:
+            break
+    (expected,) = _outcomes(baseline, [writes], field, immediate, using)
+    (actual,) = _outcomes(alternative, [writes], field, immediate, using)
+    return Counterexample(writes, expected, actual)
+
+
+def find_counterexample(
+    baseline,
+    alternative,
+    examples=50,
+    length=8,
+    values=VALUES,
+    field="age",
+    statements=1,
+    immediate=False,
+    fixtures=(),
+    seed=None,
+    using=DEFAULT_DB_ALIAS,
+):
+    """Search for writes accepted by one variant, but rejected by the other.
+
+    Random sequences of writes are applied to both variants, and their
+    outcomes compared. Variants are models, enforcing their constraints as
+    declared, or :code:`(model, constraint)` pairs, installing constraint,
+    e.g. a clone using another strategy, in place of the model's constraint
+    of the same name::
+
+        constraint = get_queryset_constraint(Disallow1QC, "QC: Disallow age=1")
+        find_counterexample(
+            Disallow1QC, (Disallow1QC, constraint.clone(strategy="check"))
+        )
+
+    Meant for test databases, as the tables are emptied after every
+    sequence.
+
+    Args:
+        examples (int, optional):
+            Number of sequences to try.
+        length (int, optional):
+            Number of writes per sequence.
+        values (iterable, optional):
+            Values to write to field.
+        field (str or tuple of str, optional):
+            Field written to, shared by the models of both variants, or
+            fields, written to by tuples of values.
+        statements (int, optional):
+            Maximum number of statements per transaction. With more than 1,
+            rows violating a deferred constraint may be fixed before commit.
+        immediate (bool, optional):
+            Check the deferred constraints as each statement runs, as
+            native constraints are, e.g. comparing with a CheckConstraint
+            along with multiple statements per transaction.
+        fixtures (list of Model, optional):
+            Unsaved instances referred to by values, e.g. the targets of
+            foreign keys, created for the search and deleted afterwards.
+        seed (int, optional):
+            Seed of the generated sequences.
+
+    Returns:
+        Counterexample: The first differing sequence, shrunk to the writes
+            needed to tell the variants apart, along with the outcomes of
+            both, or :code:`None` if no difference was found.
+    """
+    baseline, alternative = [
+        variant if isinstance(variant, tuple) else (variant, None)
+        for variant in (baseline, alternative)
+    ]
+    rng = random.Random(seed)
+    sequences = [
+        generate_writes(rng, length, values, statements)
+        for _ in range(examples)
+    ]
+    with created(fixtures, using):
+        expected = _outcomes(baseline, sequences, field, immediate, using)
+        actual = _outcomes(alternative, sequences, field, immediate, using)
+        for writes, outcome, other in zip(sequences, expected, actual):
+            if outcome != other:
+                return _shrink(
+                    baseline, alternative, writes, field, immediate, using
+                )
+    return None
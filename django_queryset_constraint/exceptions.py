@@ -0,0 +1,102 @@
+import json
+from contextlib import contextmanager
+
+from django.db.utils import IntegrityError
+
+
+class QuerysetConstraintViolation(IntegrityError):
+    """Raised as a QuerysetConstraint is violated.
+
+    Attributes:
+        constraint_name (str):
+            The name of the violated constraint.
+        table (str):
+            The table of the constraint's model.
+        column (str):
+            The column grouping the checked rows, :code:`None` if the entire
+            table was checked.
+        keys (list):
+            The values of column of the violating groups, or rows, at most
+            :code:`MAX_VIOLATION_KEYS` of them.
+        hint (str):
+            The hint attached by the trigger, if any.
+    """
+
+    def __init__(
+        self,
+        message,
+        constraint_name=None,
+        table=None,
+        column=None,
+        keys=None,
+        hint=None,
+    ):
+        super().__init__(message)
+        self.constraint_name = constraint_name
+        self.table = table
+        self.column = column
+        self.keys = keys or []
+        self.hint = hint
+
+    def __reduce__(self):
+        # Only the message is in args, thus the attributes are passed too,
+        # e.g. for violations raised in other processes
+        return (
+            type(self),
+            (
+                self.args[0] if self.args else None,
+                self.constraint_name,
+                self.table,
+                self.column,
+                self.keys,
+                self.hint,
+            ),
+            self.__dict__,
+        )
+
+    @classmethod
+    def from_error(cls, exc):
+        """Parse the details attached to exc by a constraint trigger.
+
+        Returns:
+            QuerysetConstraintViolation: The parsed violation, or
+                :code:`None` if exc was not raised by a constraint trigger.
+        """
+        diag = getattr(exc.__cause__, "diag", None)
+        detail = getattr(diag, "message_detail", None)
+        if not detail:
+            return None
+        try:
+            details = json.loads(detail)
+        except ValueError:
+            return None
+        if not isinstance(details, dict) or "constraint" not in details:
+            return None
+        return cls(
+            diag.message_primary,
+            constraint_name=details["constraint"],
+            table=details.get("table"),
+            column=details.get("column"),
+            keys=details.get("keys"),
+            hint=diag.message_hint,
+        )
+
+
+@contextmanager
+def raise_violations():
+    """Raise violations within the block as QuerysetConstraintViolation.
+
+    As the triggers are deferred, violations are mostly raised at commit,
+    thus the block should contain the outermost atomic block::
+
+        with raise_violations():
+            with transaction.atomic():
+                Model.objects.bulk_create(rows)
+    """
+    try:
+        yield
+    except IntegrityError as exc:
+        violation = QuerysetConstraintViolation.from_error(exc)
+        if violation is None:
+            raise
+        raise violation from exc
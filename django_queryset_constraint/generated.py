@@ -0,0 +1,303 @@
+import copy
+from collections import namedtuple
+
+from django.db import DatabaseError, transaction
+from django.db.models import Value
+from django.db.models.expressions import (
+    Case,
+    Col,
+    CombinedExpression,
+    ExpressionWrapper,
+    When,
+)
+from django.db.models.lookups import Lookup
+from django.db.models.sql.where import AND, WhereNode
+
+# Expressions which only read the columns of the row they are evaluated on,
+# and are immutable, thus can be computed by a generated column
+ROW_LOCAL_EXPRESSIONS = (
+    Case,
+    Col,
+    CombinedExpression,
+    ExpressionWrapper,
+    Value,
+    When,
+)
+
+# PostgreSQL 12 introduced generated columns
+MIN_PG_VERSION = 120000
+# SQLSTATE of the error raised for expressions which are not immutable
+INVALID_OBJECT_DEFINITION = "42P17"
+
+GeneratedColumn = namedtuple("GeneratedColumn", ["alias", "column", "index"])
+
+
+class RowCol(Col):
+    """A column of the row itself, referred to unqualified."""
+
+    def as_sql(self, compiler, connection):
+        return connection.ops.quote_name(self.target.column), []
+
+
+def unqualify(node):
+    """Copy node, referring to the columns of its row unqualified."""
+    if isinstance(node, Col):
+        return RowCol(node.alias, node.target, node.output_field)
+    if isinstance(node, WhereNode):
+        return WhereNode(
+            [unqualify(child) for child in node.children],
+            node.connector,
+            node.negated,
+        )
+    if isinstance(node, Lookup):
+        # Copied rather than constructed, which would prepare rhs again
+        clone = copy.copy(node)
+        clone.lhs = unqualify(node.lhs)
+        if hasattr(node.rhs, "resolve_expression"):
+            clone.rhs = unqualify(node.rhs)
+        return clone
+    if hasattr(node, "get_source_expressions"):
+        clone = node.copy()
+        clone.set_source_expressions(
+            [unqualify(source) for source in node.get_source_expressions()]
+        )
+        return clone
+    return node
+
+
+def compile_row_sql(node, query, connection):
+    """Compile node of query to SQL referring to the columns unqualified.
+
+    Parameters are inlined, as the SQL is used in DDL, e.g. in CHECK
+    constraints and generated columns, which refer to the columns of the
+    row unqualified.
+    """
+    compiler = query.get_compiler(connection=connection)
+    sql, params = compiler.compile(unqualify(node))
+    if not sql:
+        return sql
+    with connection.cursor() as cursor:
+        return cursor.mogrify(sql, params).decode()
+
+
+def is_row_local(expression, table):
+    """Check whether expression only reads the columns of rows of table."""
+    if isinstance(expression, WhereNode):
+        return all(is_row_local(child, table) for child in expression.children)
+    if isinstance(expression, Lookup):
+        return is_row_local(expression.lhs, table) and (
+            not hasattr(expression.rhs, "resolve_expression")
+            or is_row_local(expression.rhs, table)
+        )
+    if isinstance(expression, Col):
+        return expression.alias == table
+    if not isinstance(expression, ROW_LOCAL_EXPRESSIONS):
+        return False
+    return all(
+        is_row_local(source, table)
+        for source in expression.get_source_expressions()
+    )
+
+
+def _filtered_lookups(node, annotation):
+    """Find the lookups of node comparing annotation."""
+    lookups = []
+    for child in node.children:
+        if isinstance(child, WhereNode):
+            lookups.extend(_filtered_lookups(child, annotation))
+        elif getattr(child, "lhs", None) is annotation:
+            lookups.append(child)
+    return lookups
+
+
+def find_generated_columns(constraint, model, queryset):
+    """Find the row-local annotations queryset filters on.
+
+    Annotations built from :code:`Case`, :code:`When`, :code:`Value`,
+    arithmetic and :code:`F` expressions referring to the row itself, e.g.
+    those of :code:`Disallow13WhenQC`, are evaluated for every row as the
+    queryset is checked. Materialized as generated columns, the filters on
+    them become index probes.
+
+    Returns:
+        list of GeneratedColumn: The materializable annotations, by alias,
+            along with the names of the generated column and its index.
+    """
+    query = queryset.query
+    table = model._meta.db_table
+    if query.group_by is not None or query.combinator:
+        return []
+    columns = []
+    for alias, annotation in query.annotations.items():
+        # Neither columns nor constants gain from being materialized
+        if isinstance(annotation, (Col, Value)):
+            continue
+        if getattr(annotation, "contains_aggregate", False):
+            continue
+        if not is_row_local(annotation, table):
+            continue
+        if not _filtered_lookups(query.where, annotation):
+            continue
+        hashed_name = constraint._hash_name(table + ":" + alias)
+        columns.append(
+            GeneratedColumn(
+                alias,
+                "__".join(["dct", "gen", hashed_name]),
+                "__".join(["dct", "idx", hashed_name]),
+            )
+        )
+    return columns
+
+
+def _replace(node, annotation, replacement):
+    for index, child in enumerate(node.children):
+        if isinstance(child, WhereNode):
+            _replace(child, annotation, replacement)
+        elif getattr(child, "lhs", None) is annotation:
+            # Lookups are shared between clones of the query
+            child = type(child)(replacement, child.rhs)
+            node.children[index] = child
+
+
+def _generated_col(table, column, output_field):
+    """Refer to a generated column of table, typed as output_field."""
+    target = output_field.clone()
+    target.set_attributes_from_name(column)
+    return Col(table, target, output_field)
+
+
+def rewrite(queryset, columns):
+    """Rewrite queryset to read the generated columns, not the annotations."""
+    query = queryset.query.clone()
+    table = query.get_meta().db_table
+    for column in columns:
+        annotation = query.annotations[column.alias]
+        replacement = _generated_col(
+            table, column.column, annotation.output_field
+        )
+        query.annotations[column.alias] = replacement
+        _replace(query.where, annotation, replacement)
+    queryset = queryset.all()
+    queryset.query = query
+    return queryset
+
+
+def check_immutable(model, definitions, connection):
+    """Check PostgreSQL can compute the generated columns of definitions.
+
+    Generated columns are restricted to immutable expressions, e.g. not
+    comparing dates with timestamps, which depends upon the time zone. Each
+    column is added to an empty copy of model's table, rolled back
+    afterwards.
+
+    Args:
+        definitions (list of tuple):
+            The alias, type and expression of each generated column.
+
+    Raises:
+        ValueError: If an expression is not immutable.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    for alias, db_type, expression in definitions:
+        try:
+            with transaction.atomic(using=connection.alias):
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "CREATE TEMPORARY TABLE dct__probe (LIKE {}) "
+                        "ON COMMIT DROP;".format(table)
+                    )
+                    cursor.execute(
+                        "ALTER TABLE dct__probe ADD COLUMN dct__probe {} "
+                        "GENERATED ALWAYS AS ({}) STORED;".format(
+                            db_type, expression
+                        )
+                    )
+                transaction.set_rollback(True, using=connection.alias)
+        except DatabaseError as exc:
+            if (
+                getattr(exc.__cause__, "pgcode", None)
+                != INVALID_OBJECT_DEFINITION
+            ):
+                raise
+            raise ValueError(
+                "Annotation '{}' of {} cannot be materialized, as it is not "
+                "immutable: {}".format(
+                    alias, model._meta.label, str(exc).strip()
+                )
+            )
+
+
+def install_sql(model, queryset, columns, connection):
+    """Generate the SQL adding the generated columns, and their indexes.
+
+    The indexes are partial, covering only the rows matching the filters on
+    the column, if these are required by the queryset, thus are empty as
+    long as the constraint holds.
+
+    Raises:
+        ValueError: On PostgreSQL before 12, which lacks generated columns,
+            or if an annotation is not immutable, see check_immutable.
+    """
+    if connection.pg_version < MIN_PG_VERSION:
+        raise ValueError(
+            "'materialize' requires PostgreSQL 12 or later, for generated "
+            "columns"
+        )
+    table = connection.ops.quote_name(model._meta.db_table)
+    query = queryset.query
+    rewritten = rewrite(queryset, columns).query
+    definitions = [
+        (
+            column.alias,
+            query.annotations[column.alias].output_field.db_type(connection),
+            compile_row_sql(query.annotations[column.alias], query, connection),
+        )
+        for column in columns
+    ]
+    check_immutable(model, definitions, connection)
+    sql = ""
+    for column, (_, db_type, expression) in zip(columns, definitions):
+        sql += (
+            "ALTER TABLE {} ADD COLUMN IF NOT EXISTS {} {} "
+            "GENERATED ALWAYS AS ({}) STORED;".format(
+                table,
+                connection.ops.quote_name(column.column),
+                db_type,
+                expression,
+            )
+        )
+        # Filters below the root, e.g. within OR, do not imply the predicate
+        required = [
+            child
+            for child in rewritten.where.children
+            if not rewritten.where.negated
+            and rewritten.where.connector == AND
+            and isinstance(child, Lookup)
+            and isinstance(child.lhs, Col)
+            and child.lhs.target.column == column.column
+        ]
+        predicate = " AND ".join(
+            compile_row_sql(lookup, rewritten, connection)
+            for lookup in required
+        )
+        sql += "CREATE INDEX IF NOT EXISTS {} ON {} ({}){};".format(
+            connection.ops.quote_name(column.index),
+            table,
+            connection.ops.quote_name(column.column),
+            " WHERE " + predicate if predicate else "",
+        )
+    return sql
+
+
+def remove_sql(model, columns, connection):
+    """Generate the SQL dropping the generated columns, and their indexes."""
+    table = connection.ops.quote_name(model._meta.db_table)
+    return "".join(
+        "DROP INDEX IF EXISTS {};"
+        "ALTER TABLE {} DROP COLUMN IF EXISTS {};".format(
+            connection.ops.quote_name(column.index),
+            table,
+            connection.ops.quote_name(column.column),
+        )
+        for column in columns
+    )
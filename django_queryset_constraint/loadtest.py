@@ -0,0 +1,320 @@
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+from django_queryset_constraint.checkpoint import get_trigger_names
+from django_queryset_constraint.compilation import _initialize
+from django_queryset_constraint.constraints import (
+    BULK_LOAD_SETTING,
+    QuerysetConstraint,
+)
+from django_queryset_constraint.equivalence import installed
+
+DISTRIBUTIONS = ["uniform", "hotspot"]
+ISOLATION_LEVELS = ["read committed", "repeatable read", "serializable"]
+OPERATIONS = ["insert", "update", "delete"]
+# With the hotspot distribution, this share of the writes goes to the hot
+# groups, which are this share of all groups
+HOT_WRITES = 0.9
+HOT_KEYS = 0.1
+# SQLSTATEs of the errors raised by PostgreSQL on conflicting transactions
+DEADLOCK_DETECTED = "40P01"
+SERIALIZATION_FAILURE = "40001"
+# SQLSTATE raised by the triggers and CHECK constraints, whatever the message
+CHECK_VIOLATION = "23514"
+
+
+def choose_key(rng, keys, distribution):
+    """Choose the key to write to, following distribution."""
+    if distribution == "hotspot" and rng.random() < HOT_WRITES:
+        return keys[rng.randrange(max(1, int(len(keys) * HOT_KEYS)))]
+    return rng.choice(keys)
+
+
+def classify_error(exc):
+    """Classify a database error raised by a load test transaction."""
+    pgcode = getattr(exc.__cause__, "pgcode", None)
+    if pgcode == DEADLOCK_DETECTED:
+        return "deadlocks"
+    if pgcode == SERIALIZATION_FAILURE:
+        return "serialization_failures"
+    if pgcode == CHECK_VIOLATION:
+        return "violations"
+    return "errors"
+
+
+def percentile(values, fraction):
+    """Find the nearest-rank percentile of the sorted values."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def _write(operation, rng, model, group, value, values, using):
+    """Run operation on the rows of group."""
+    rows = model._base_manager.using(using).filter(**{group.attname: value})
+    if operation == "insert":
+        rows.bulk_create(
+            [
+                model(
+                    **{
+                        group.attname: value,
+                        values[0].attname: rng.choice(values[1]),
+                    }
+                )
+            ],
+            ignore_conflicts=True,
+        )
+        return
+    row = rows.order_by("?").first()
+    if row is None:
+        return
+    if operation == "update":
+        rows.filter(pk=row.pk).update(
+            **{values[0].attname: rng.choice(values[1])}
+        )
+    else:
+        rows.filter(pk=row.pk).delete()
+
+
+def _work(options, seed, barrier, duration):
+    """Run transactions for duration, runs in a worker process.
+
+    Workers start once all of them are ready, i.e. spawned and connected.
+    """
+    rng = random.Random(seed)
+    using = options["using"]
+    connection = connections[using]
+    model = apps.get_model(options["model"])
+    group = model._meta.get_field(options["group_field"])
+    value = model._meta.get_field(options["value_field"])
+    counts = dict.fromkeys(
+        ["deadlocks", "serialization_failures", "violations", "errors"], 0
+    )
+    latencies = []
+    bypassed = " ".join(get_trigger_names(using=using))
+    began = time.time()
+    try:
+        barrier.wait()
+        began = time.time()
+        while time.time() < began + duration:
+            operation = rng.choices(OPERATIONS, options["mix"])[0]
+            key = choose_key(rng, options["groups"], options["distribution"])
+            started = time.perf_counter()
+            try:
+                with transaction.atomic(using=using):
+                    with connection.cursor() as cursor:
+                        if options["isolation"]:
+                            cursor.execute(
+                                "SET TRANSACTION ISOLATION LEVEL {};".format(
+                                    options["isolation"]
+                                )
+                            )
+                        if options["without_triggers"]:
+                            cursor.execute(
+                                "SELECT set_config(%s, %s, true);",
+                                [BULK_LOAD_SETTING, bypassed],
+                            )
+                    _write(
+                        operation,
+                        rng,
+                        model,
+                        group,
+                        key,
+                        (value, options["values"]),
+                        using,
+                    )
+            except DatabaseError as exc:
+                counts[classify_error(exc)] += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+    finally:
+        # Workers exit without closing their connections
+        connection.close()
+    return counts, latencies, time.time() - began
+
+
+def _related_keys(model, field_name, using):
+    """Find the field, and the primary keys of the rows it may refer to."""
+    field = model._meta.get_field(field_name)
+    if not field.many_to_one:
+        raise ValueError(
+            "'{}' should be a foreign key of {}".format(
+                field_name, model._meta.label
+            )
+        )
+    keys = list(
+        field.related_model._base_manager.using(using)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+    if not keys:
+        raise ValueError(
+            "{} has no rows for '{}' to refer to".format(
+                field.related_model._meta.label, field_name
+            )
+        )
+    return field, keys
+
+
+def run_load_test(
+    model,
+    group_field,
+    value_field,
+    processes=4,
+    duration=10,
+    distribution="uniform",
+    mix=(5, 3, 2),
+    isolation=None,
+    without_triggers=False,
+    strategy=None,
+    seed=None,
+    using=DEFAULT_DB_ALIAS,
+):
+    """Measure the constraint triggers under concurrent writes.
+
+    Worker processes add, change and remove rows of model, each in its own
+    transaction. Rows are written to groups, chosen among the rows
+    group_field refers to, and refer to a value chosen among the rows
+    value_field refers to, e.g. adding, changing and removing the toppings of
+    pizzas, such that the constraints upon model are checked under
+    contention::
+
+        run_load_test(PizzaTopping, "pizza", "topping", distribution="hotspot")
+
+    Written rows are left in place, thus this is meant for a scratch
+    database.
+
+    Args:
+        model (Model):
+            The model to write rows of.
+        group_field (str):
+            Name of the foreign key the rows are grouped by.
+        value_field (str):
+            Name of the foreign key written to.
+        processes (int, optional):
+            Number of worker processes, each over its own connection.
+        duration (float, optional):
+            Seconds to run for.
+        distribution (str, optional):
+            How groups are chosen, 'uniform' or 'hotspot', wherein most
+            writes go to a few groups.
+        mix (tuple of int, optional):
+            Relative weights of the insert, update and delete operations.
+        isolation (str, optional):
+            Isolation level of the transactions, defaults to the database's.
+        without_triggers (bool, optional):
+            Whether to bypass the constraint triggers, as a baseline.
+        strategy (str, optional):
+            Strategy to reinstall the QuerysetConstraints of model with for
+            the run, defaults to their own.
+        seed (int, optional):
+            Seed of the random choices of the workers.
+        using (str, optional):
+            Database alias to write to.
+
+    Returns:
+        dict: The committed transactions, throughput, p50 and p99 latency in
+            milliseconds, deadlocks, serialization failures, constraint
+            violations, violations per second and other errors.
+    """
+    if processes < 1:
+        raise ValueError("'processes' should be a positive integer")
+    if duration <= 0:
+        raise ValueError("'duration' should be positive")
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(
+            "'distribution' should be one of: " + ", ".join(DISTRIBUTIONS)
+        )
+    if len(mix) != len(OPERATIONS) or min(mix) < 0 or not sum(mix):
+        raise ValueError("'mix' should be three non-negative weights")
+    if isolation is not None and isolation not in ISOLATION_LEVELS:
+        raise ValueError(
+            "'isolation' should be one of: " + ", ".join(ISOLATION_LEVELS)
+        )
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+
+    _, groups = _related_keys(model, group_field, using)
+    _, values = _related_keys(model, value_field, using)
+    options = {
+        "using": using,
+        "model": model._meta.label,
+        "group_field": group_field,
+        "value_field": value_field,
+        "groups": groups,
+        "values": values,
+        "distribution": distribution,
+        "mix": mix,
+        "isolation": isolation,
+        "without_triggers": without_triggers,
+    }
+    connection = connections[using]
+    with ExitStack() as stack:
+        if strategy is not None:
+            for constraint in model._meta.constraints:
+                if isinstance(constraint, QuerysetConstraint):
+                    stack.enter_context(
+                        installed(
+                            model, constraint.clone(strategy=strategy), using
+                        )
+                    )
+        # Spawned workers share no connections with this process
+        context = multiprocessing.get_context("spawn")
+        manager = stack.enter_context(context.Manager())
+        barrier = manager.Barrier(processes)
+        with ProcessPoolExecutor(
+            processes,
+            mp_context=context,
+            initializer=_initialize,
+            initargs=(using, connection.settings_dict),
+        ) as pool:
+            futures = [
+                pool.submit(_work, options, seed + i, barrier, duration)
+                for i in range(processes)
+            ]
+            results = [future.result() for future in futures]
+
+    counts = dict.fromkeys(results[0][0], 0)
+    latencies = []
+    elapsed = 0
+    for worker_counts, worker_latencies, worker_elapsed in results:
+        for name, count in worker_counts.items():
+            counts[name] += count
+        latencies.extend(worker_latencies)
+        elapsed = max(elapsed, worker_elapsed)
+    latencies.sort()
+    p50 = percentile(latencies, 0.5)
+    p99 = percentile(latencies, 0.99)
+    return dict(
+        counts,
+        transactions=len(latencies),
+        throughput=len(latencies) / elapsed,
+        p50=p50 * 1000 if p50 is not None else None,
+        p99=p99 * 1000 if p99 is not None else None,
+        violations_per_second=counts["violations"] / elapsed,
+    )
+
+
+def compare_strategies(model, group_field, value_field, strategies, **kwargs):
+    """Run the load test once per strategy, in turn.
+
+    Args:
+        strategies (list of str):
+            The strategies to compare, see :code:`run_load_test`.
+
+    Returns:
+        dict: The results of :code:`run_load_test`, by strategy.
+    """
+    return {
+        strategy: run_load_test(
+            model, group_field, value_field, strategy=strategy, **kwargs
+        )
+        for strategy in strategies
+    }
@@ -0,0 +1,71 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from django_queryset_constraint.constraints import get_queryset_constraint
+from django_queryset_constraint.rollout import apply_to_databases
+
+
+class Command(BaseCommand):
+    help = (
+        "Installs, or removes, QuerysetConstraints in many databases "
+        "concurrently, compiling their DDL only once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "model", help="Model of the constraints, as app_label.ModelName."
+        )
+        parser.add_argument("names", nargs="+", help="Constraints to apply.")
+        parser.add_argument(
+            "--databases",
+            nargs="+",
+            help="Databases to apply to. Defaults to all databases.",
+        )
+        parser.add_argument(
+            "--remove",
+            action="store_true",
+            help="Remove the constraints, rather than install them.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            help="Number of databases to handle concurrently. Defaults to all.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options["model"])
+            constraints = [
+                get_queryset_constraint(model, name)
+                for name in options["names"]
+            ]
+        except (LookupError, ValueError) as exc:
+            raise CommandError(str(exc))
+        if options["concurrency"] is not None and options["concurrency"] < 1:
+            raise CommandError("--concurrency should be a positive integer")
+        databases = options["databases"] or list(connections)
+        unknown = set(databases).difference(connections)
+        if unknown:
+            raise CommandError(
+                "Unknown databases: " + ", ".join(sorted(unknown))
+            )
+
+        failures = apply_to_databases(
+            model,
+            constraints,
+            databases,
+            remove=options["remove"],
+            concurrency=options["concurrency"],
+        )
+        self.stdout.write(
+            "{} applied, {} failed".format(
+                len(databases) - len(failures), len(failures)
+            )
+        )
+        for alias, error in failures.items():
+            self.stderr.write("{}: {}".format(alias, error))
+        if failures:
+            raise CommandError(
+                "Failed to apply to {} databases".format(len(failures))
+            )
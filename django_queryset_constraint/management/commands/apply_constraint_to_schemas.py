@@ -0,0 +1,109 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from django_queryset_constraint.constraints import get_queryset_constraint
+from django_queryset_constraint.schemas import (
+    SchemaApplier,
+    compile_ddl,
+    list_schemas,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Installs, or removes, QuerysetConstraints in many schemas "
+        "concurrently, compiling their DDL only once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "model", help="Model of the constraints, as app_label.ModelName."
+        )
+        parser.add_argument("names", nargs="+", help="Constraints to apply.")
+        parser.add_argument(
+            "--schemas",
+            nargs="+",
+            help="Schemas to apply to. Defaults to all containing the table.",
+        )
+        parser.add_argument(
+            "--remove",
+            action="store_true",
+            help="Remove the constraints, rather than install them.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Number of schemas to handle concurrently.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help='Database to apply to. Defaults to the "default" database.',
+        )
+        parser.add_argument(
+            "--no-resume",
+            action="store_true",
+            help="Handle all schemas, including those completed previously.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options["model"])
+            constraints = [
+                get_queryset_constraint(model, name)
+                for name in options["names"]
+            ]
+        except (LookupError, ValueError) as exc:
+            raise CommandError(str(exc))
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency should be a positive integer")
+        using = options["database"]
+        schemas = options["schemas"] or list_schemas(
+            model._meta.db_table, using=using
+        )
+        if not schemas:
+            raise CommandError("No schemas to apply to")
+
+        # Compile once, within the first schema, as the DDL depends upon the
+        # structure of the table, which all schemas are assumed to share.
+        statements = []
+        connection = connections[using]
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SET LOCAL search_path TO {};".format(
+                        connection.ops.quote_name(schemas[0])
+                    )
+                )
+            for constraint in constraints:
+                statements.extend(
+                    compile_ddl(
+                        model, constraint, remove=options["remove"], using=using
+                    )
+                )
+
+        def progress(schema, error):
+            self.stdout.write(
+                "{}: {}".format(schema, "failed" if error else "done")
+            )
+
+        applier = SchemaApplier(
+            statements, using=using, concurrency=options["concurrency"]
+        )
+        applied, skipped, failures = applier.run(
+            schemas, resume=not options["no_resume"], callback=progress
+        )
+
+        self.stdout.write(
+            "{} applied, {} skipped, {} failed".format(
+                len(applied), len(skipped), len(failures)
+            )
+        )
+        for schema, error in failures.items():
+            self.stderr.write("{}: {}".format(schema, error))
+        if failures:
+            raise CommandError(
+                "Failed to apply to {} schemas".format(len(failures))
+            )
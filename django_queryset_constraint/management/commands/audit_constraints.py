@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from django_queryset_constraint.constraints import get_queryset_constraints
+
+
+class Command(BaseCommand):
+    help = (
+        "Audits existing rows against QuerysetConstraints in parallel, "
+        "writing violations as JSON Lines."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "models",
+            nargs="*",
+            help="Models to audit, as app_label.ModelName. Defaults to all.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help='Database to audit. Defaults to the "default" database.',
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of constraints to audit concurrently.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of rows to fetch from the database at a time.",
+        )
+        parser.add_argument(
+            "--output", help="File to write violations to. Defaults to stdout."
+        )
+
+    def audit(self, model, constraint, options):
+        """Write all violations of constraint, runs in a worker thread."""
+        count = 0
+        try:
+            for row in constraint.iter_violations(
+                model,
+                using=options["database"],
+                chunk_size=options["chunk_size"],
+            ):
+                line = json.dumps(
+                    {
+                        "model": model._meta.label,
+                        "constraint": constraint.name,
+                        "row": row,
+                    },
+                    cls=DjangoJSONEncoder,
+                    sort_keys=True,
+                )
+                with self.lock:
+                    self.output.write(line + "\n")
+                count += 1
+        finally:
+            # Each worker thread has its own connection, which we must close
+            connections[options["database"]].close()
+        return count
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("--workers should be a positive integer")
+        try:
+            models = [apps.get_model(label) for label in options["models"]]
+        except (LookupError, ValueError) as exc:
+            raise CommandError(str(exc))
+        pairs = get_queryset_constraints(models or None)
+
+        self.lock = threading.Lock()
+        if options["output"]:
+            self.output = open(options["output"], "w")
+        else:
+            self.output = self.stdout
+        try:
+            with ThreadPoolExecutor(options["workers"]) as executor:
+                futures = [
+                    executor.submit(self.audit, model, constraint, options)
+                    for model, constraint in pairs
+                ]
+                counts = [future.result() for future in futures]
+        finally:
+            if options["output"]:
+                self.output.close()
+
+        for (model, constraint), count in zip(pairs, counts):
+            self.stderr.write(
+                "{}: {}: {} violations".format(
+                    model._meta.label, constraint.name, count
+                )
+            )
@@ -0,0 +1,163 @@
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from django_queryset_constraint.constraints import STRATEGIES
+from django_queryset_constraint.loadtest import (
+    DISTRIBUTIONS,
+    ISOLATION_LEVELS,
+    compare_strategies,
+    run_load_test,
+)
+
+# Rows of the side by side comparison of strategies
+COMPARED = [
+    ("transactions", "Transactions", "{}"),
+    ("throughput", "Throughput/s", "{:.1f}"),
+    ("p50", "p50 latency (ms)", "{:.3f}"),
+    ("p99", "p99 latency (ms)", "{:.3f}"),
+    ("deadlocks", "Deadlocks", "{}"),
+    ("serialization_failures", "Serialization failures", "{}"),
+    ("errors", "Other errors", "{}"),
+    ("violations", "Violations", "{}"),
+    ("violations_per_second", "Violations/s", "{:.1f}"),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the constraint triggers under concurrent writes, reporting "
+        "the throughput, latency, deadlocks, serialization failures and "
+        "constraint violations. Meant for a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "model", help="Model to write to, as app_label.ModelName."
+        )
+        parser.add_argument(
+            "group_field",
+            help="Foreign key the rows are grouped by, e.g. pizza.",
+        )
+        parser.add_argument(
+            "value_field", help="Foreign key written to, e.g. topping."
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help='Database to write to. Defaults to the "default" database.',
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=4,
+            help="Number of worker processes.",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=10, help="Seconds to run for."
+        )
+        parser.add_argument(
+            "--distribution",
+            choices=DISTRIBUTIONS,
+            default="uniform",
+            help=(
+                "How the groups to write to are chosen. With 'hotspot', most "
+                "writes go to a few groups."
+            ),
+        )
+        parser.add_argument(
+            "--mix",
+            default="5:3:2",
+            help="Relative weights of inserts, updates and deletes.",
+        )
+        parser.add_argument(
+            "--isolation",
+            choices=ISOLATION_LEVELS,
+            help="Isolation level of the transactions.",
+        )
+        parser.add_argument(
+            "--without-triggers",
+            action="store_true",
+            help="Bypass the constraint triggers, to measure a baseline.",
+        )
+        parser.add_argument(
+            "--strategy",
+            nargs="+",
+            choices=STRATEGIES,
+            help=(
+                "Reinstall the model's constraints with each strategy in "
+                "turn, reporting the runs side by side."
+            ),
+        )
+        parser.add_argument(
+            "--seed", type=int, help="Seed of the random choices."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options["model"])
+            mix = tuple(int(weight) for weight in options["mix"].split(":"))
+            kwargs = dict(
+                processes=options["processes"],
+                duration=options["duration"],
+                distribution=options["distribution"],
+                mix=mix,
+                isolation=options["isolation"],
+                without_triggers=options["without_triggers"],
+                seed=options["seed"],
+                using=options["database"],
+            )
+            arguments = [model, options["group_field"], options["value_field"]]
+            if options["strategy"]:
+                results = compare_strategies(
+                    *arguments, options["strategy"], **kwargs
+                )
+            else:
+                result = run_load_test(*arguments, **kwargs)
+        except (LookupError, FieldDoesNotExist, ValueError) as exc:
+            raise CommandError(str(exc))
+        if options["strategy"]:
+            self.write_comparison(results)
+            return
+        self.stdout.write(
+            "{transactions} transactions, {throughput:.1f}/s".format(**result)
+        )
+        if result["transactions"]:
+            self.stdout.write(
+                "Latency: {p50:.3f}ms p50, {p99:.3f}ms p99".format(**result)
+            )
+        self.stdout.write(
+            "{deadlocks} deadlocks, {serialization_failures} serialization "
+            "failures, {errors} other errors".format(**result)
+        )
+        self.stdout.write(
+            "{violations} violations, {violations_per_second:.1f}/s".format(
+                **result
+            )
+        )
+
+    def write_comparison(self, results):
+        """Write a table of the results, with a column per strategy."""
+        rows = [[""] + list(results)]
+        for key, label, format_string in COMPARED:
+            rows.append(
+                [label]
+                + [
+                    "-"
+                    if result[key] is None
+                    else format_string.format(result[key])
+                    for result in results.values()
+                ]
+            )
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        for row in rows:
+            self.stdout.write(
+                "  ".join(
+                    [row[0].ljust(widths[0])]
+                    + [
+                        cell.rjust(width)
+                        for cell, width in zip(row[1:], widths[1:])
+                    ]
+                ).rstrip()
+            )
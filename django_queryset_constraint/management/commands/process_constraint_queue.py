@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.module_loading import import_string
+
+from django_queryset_constraint.queueing import drain_queue, log_violation
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks the keys queued by QuerysetConstraints in async mode. Any "
+        "number of workers can run concurrently."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help='Database to process. Defaults to the "default" database.',
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of queue entries to claim at a time.",
+        )
+        parser.add_argument(
+            "--handler",
+            help=(
+                "Dotted path to the violation handler, called with the "
+                "model, constraint, key and violating rows. Defaults to "
+                "logging the violations."
+            ),
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1,
+            help="Seconds to wait for new entries once the queue is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty, rather than waiting.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size should be a positive integer")
+        handler = log_violation
+        if options["handler"]:
+            try:
+                handler = import_string(options["handler"])
+            except ImportError as exc:
+                raise CommandError(str(exc))
+
+        violations = 0
+
+        def counting_handler(*args):
+            nonlocal violations
+            violations += 1
+            handler(*args)
+
+        processed = 0
+        while True:
+            count = drain_queue(
+                counting_handler,
+                using=options["database"],
+                batch_size=options["batch_size"],
+            )
+            processed += count
+            if not count:
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+        self.stdout.write(
+            "Processed {} entries, {} violations".format(processed, violations)
+        )
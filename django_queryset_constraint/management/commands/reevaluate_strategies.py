@@ -0,0 +1,69 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from django_queryset_constraint.constraints import get_queryset_constraints
+from django_queryset_constraint.strategies import (
+    GROUPS_PER_STATEMENT,
+    reevaluate,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Decides the strategies of constraints with strategy='auto' again, "
+        "e.g. as their tables grew, reinstalling those which changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "models",
+            nargs="*",
+            help="Models to reevaluate, as app_label.ModelName. Defaults to all.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help='Database to reevaluate. Defaults to the "default" database.',
+        )
+        parser.add_argument(
+            "--groups-per-statement",
+            type=int,
+            default=GROUPS_PER_STATEMENT,
+            help="Number of groups assumed to be written per statement.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the decisions without reinstalling any constraints.",
+        )
+
+    def handle(self, *args, **options):
+        if options["groups_per_statement"] < 1:
+            raise CommandError(
+                "--groups-per-statement should be a positive integer"
+            )
+        try:
+            models = [apps.get_model(label) for label in options["models"]]
+        except (LookupError, ValueError) as exc:
+            raise CommandError(str(exc))
+        connection = connections[options["database"]]
+        for model, constraint in get_queryset_constraints(models or None):
+            if constraint.strategy != "auto":
+                continue
+            previous, decision = reevaluate(
+                model,
+                constraint,
+                connection,
+                groups_per_statement=options["groups_per_statement"],
+                apply=not options["dry_run"],
+            )
+            self.stdout.write(
+                "{}: {}: {} -> {}: {}".format(
+                    model._meta.label,
+                    constraint.name,
+                    previous or "-",
+                    decision.strategy,
+                    decision.reason,
+                )
+            )
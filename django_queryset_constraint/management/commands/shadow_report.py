@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from django_queryset_constraint.constraints import (
+    SHADOW_LOG_TABLE,
+    get_queryset_constraints,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports the checks recorded by QuerysetConstraints in shadow mode, "
+        "their violations and their overhead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help='Database to report on. Defaults to the "default" database.',
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Clear the recorded checks after reporting.",
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s);", [SHADOW_LOG_TABLE])
+            if cursor.fetchone()[0] is None:
+                self.stdout.write("No checks recorded.")
+                return
+            cursor.execute(
+                """
+                SELECT
+                    constraint_name,
+                    table_name,
+                    count(*),
+                    count(*) FILTER (WHERE violated),
+                    avg(extract(epoch FROM duration)) * 1000,
+                    percentile_cont(0.99) WITHIN GROUP (
+                        ORDER BY extract(epoch FROM duration)
+                    ) * 1000
+                FROM {}
+                GROUP BY constraint_name, table_name
+                ORDER BY constraint_name, table_name;
+                """.format(
+                    SHADOW_LOG_TABLE
+                )
+            )
+            rows = cursor.fetchall()
+            for name, table, checks, violations, mean, p99 in rows:
+                self.stdout.write(
+                    "{} on {}: {} checks, {} violations "
+                    "({:.1%}), {:.3f}ms mean, {:.3f}ms p99".format(
+                        name,
+                        table,
+                        checks,
+                        violations,
+                        violations / checks,
+                        mean,
+                        p99,
+                    )
+                )
+            if not rows:
+                self.stdout.write("No checks recorded.")
+
+            if options["reset"]:
+                cursor.execute("TRUNCATE {};".format(SHADOW_LOG_TABLE))
+                # Restart the sequences capping the number of recorded checks
+                for model, constraint in get_queryset_constraints():
+                    if constraint.max_rows is not None:
+                        cursor.execute(
+                            "ALTER SEQUENCE IF EXISTS dct__seq__{} "
+                            "RESTART;".format(
+                                constraint._hash_name(model._meta.db_table)
+                            )
+                        )
@@ -0,0 +1,64 @@
+from django.core.management.commands import sqlmigrate
+from django.db import connections
+from django.db.migrations import AddConstraint
+from django.db.migrations.exceptions import AmbiguityError
+from django.db.migrations.loader import MigrationLoader
+
+from django_queryset_constraint.compilation import compile_constraints
+from django_queryset_constraint.constraints import QuerysetConstraint
+
+
+class Command(sqlmigrate.Command):
+    """The :code:`sqlmigrate` command, compiling constraints in parallel."""
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help=(
+                "Compile the migration's QuerysetConstraints on a pool of "
+                "this many processes."
+            ),
+        )
+
+    def get_model_constraints(self, loader, migration):
+        """Find the QuerysetConstraints added by migration.
+
+        Returns:
+            list of tuple: The constraints, along with their models as of
+                the state after migration.
+        """
+        state = loader.project_state(
+            (migration.app_label, migration.name), at_end=True
+        )
+        model_constraints = []
+        for operation in migration.operations:
+            # Constraints in CreateModel options install no triggers
+            if not isinstance(operation, AddConstraint) or not isinstance(
+                operation.constraint, QuerysetConstraint
+            ):
+                continue
+            model = state.apps.get_model(
+                migration.app_label, operation.model_name
+            )
+            model_constraints.append((model, operation.constraint))
+        return model_constraints
+
+    def handle(self, *args, **options):
+        if options["processes"] and not options["backwards"]:
+            loader = MigrationLoader(connections[options["database"]])
+            try:
+                migration = loader.get_migration_by_prefix(
+                    options["app_label"], options["migration_name"]
+                )
+            except (AmbiguityError, KeyError):
+                # Reported by the sqlmigrate command itself
+                migration = None
+            if migration is not None:
+                compile_constraints(
+                    self.get_model_constraints(loader, migration),
+                    using=options["database"],
+                    processes=options["processes"],
+                )
+        return super().handle(*args, **options)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from django_queryset_constraint.partitions import sync_partition_triggers
+
+
+class Command(BaseCommand):
+    help = (
+        "Installs the QuerysetConstraint triggers of partitioned tables on "
+        "partitions which lack them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help='Database to synchronize. Defaults to the "default" database.',
+        )
+
+    def handle(self, *args, **options):
+        sync_partition_triggers(using=options["database"])
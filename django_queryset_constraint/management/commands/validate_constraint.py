@@ -0,0 +1,83 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from django_queryset_constraint.constraints import (
+    get_queryset_constraint,
+    get_queryset_constraints,
+)
+from django_queryset_constraint.validation import validate_constraint
+
+
+class Command(BaseCommand):
+    help = "Validates pre-existing rows against QuerysetConstraints in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "model", help="Model to validate, as app_label.ModelName."
+        )
+        parser.add_argument(
+            "names",
+            nargs="*",
+            help="Constraints to validate, defaults to all on the model.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help='Database to validate. Defaults to the "default" database.',
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Number of rows to validate per query.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Seconds to sleep between chunks.",
+        )
+        parser.add_argument(
+            "--no-resume",
+            action="store_false",
+            dest="resume",
+            help="Discard recorded progress and start from the beginning.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options["model"])
+        except (LookupError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        try:
+            constraints = [
+                get_queryset_constraint(model, name)
+                for name in options["names"]
+            ]
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if not constraints:
+            constraints = [
+                constraint
+                for _, constraint in get_queryset_constraints([model])
+            ]
+
+        broken = []
+        for constraint in constraints:
+            violations = validate_constraint(
+                model,
+                constraint,
+                resume=options["resume"],
+                using=options["database"],
+                chunk_size=options["chunk_size"],
+                sleep=options["sleep"],
+            )
+            self.stdout.write(
+                "{}: {} violations".format(constraint.name, violations)
+            )
+            if violations:
+                broken.append(constraint.name)
+        if broken:
+            raise CommandError("Invariant broken: " + ", ".join(broken))
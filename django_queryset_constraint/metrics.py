@@ -0,0 +1,311 @@
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.utils import IntegrityError
+
+from django_queryset_constraint.constraints import get_queryset_constraints
+from django_queryset_constraint.exceptions import QuerysetConstraintViolation
+
+# Counter of violations, labelled by constraint name
+VIOLATIONS = "queryset_constraint_violations"
+# Histogram of the latency of statements writing constrained tables
+STATEMENT_SECONDS = "queryset_constraint_statement_seconds"
+# Histogram of the commit latency of transactions writing constrained tables,
+# i.e. the time spent running the deferred checks
+COMMIT_SECONDS = "queryset_constraint_commit_seconds"
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# SQLSTATE raised by the triggers and CHECK constraints
+CHECK_VIOLATION = "23514"
+# Prefix of the default error message, the only detail SQLite aborts with
+SQLITE_ERROR_PREFIX = "Invariant broken: "
+WRITE_PATTERN = re.compile(
+    r'^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+"([^"]+)"', re.IGNORECASE
+)
+DISPATCH_UID = "django_queryset_constraint.metrics"
+
+
+class MetricsBackend(ABC):
+    """Receives the metrics, subclass to export them, e.g. to Prometheus."""
+
+    @abstractmethod
+    def increment(self, name, labels):
+        """Increment the counter name, with the given labels, by one."""
+
+    @abstractmethod
+    def observe(self, name, value):
+        """Record value in the histogram name."""
+
+
+class InMemoryBackend(MetricsBackend):
+    """Keeps the metrics in memory, rendering them in OpenMetrics format.
+
+    Attributes:
+        counters (dict):
+            Maps counter names to dicts, mapping label tuples to counts.
+        histograms (dict):
+            Maps histogram names to the list of observed values.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = defaultdict(lambda: defaultdict(int))
+        self.histograms = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def increment(self, name, labels):
+        with self.lock:
+            self.counters[name][tuple(sorted(labels.items()))] += 1
+
+    def observe(self, name, value):
+        with self.lock:
+            self.histograms[name].append(value)
+
+    def get_count(self, name, **labels):
+        with self.lock:
+            return self.counters[name].get(tuple(sorted(labels.items())), 0)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self):
+        """Render the metrics in the OpenMetrics text format."""
+        lines = []
+        with self.lock:
+            for name, counts in sorted(self.counters.items()):
+                lines.append("# TYPE {} counter".format(name))
+                for labels, count in sorted(counts.items()):
+                    lines.append(
+                        "{}_total{} {}".format(name, _labels(labels), count)
+                    )
+            for name, values in sorted(self.histograms.items()):
+                lines.append("# TYPE {} histogram".format(name))
+                for bucket in self.buckets:
+                    lines.append(
+                        '{}_bucket{{le="{}"}} {}'.format(
+                            name, bucket, sum(v <= bucket for v in values)
+                        )
+                    )
+                lines.append(
+                    '{}_bucket{{le="+Inf"}} {}'.format(name, len(values))
+                )
+                lines.append("{}_count {}".format(name, len(values)))
+                lines.append("{}_sum {}".format(name, sum(values)))
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            '{}="{}"'.format(
+                key,
+                value.replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for key, value in labels
+        )
+        + "}"
+    )
+
+
+def get_violated_constraint(exc, check_names=None):
+    """Find the name of the constraint violated by exc.
+
+    Args:
+        exc (IntegrityError):
+            The error raised by the database.
+        check_names (dict, optional):
+            Maps the names of CHECK constraints installed via.
+            :code:`strategy="check"` to the constraint names.
+
+    On SQLite, only violations raised with the default error message,
+    :code:`"Invariant broken: <name>"`, are attributed.
+
+    Returns:
+        str: The name of the QuerysetConstraint, or :code:`None` if exc was
+            not raised by a constraint.
+    """
+    cause = exc.__cause__
+    if isinstance(cause, sqlite3.IntegrityError):
+        # Custom error messages cannot be told apart from other errors
+        message = str(cause)
+        if not message.startswith(SQLITE_ERROR_PREFIX):
+            return None
+        return message[len(SQLITE_ERROR_PREFIX) :]
+    if getattr(cause, "pgcode", None) != CHECK_VIOLATION:
+        return None
+    diag = cause.diag
+    if check_names and diag.constraint_name in check_names:
+        return check_names[diag.constraint_name]
+    if "dct__func__" not in (diag.context or ""):
+        return None
+    violation = QuerysetConstraintViolation.from_error(exc)
+    if violation is not None:
+        return violation.constraint_name
+    return (diag.message_primary or "").replace("Invariant broken: ", "", 1)
+
+
+class ConstraintMetrics:
+    """Execute wrapper recording constraint violations and latencies.
+
+    Violations are counted per constraint, whether raised by a statement, a
+    checkpoint or the deferred checks at commit. The latency is recorded
+    for the statements writing to the tables of constraints, and for the
+    commits of transactions which wrote to them, which run the deferred
+    checks. In autocommit mode, the checks run as part of each statement.
+    See :code:`instrument`.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.tables = None
+        self.check_names = None
+        self.touched = False
+
+    def _load(self):
+        pairs = get_queryset_constraints()
+        self.tables = {model._meta.db_table for model, _ in pairs}
+        self.check_names = {
+            constraint._check_name(model._meta.db_table): constraint.name
+            for model, constraint in pairs
+        }
+
+    def _record_violation(self, exc):
+        if self.tables is None:
+            self._load()
+        name = get_violated_constraint(exc, self.check_names)
+        if name is not None:
+            self.backend.increment(VIOLATIONS, {"constraint": name})
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.tables is None:
+            self._load()
+        match = WRITE_PATTERN.match(sql)
+        writes = match is not None and match.group(1) in self.tables
+        if writes and not context["connection"].get_autocommit():
+            self.touched = True
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except IntegrityError as exc:
+            self._record_violation(exc)
+            raise
+        finally:
+            if writes:
+                self.backend.observe(
+                    STATEMENT_SECONDS, time.perf_counter() - started
+                )
+
+    def commit(self, commit):
+        """Run commit, recording its latency and violations."""
+        touched, self.touched = self.touched, False
+        started = time.perf_counter()
+        try:
+            return commit()
+        except IntegrityError as exc:
+            self._record_violation(exc)
+            raise
+        finally:
+            if touched:
+                self.backend.observe(
+                    COMMIT_SECONDS, time.perf_counter() - started
+                )
+
+    def rollback(self, rollback):
+        self.touched = False
+        return rollback()
+
+
+def get_metrics(connection):
+    """Find the metrics installed on connection, if any."""
+    for wrapper in connection.execute_wrappers:
+        if isinstance(wrapper, ConstraintMetrics):
+            return wrapper
+    return None
+
+
+def instrument(connection, backend):
+    """Install the metrics on connection, unless already installed."""
+    wrapper = get_metrics(connection)
+    if wrapper is not None:
+        return wrapper
+    wrapper = ConstraintMetrics(backend)
+    connection.execute_wrappers.append(wrapper)
+    # Deferred checks run at commit, which does not go via. a cursor, thus
+    # the commits of the connection are wrapped too
+    commit, rollback = connection._commit, connection._rollback
+    connection._commit = lambda: wrapper.commit(commit)
+    connection._rollback = lambda: wrapper.rollback(rollback)
+    return wrapper
+
+
+def uninstrument(connection):
+    """Remove the metrics from connection, if installed."""
+    connection.execute_wrappers[:] = [
+        wrapper
+        for wrapper in connection.execute_wrappers
+        if not isinstance(wrapper, ConstraintMetrics)
+    ]
+    connection.__dict__.pop("_commit", None)
+    connection.__dict__.pop("_rollback", None)
+
+
+def install(backend=None):
+    """Record the metrics of every database connection into backend.
+
+    Connections are instrumented as they are created, and those already open
+    in the current thread are instrumented immediately. Meant to be called
+    from :code:`AppConfig.ready`.
+
+    Args:
+        backend (MetricsBackend, optional):
+            Backend receiving the metrics, defaults to an InMemoryBackend.
+
+    Returns:
+        MetricsBackend: The backend.
+    """
+    if backend is None:
+        backend = InMemoryBackend()
+
+    def receiver(sender, connection, **kwargs):
+        instrument(connection, backend)
+
+    uninstall()
+    connection_created.connect(receiver, weak=False, dispatch_uid=DISPATCH_UID)
+    for connection in connections.all():
+        if connection.connection is not None:
+            instrument(connection, backend)
+    return backend
+
+
+def uninstall():
+    """Stop recording metrics, undoing :code:`install`."""
+    connection_created.disconnect(dispatch_uid=DISPATCH_UID)
+    for connection in connections.all():
+        uninstrument(connection)
@@ -0,0 +1,35 @@
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import router
+
+from django_queryset_constraint.constraints import get_queryset_constraints
+
+
+class QuerysetConstraintMixin:
+    """Model mixin validating QuerysetConstraints as part of full_clean.
+
+    Makes forms, serializers and other :code:`full_clean` callers reject
+    invariant breaking input, before any (deferred) writes are issued.
+    """
+
+    def validate_constraints(self, exclude=None):
+        """Validate all QuerysetConstraints on the model against self.
+
+        Raises:
+            ValidationError: If any of the constraints would be violated.
+        """
+        model = self.__class__
+        using = router.db_for_write(model, instance=self)
+        errors = []
+        for _, constraint in get_queryset_constraints([model]):
+            try:
+                constraint.validate(model, self, exclude=exclude, using=using)
+            except ValidationError as exc:
+                errors.append(exc)
+        if errors:
+            raise ValidationError({NON_FIELD_ERRORS: errors})
+
+    def full_clean(self, exclude=None, validate_unique=True):
+        # Constraints are only validated once all fields are clean, as their
+        # queries cannot be run with invalid field values.
+        super().full_clean(exclude=exclude, validate_unique=validate_unique)
+        self.validate_constraints(exclude=exclude)
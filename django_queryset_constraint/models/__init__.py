@@ -5,8 +5,10 @@ from django_queryset_constraint.models.age_models import (
     AllowOnly0QC,
     AllowOnly1ObjectQC,
     Disallow1AnnotateQC,
+    Disallow1AsyncQC,
     Disallow1CC,
     Disallow1QC,
+    Disallow1ShadowQC,
     Disallow1SubqueryQC,
     Disallow1TriggerNewQC,
     Disallow1ViaQQC,
@@ -24,7 +26,9 @@ from django_queryset_constraint.models.age_models import (
     Disallow12ViaQQC,
     Disallow13SubquerySliceQC,
     Disallow13WhenQC,
+    UniqueAgeLockedQC,
 )
+from django_queryset_constraint.models.order_models import Order, OrderLine
 from django_queryset_constraint.models.pizza_models import (
     Pizza,
     PizzaNC,
@@ -33,3 +37,4 @@ from django_queryset_constraint.models.pizza_models import (
     Topping,
     ToppingNC,
 )
+from django_queryset_constraint.models.reading_models import Reading
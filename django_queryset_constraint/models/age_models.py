@@ -69,6 +69,33 @@ class Disallow1TriggerNewQC(AgeModel):
         ]
 
 
+class Disallow1ShadowQC(AgeModel):
+    """QuerysetConstraint against single value, recording only."""
+
+    class Meta:
+        constraints = [
+            QuerysetConstraint(
+                name="QC: Shadow disallow age=1",
+                queryset=M().objects.filter(age=1),
+                mode="shadow",
+                max_rows=3,
+            )
+        ]
+
+
+class Disallow1AsyncQC(AgeModel):
+    """QuerysetConstraint against single value, checked asynchronously."""
+
+    class Meta:
+        constraints = [
+            QuerysetConstraint(
+                name="QC: Async disallow age=1",
+                queryset=M().objects.filter(age=1),
+                mode="async",
+            )
+        ]
+
+
 class Disallow12InCC(AgeModel):
     """CheckConstraint against value in list."""
 
@@ -236,6 +263,21 @@ class AllowOnly1ObjectQC(AgeModel):
         ]
 
 
+class UniqueAgeLockedQC(AgeModel):
+    class Meta:
+        constraints = [
+            # Allow each age only once, serializing writers of the same age
+            QuerysetConstraint(
+                name="QC: Unique age with advisory lock",
+                queryset=M()
+                .objects.values("age")
+                .annotate(num_rows=Count("id"))
+                .filter(num_rows__gt=1),
+                concurrency="advisory_lock",
+            )
+        ]
+
+
 class Disallow1AnnotateQC(AgeModel):
     class Meta:
         constraints = [
@@ -345,6 +387,7 @@ class Disallow1SubqueryWith7SubqueryQC(AgeModel):
         constraints = [
             QuerysetConstraint(
                 name="QC: Disallow age=1 via subquery with 7 subqueries",
-                queryset=generate_subquery(7),
+                # Evaluated lazily, as recording 7 subqueries is costly
+                queryset=lambda: generate_subquery(7),
             )
         ]
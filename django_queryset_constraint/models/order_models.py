@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from django.db import models
+from django.db.models import Count, Sum
+
+from django_queryset_constraint.constraints import QuerysetConstraint
+from django_queryset_constraint.utils import M
+
+
+# Orders checked as their lines are deleted
+class Order(models.Model):
+    class Meta:
+        constraints = [
+            # Orders are created along with their lines, and keep at least one
+            QuerysetConstraint(
+                name="Orders have lines",
+                queryset=M()
+                .objects.annotate(num_lines=Count("orderline"))
+                .filter(num_lines__lt=1),
+                check_deletes=True,
+            )
+        ]
+
+    reference = models.CharField(max_length=30)
+
+
+class OrderLine(models.Model):
+    class Meta:
+        constraints = [
+            # Orders below the minimum quantity are not worth shipping
+            QuerysetConstraint(
+                name="At least 2 items per order",
+                queryset=M()
+                .objects.values("order")
+                .annotate(num_items=Sum("quantity"))
+                .filter(num_items__lt=2),
+                check_deletes=True,
+            ),
+            # Deleting lines never breaks a maximum, thus is not checked
+            QuerysetConstraint(
+                name="At most 3 lines per order",
+                queryset=M()
+                .objects.values("order")
+                .annotate(num_lines=Count("id"))
+                .filter(num_lines__gt=3),
+                check_deletes=True,
+            ),
+        ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
@@ -3,6 +3,7 @@ from django.db import models
 from django.db.models import Count, Q
 
 from django_queryset_constraint.constraints import QuerysetConstraint
+from django_queryset_constraint.mixins import QuerysetConstraintMixin
 from django_queryset_constraint.utils import M
 
 
@@ -36,7 +37,7 @@ class Topping(models.Model):
     name = models.CharField(max_length=30)
 
 
-class PizzaTopping(models.Model):
+class PizzaTopping(QuerysetConstraintMixin, models.Model):
     class Meta:
         unique_together = ("pizza", "topping")
         constraints = [
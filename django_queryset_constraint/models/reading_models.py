@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from django.db import models
+from django.db.models import Count
+
+from django_queryset_constraint.constraints import QuerysetConstraint
+from django_queryset_constraint.utils import M
+
+
+class Reading(models.Model):
+    """Model whose table is replaced by a partitioned table in the tests."""
+
+    class Meta:
+        constraints = [
+            QuerysetConstraint(
+                name="QC: At most 2 readings per day",
+                queryset=M()
+                .objects.values("day")
+                .annotate(num_readings=Count("id"))
+                .filter(num_readings__gt=2),
+            )
+        ]
+
+    day = models.DateField()
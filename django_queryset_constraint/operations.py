@@ -0,0 +1,125 @@
+from django.db.migrations.operations.base import Operation
+from django.db.utils import IntegrityError
+
+from django_queryset_constraint.constraints import get_queryset_constraint
+from django_queryset_constraint.validation import validate_constraint
+
+
+class ValidateQuerysetConstraint(Operation):
+    """Validate pre-existing rows against an installed QuerysetConstraint.
+
+    Intended to follow the :code:`AddConstraint` operation installing the
+    constraint, such that data written before the constraint existed is
+    checked as well. Validation runs in chunks, see
+    :code:`django_queryset_constraint.validation.ChunkedValidator`.
+    """
+
+    reduces_to_sql = False
+
+    def __init__(self, model_name, name, chunk_size=10000, sleep=0):
+        self.model_name = model_name
+        self.name = name
+        self.chunk_size = chunk_size
+        self.sleep = sleep
+
+    def deconstruct(self):
+        kwargs = {"model_name": self.model_name, "name": self.name}
+        if self.chunk_size != 10000:
+            kwargs["chunk_size"] = self.chunk_size
+        if self.sleep:
+            kwargs["sleep"] = self.sleep
+        return self.__class__.__name__, [], kwargs
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        constraint = get_queryset_constraint(model, self.name)
+        violations = validate_constraint(
+            model,
+            constraint,
+            using=schema_editor.connection.alias,
+            chunk_size=self.chunk_size,
+            sleep=self.sleep,
+        )
+        if violations:
+            raise IntegrityError(
+                "Invariant broken: {} ({} violations)".format(
+                    self.name, violations
+                )
+            )
+
+    def database_backwards(
+        self, app_label, schema_editor, from_state, to_state
+    ):
+        pass
+
+    def describe(self):
+        return "Validate constraint {} on model {}".format(
+            self.name, self.model_name
+        )
+
+
+class AlterQuerysetConstraintMode(Operation):
+    """Switch an installed QuerysetConstraint between enforce and shadow mode.
+
+    Only the trigger function is replaced, leaving the trigger in place, thus
+    this is cheaper than the :code:`RemoveConstraint` and :code:`AddConstraint`
+    pair generated by :code:`makemigrations`, which it can replace.
+    """
+
+    def __init__(self, model_name, name, mode, sample_rate=1.0, max_rows=None):
+        self.model_name = model_name
+        self.name = name
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.max_rows = max_rows
+
+    def deconstruct(self):
+        kwargs = {
+            "model_name": self.model_name,
+            "name": self.name,
+            "mode": self.mode,
+        }
+        if self.sample_rate != 1.0:
+            kwargs["sample_rate"] = self.sample_rate
+        if self.max_rows is not None:
+            kwargs["max_rows"] = self.max_rows
+        return self.__class__.__name__, [], kwargs
+
+    def state_forwards(self, app_label, state):
+        model_state = state.models[app_label, self.model_name.lower()]
+        model_state.options["constraints"] = [
+            constraint.clone(
+                mode=self.mode,
+                sample_rate=self.sample_rate,
+                max_rows=self.max_rows,
+            )
+            if constraint.name == self.name
+            else constraint
+            for constraint in model_state.options["constraints"]
+        ]
+        state.reload_model(app_label, self.model_name.lower(), delay=True)
+
+    def _replace_function(self, app_label, schema_editor, state):
+        model = state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        constraint = get_queryset_constraint(model, self.name)
+        constraint._install_function(schema_editor, model)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        self._replace_function(app_label, schema_editor, to_state)
+
+    def database_backwards(
+        self, app_label, schema_editor, from_state, to_state
+    ):
+        self._replace_function(app_label, schema_editor, to_state)
+
+    def describe(self):
+        return "Switch constraint {} on model {} to {} mode".format(
+            self.name, self.model_name, self.mode
+        )
@@ -0,0 +1,196 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Table registering the triggers to install on every partition of a table
+PARTITION_TRIGGER_TABLE = "dct__partition_trigger"
+
+# Creates the registry, and the function creating the registered triggers on
+# all leaf partitions which lack them. Partitions are found via. pg_inherits,
+# rather than pg_partition_tree, which requires PostgreSQL 12.
+SETUP_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        table_name text NOT NULL,
+        trigger_name text NOT NULL,
+        events text NOT NULL,
+        timing text NOT NULL,
+        function_name text NOT NULL,
+        PRIMARY KEY (table_name, trigger_name)
+    );
+    CREATE OR REPLACE FUNCTION dct__sync_partition_triggers()
+    RETURNS void
+    AS $$
+    DECLARE
+        registered record;
+        leaf regclass;
+    BEGIN
+        FOR registered IN SELECT * FROM {table} LOOP
+            FOR leaf IN
+                WITH RECURSIVE tree(relid) AS (
+                    SELECT to_regclass(registered.table_name)::oid
+                    UNION ALL
+                    SELECT i.inhrelid
+                    FROM pg_inherits i JOIN tree ON i.inhparent = tree.relid
+                )
+                SELECT tree.relid::regclass
+                FROM tree JOIN pg_class c ON c.oid = tree.relid
+                WHERE c.relkind = 'r' AND NOT EXISTS (
+                    SELECT 1 FROM pg_trigger t
+                    WHERE t.tgrelid = tree.relid
+                    AND t.tgname = registered.trigger_name
+                )
+            LOOP
+                EXECUTE format(
+                    'CREATE CONSTRAINT TRIGGER %I AFTER %s ON %s %s '
+                    'FOR EACH ROW EXECUTE PROCEDURE %s',
+                    registered.trigger_name,
+                    registered.events,
+                    leaf,
+                    registered.timing,
+                    registered.function_name
+                );
+            END LOOP;
+        END LOOP;
+    END
+    $$ LANGUAGE plpgsql;
+""".format(
+    table=PARTITION_TRIGGER_TABLE
+)
+
+# Keeps the triggers in sync as partitions are created or attached. Event
+# triggers can only be created by superusers.
+EVENT_TRIGGER_SQL = """
+    CREATE OR REPLACE FUNCTION dct__sync_partition_triggers_event()
+    RETURNS event_trigger
+    AS $$
+    BEGIN
+        IF to_regclass('{table}') IS NOT NULL THEN
+            PERFORM dct__sync_partition_triggers();
+        END IF;
+    END
+    $$ LANGUAGE plpgsql;
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_event_trigger
+            WHERE evtname = 'dct__sync_partition_triggers'
+        ) THEN
+            CREATE EVENT TRIGGER dct__sync_partition_triggers
+            ON ddl_command_end
+            WHEN TAG IN ('CREATE TABLE', 'ALTER TABLE')
+            EXECUTE PROCEDURE dct__sync_partition_triggers_event();
+        END IF;
+    END
+    $$;
+""".format(
+    table=PARTITION_TRIGGER_TABLE
+)
+
+
+def is_partitioned(connection, table):
+    """Check whether table is a partitioned table."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s);",
+            [table],
+        )
+        row = cursor.fetchone()
+    return row is not None and row[0]
+
+
+def get_partition_columns(connection, table):
+    """Find the columns of the partition key of table.
+
+    Returns:
+        list of str: The columns, empty if table is not partitioned, or if
+            its partition key contains expressions.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT a.attname
+            FROM pg_partitioned_table p
+            CROSS JOIN unnest(p.partattrs::int2[]) AS k(attnum)
+            LEFT JOIN pg_attribute a
+                ON a.attrelid = p.partrelid AND a.attnum = k.attnum
+            WHERE p.partrelid = to_regclass(%s);
+            """,
+            [table],
+        )
+        columns = [row[0] for row in cursor.fetchall()]
+    if None in columns:
+        return []
+    return columns
+
+
+def create_trigger_sql(
+    connection, trigger_name, events, table, deferrable, function_name
+):
+    """Generate the SQL creating a constraint trigger on table.
+
+    Triggers of partitioned tables are registered and created on every leaf
+    partition instead, as constraint triggers cannot be created on the
+    partitioned table itself in older PostgreSQL versions.
+    """
+    if not is_partitioned(connection, table):
+        return """
+            CREATE CONSTRAINT TRIGGER {}
+            AFTER {} ON {}
+            {}
+            FOR EACH ROW
+                EXECUTE PROCEDURE {};
+        """.format(
+            trigger_name, events, table, deferrable, function_name
+        )
+    sql = SETUP_SQL
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT rolsuper FROM pg_roles WHERE rolname = current_user;"
+        )
+        if cursor.fetchone()[0]:
+            sql += EVENT_TRIGGER_SQL
+    values = ", ".join(
+        "'{}'".format(value.replace("'", "''"))
+        for value in [table, trigger_name, events, deferrable, function_name]
+    )
+    return (
+        sql
+        + """
+        INSERT INTO {} VALUES ({}) ON CONFLICT DO NOTHING;
+        SELECT dct__sync_partition_triggers();
+    """.format(
+            PARTITION_TRIGGER_TABLE, values
+        )
+    )
+
+
+def drop_trigger_sql(connection, trigger_name, table, if_exists=False):
+    """Generate the SQL dropping a trigger created by create_trigger_sql."""
+    if_exists = "IF EXISTS " if if_exists else ""
+    if not is_partitioned(connection, table):
+        return "DROP TRIGGER {}{} ON {};".format(if_exists, trigger_name, table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT tgrelid::regclass::text FROM pg_trigger WHERE tgname = %s;",
+            [trigger_name],
+        )
+        partitions = [row[0] for row in cursor.fetchall()]
+    return "DELETE FROM {} WHERE trigger_name = '{}';".format(
+        PARTITION_TRIGGER_TABLE, trigger_name
+    ) + "".join(
+        "DROP TRIGGER {} ON {};".format(trigger_name, partition)
+        for partition in partitions
+    )
+
+
+def sync_partition_triggers(using=DEFAULT_DB_ALIAS):
+    """Create the registered triggers on partitions which lack them.
+
+    Only required after creating or attaching partitions, if the event
+    trigger doing so could not be installed, as it requires a superuser.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT to_regclass(%s) IS NOT NULL;", [PARTITION_TRIGGER_TABLE]
+        )
+        if cursor.fetchone()[0]:
+            cursor.execute("SELECT dct__sync_partition_triggers();")
@@ -0,0 +1,262 @@
+import operator
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Model, Q, QuerySet
+from django.db.models.expressions import Combinable
+from django.db.models.manager import BaseManager
+
+from django_queryset_constraint.utils import M
+
+
+def _range(value, bounds):
+    return bounds[0] <= value <= bounds[1]
+
+
+def _lower(function):
+    return lambda value, arg: function(str(value).lower(), str(arg).lower())
+
+
+# Python implementations of the supported lookups
+LOOKUPS = {
+    "exact": operator.eq,
+    "iexact": _lower(operator.eq),
+    "in": lambda value, arg: value in arg,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "range": _range,
+    "contains": lambda value, arg: str(arg) in str(value),
+    "icontains": _lower(lambda value, arg: arg in value),
+    "startswith": lambda value, arg: str(value).startswith(str(arg)),
+    "istartswith": _lower(str.startswith),
+    "endswith": lambda value, arg: str(value).endswith(str(arg)),
+    "iendswith": _lower(str.endswith),
+}
+RELATION_LOOKUPS = {"exact", "in", "isnull"}
+
+
+class Predicate:
+    """A row-local constraint queryset compiled to a Python function.
+
+    Calling the predicate with an instance returns whether the instance would
+    be returned by the constraint queryset, i.e. whether it violates the
+    constraint. SQL NULL semantics are mimicked, as per the ORM, comparisons
+    against :code:`None` are false, while negations thereof are true.
+    """
+
+    def __init__(self, function, columns):
+        self.function = function
+        self.columns = columns
+
+    def __call__(self, instance):
+        return self.function(instance.__dict__)
+
+    def violations(self, instances):
+        """Find the indices of the violating instances."""
+        function = self.function
+        return [
+            index
+            for index, instance in enumerate(instances)
+            if function(instance.__dict__)
+        ]
+
+    def evaluate_columns(self, columns):
+        """Evaluate the predicate over column arrays.
+
+        Args:
+            columns (dict of str to list):
+                Column values keyed by field name or attname. All columns read
+                by the predicate must be present and of equal length.
+
+        Returns:
+            list of int: The indices of the violating rows.
+        """
+        arrays = []
+        for name, attname in self.columns:
+            if attname in columns:
+                arrays.append(columns[attname])
+            elif name in columns:
+                arrays.append(columns[name])
+            else:
+                raise KeyError("Missing column '{}'".format(name))
+        attnames = [attname for _, attname in self.columns]
+        function = self.function
+        if not arrays:
+            # Constant predicate, the length has to come from elsewhere
+            size = len(next(iter(columns.values()), []))
+            return list(range(size)) if function({}) else []
+        return [
+            index
+            for index, values in enumerate(zip(*arrays))
+            if function(dict(zip(attnames, values)))
+        ]
+
+
+def _not_row_local(reason):
+    return ValueError("Queryset is not row-local: " + reason)
+
+
+def _compile_leaf(model, lookup, arg, columns):
+    parts = lookup.split("__")
+    if len(parts) > 2:
+        raise _not_row_local("'{}' spans relations".format(lookup))
+    name, lookup_name = parts[0], (parts[1:] or ["exact"])[0]
+    try:
+        field = model._meta.pk if name == "pk" else model._meta.get_field(name)
+    except FieldDoesNotExist:
+        raise _not_row_local("'{}' is not a field".format(lookup))
+    if not field.concrete or field.many_to_many:
+        raise _not_row_local("'{}' is not a local column".format(lookup))
+    # Not hasattr(arg, "resolve_expression"), which M objects would record
+    if isinstance(arg, (Combinable, Q, QuerySet, M)):
+        raise _not_row_local(
+            "'{}' compares against an expression".format(lookup)
+        )
+    # As per the ORM, comparing against None matches NULL
+    if arg is None and lookup_name in ("exact", "iexact"):
+        lookup_name, arg = "isnull", True
+    if field.is_relation and lookup_name not in RELATION_LOOKUPS:
+        raise _not_row_local("'{}' is not supported".format(lookup))
+    if lookup_name != "isnull" and lookup_name not in LOOKUPS:
+        raise _not_row_local("'{}' is not supported".format(lookup))
+    columns.add((field.name, field.attname))
+    attname = field.attname
+
+    if lookup_name == "isnull":
+        return lambda row: (row.get(attname) is None) == bool(arg)
+
+    def prepare(value):
+        if isinstance(value, Model):
+            value = value.pk
+        return field.get_prep_value(value)
+
+    if lookup_name in ("in", "range"):
+        arg = [prepare(value) for value in arg]
+    else:
+        arg = prepare(arg)
+    function = LOOKUPS[lookup_name]
+
+    def leaf(row):
+        value = row.get(attname)
+        if value is None:
+            return False
+        return function(prepare(value), arg)
+
+    return leaf
+
+
+def _compile_q(model, q, columns):
+    children = []
+    for child in q.children:
+        if isinstance(child, Q):
+            children.append(_compile_q(model, child, columns))
+        else:
+            children.append(_compile_leaf(model, *child, columns))
+    combine = all if q.connector == Q.AND else any
+    if q.negated:
+        return lambda row: not combine(child(row) for child in children)
+    return lambda row: combine(child(row) for child in children)
+
+
+def compile_predicate(model, m_object):
+    """Compile the filter/exclude chain recorded by an M object.
+
+    Only chains of :code:`filter`, :code:`exclude` and :code:`all` calls on a
+    manager, comparing local columns against constants, can be compiled.
+
+    Raises:
+        ValueError: If the queryset cannot be evaluated row by row.
+    """
+    if m_object.model_name_override or m_object.app_label_override:
+        raise _not_row_local("it targets another model")
+    operations = list(m_object.operations)
+    if not operations or operations[0]["type"] != "__getattribute__":
+        raise _not_row_local("it does not start from a manager")
+    manager = getattr(model, operations.pop(0)["args"][0], None)
+    if (
+        not isinstance(manager, BaseManager)
+        or type(manager).get_queryset is not BaseManager.get_queryset
+    ):
+        raise _not_row_local("it does not start from a plain manager")
+
+    columns = set()
+    clauses = []
+    while operations:
+        method = operations.pop(0)
+        call = operations.pop(0) if operations else {"type": None}
+        if (
+            method["type"] != "__getattribute__"
+            or call["type"] != "__call__"
+            or method["args"][0] not in ("filter", "exclude", "all")
+        ):
+            raise _not_row_local("it uses operations other than filter")
+        q = Q(*call["args"], **call["kwargs"])
+        if method["args"][0] == "exclude":
+            q = ~q
+        clauses.append(_compile_q(model, q, columns))
+
+    def function(row):
+        return all(clause(row) for clause in clauses)
+
+    return Predicate(function, sorted(columns))
+
+
+class BatchValidationError(ValidationError):
+    """Raised when instances in a batch violate QuerysetConstraints.
+
+    Attributes:
+        violations (dict of str to list of int):
+            Indices of the violating instances, keyed by constraint name.
+    """
+
+    def __init__(self, violations):
+        self.violations = violations
+        super().__init__(
+            [
+                ValidationError(
+                    "Invariant broken: %(name)s (rows %(indices)s)",
+                    code="invariant",
+                    params={
+                        "name": name,
+                        "indices": ", ".join(map(str, indices)),
+                    },
+                )
+                for name, indices in violations.items()
+            ]
+        )
+
+
+def prevalidate(model, instances):
+    """Check a batch of unsaved instances against row-local constraints.
+
+    Constraints which are not row-local are skipped, leaving them for the
+    trigger to enforce, as are constraints in shadow mode.
+
+    Raises:
+        BatchValidationError: Reporting all violating instances at once.
+    """
+    # Avoid circular import, as constraints import this module
+    from django_queryset_constraint.constraints import get_queryset_constraints
+
+    violations = {}
+    for _, constraint in get_queryset_constraints([model]):
+        if constraint.mode == "shadow":
+            continue
+        predicate = constraint.get_predicate(model)
+        if predicate is None:
+            continue
+        indices = predicate.violations(instances)
+        if indices:
+            violations[constraint.name] = indices
+    if violations:
+        raise BatchValidationError(violations)
+
+
+class PrevalidatingQuerySet(QuerySet):
+    """QuerySet rejecting violating rows before bulk_create sends them."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        prevalidate(self.model, objs)
+        return super().bulk_create(objs, *args, **kwargs)
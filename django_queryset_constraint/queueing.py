@@ -0,0 +1,128 @@
+import logging
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+
+from django_queryset_constraint.constraints import (
+    QUEUE_TABLE,
+    get_queryset_constraints,
+)
+
+logger = logging.getLogger("django_queryset_constraint")
+
+
+def log_violation(model, constraint, key, rows):
+    """Default violation handler, logging each violation as an error."""
+    logger.error(
+        "Invariant broken: %s (%s, key %s, %d rows)",
+        constraint.name,
+        model._meta.label,
+        key,
+        len(rows),
+    )
+
+
+def check_keys(model, constraint, keys, using=DEFAULT_DB_ALIAS):
+    """Check the constraint for a set of keys, using a single query.
+
+    Args:
+        model (Model):
+            The model upon which the constraint is installed.
+        constraint (QuerysetConstraint):
+            The constraint to check.
+        keys (set of str):
+            The keys to check, as queued by the trigger. :code:`None` stands
+            for the rows without a key, or the entire table, if the queryset
+            has no key field (see :code:`QuerysetConstraint._get_key_field`).
+        using (str, optional):
+            Database alias to check against.
+
+    Returns:
+        dict: The violating rows, as returned by :code:`values()`, keyed by
+            the key of their group.
+    """
+    queryset = constraint.get_queryset(model, using=using)
+    key = constraint._get_key_field(model, queryset)
+    if queryset._fields is None:
+        queryset = queryset.values()
+    if key is None:
+        rows = list(queryset)
+        return {None: rows} if rows else {}
+
+    # Queued keys are text, thus convert them back to the field's type
+    condition = Q(
+        **{
+            key.attname
+            + "__in": [
+                key.to_python(value) for value in keys if value is not None
+            ]
+        }
+    )
+    if None in keys:
+        condition |= Q(**{key.attname + "__isnull": True})
+    violations = {}
+    for row in queryset.filter(condition):
+        value = row[key.attname] if key.attname in row else row[key.name]
+        violations.setdefault(value, []).append(row)
+    return violations
+
+
+def drain_queue(handler=None, using=DEFAULT_DB_ALIAS, batch_size=1000):
+    """Check one batch of the keys queued by constraints in async mode.
+
+    The batch is claimed with :code:`FOR UPDATE SKIP LOCKED`, such that any
+    number of workers can drain the queue concurrently. Keys are deduplicated,
+    and each constraint is checked once for all of its keys in the batch.
+
+    Claiming, checking and handling happen within one transaction, thus if
+    the handler raises, the batch is returned to the queue.
+
+    Args:
+        handler (callable, optional):
+            Called as :code:`handler(model, constraint, key, rows)` for every
+            group violating a constraint. Defaults to :code:`log_violation`.
+        using (str, optional):
+            Database alias of the queue.
+        batch_size (int, optional):
+            Maximum number of queue entries to claim.
+
+    Returns:
+        int: The number of queue entries processed, zero if the queue is
+            empty.
+    """
+    if handler is None:
+        handler = log_violation
+    constraints = {
+        (model._meta.db_table, constraint.name): (model, constraint)
+        for model, constraint in get_queryset_constraints()
+    }
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                """
+                DELETE FROM {0} WHERE id IN (
+                    SELECT id FROM {0}
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING table_name, constraint_name, key;
+                """.format(
+                    QUEUE_TABLE
+                ),
+                [batch_size],
+            )
+            entries = cursor.fetchall()
+
+        keys = {}
+        for table, name, key in entries:
+            keys.setdefault((table, name), set()).add(key)
+        for pair, pair_keys in keys.items():
+            # Skip entries queued by constraints which have since been removed
+            if pair not in constraints:
+                continue
+            model, constraint = constraints[pair]
+            violations = check_keys(model, constraint, pair_keys, using=using)
+            for key, rows in violations.items():
+                handler(model, constraint, key, rows)
+    return len(entries)
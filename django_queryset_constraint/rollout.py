@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import DatabaseError, connections
+
+
+def apply_to_databases(
+    model, constraints, databases, remove=False, concurrency=None
+):
+    """Install, or remove, constraints in each of databases concurrently.
+
+    Trigger functions are cached per vendor and server version (see
+    :code:`QuerysetConstraint._function_sql`), thus rolling a constraint out
+    to many shards compiles its queryset only once.
+
+    Args:
+        model (Model):
+            The model upon which the constraints are installed.
+        constraints (list of QuerysetConstraint):
+            The constraints to install or remove.
+        databases (list of str):
+            Aliases of the databases to apply to.
+        remove (bool, optional):
+            Whether to remove the constraints, rather than install them.
+        concurrency (int, optional):
+            Number of databases to handle concurrently, defaults to all.
+
+    Returns:
+        dict: The errors of the failed databases, keyed by alias.
+    """
+
+    def apply(alias):
+        connection = connections[alias]
+        try:
+            with connection.schema_editor() as editor:
+                for constraint in constraints:
+                    if remove:
+                        editor.remove_constraint(model, constraint)
+                    else:
+                        editor.add_constraint(model, constraint)
+        except DatabaseError as exc:
+            return str(exc).strip()
+        finally:
+            # Each worker thread has its own connection, which we must close
+            connection.close()
+        return None
+
+    with ThreadPoolExecutor(concurrency or len(databases) or 1) as executor:
+        errors = dict(zip(databases, executor.map(apply, databases)))
+    return {alias: error for alias, error in errors.items() if error}
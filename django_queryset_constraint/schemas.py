@@ -0,0 +1,212 @@
+import hashlib
+import queue
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+PROGRESS_TABLE = "dct__schema_progress"
+
+
+def compile_ddl(model, constraint, remove=False, using=DEFAULT_DB_ALIAS):
+    """Generate the DDL installing, or removing, constraint, without running it.
+
+    The DDL refers to tables unqualified, such that it can be run in any
+    schema containing the model's table.
+
+    Returns:
+        list of str: The statements to run.
+    """
+    connection = connections[using]
+    with connection.schema_editor(collect_sql=True, atomic=False) as editor:
+        if remove:
+            editor.remove_constraint(model, constraint)
+        else:
+            editor.add_constraint(model, constraint)
+    return editor.collected_sql
+
+
+def list_schemas(table, using=DEFAULT_DB_ALIAS):
+    """List the schemas containing table."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT table_schema FROM information_schema.tables "
+            "WHERE table_name = %s ORDER BY table_schema;",
+            [table],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SchemaApplier:
+    """Run the same DDL in many schemas, over a pool of connections.
+
+    Each schema is handled in its own transaction, with its search path set
+    to just the schema. Progress is recorded in the
+    :code:`dct__schema_progress` table, keyed by a digest of the DDL, such
+    that an interrupted run skips the schemas which have been completed.
+    """
+
+    def __init__(self, statements, using=DEFAULT_DB_ALIAS, concurrency=4):
+        """Prepare running statements.
+
+        Args:
+            statements (list of str):
+                The DDL to run, see :code:`compile_ddl`.
+            using (str, optional):
+                Database alias to connect to.
+            concurrency (int, optional):
+                Number of schemas to handle concurrently, each over its own
+                connection.
+        """
+        if concurrency < 1:
+            raise ValueError("'concurrency' should be a positive integer")
+        self.statements = statements
+        self.using = using
+        self.concurrency = concurrency
+        hasher = hashlib.sha256()
+        for statement in statements:
+            hasher.update(statement.encode("utf8"))
+        self.digest = hasher.hexdigest()[:40]
+        self.progress_table = None
+
+    def _ensure_progress_table(self):
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            # Qualify the table, as workers change their search path
+            cursor.execute("SELECT current_schema();")
+            self.progress_table = "{}.{}".format(
+                connection.ops.quote_name(cursor.fetchone()[0]), PROGRESS_TABLE
+            )
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS {} (
+                    digest text NOT NULL,
+                    schema_name text NOT NULL,
+                    error text,
+                    updated_at timestamptz NOT NULL DEFAULT now(),
+                    PRIMARY KEY (digest, schema_name)
+                );
+                """.format(
+                    self.progress_table
+                )
+            )
+
+    def _completed_schemas(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                "SELECT schema_name FROM {} "
+                "WHERE digest = %s AND error IS NULL;".format(
+                    self.progress_table
+                ),
+                [self.digest],
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def _record(self, cursor, schema, error):
+        cursor.execute(
+            """
+            INSERT INTO {} (digest, schema_name, error) VALUES (%s, %s, %s)
+            ON CONFLICT (digest, schema_name) DO UPDATE
+            SET error = EXCLUDED.error, updated_at = now();
+            """.format(
+                self.progress_table
+            ),
+            [self.digest, schema, error],
+        )
+
+    def reset(self):
+        """Forget the progress, such that all schemas are handled again."""
+        self._ensure_progress_table()
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM {} WHERE digest = %s;".format(self.progress_table),
+                [self.digest],
+            )
+
+    def _apply(self, schema):
+        """Run the statements in schema, returning the error, if any."""
+        connection = connections[self.using]
+        try:
+            with transaction.atomic(using=self.using):
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SET LOCAL search_path TO {};".format(
+                            connection.ops.quote_name(schema)
+                        )
+                    )
+                    for statement in self.statements:
+                        cursor.execute(statement)
+                    # Recorded within the transaction, thus only if applied
+                    self._record(cursor, schema, None)
+        except DatabaseError as exc:
+            with connection.cursor() as cursor:
+                self._record(cursor, schema, str(exc).strip())
+            return str(exc).strip()
+        return None
+
+    def _work(self, schemas, results, callback):
+        """Handle schemas until none are left, runs in a worker thread."""
+        try:
+            while True:
+                try:
+                    schema = schemas.get_nowait()
+                except queue.Empty:
+                    return
+                error = self._apply(schema)
+                with self.lock:
+                    results[schema] = error
+                    if callback is not None:
+                        callback(schema, error)
+        finally:
+            # Each worker thread has its own connection, which we must close
+            connections[self.using].close()
+
+    def run(self, schemas, resume=True, callback=None):
+        """Run the statements in each of schemas.
+
+        Args:
+            schemas (list of str):
+                The schemas to run the statements in.
+            resume (bool, optional):
+                Whether to skip the schemas completed by a previous run.
+            callback (callable, optional):
+                Called with the schema and its error, if any, as each schema
+                is completed. Called from the worker threads, one at a time.
+
+        Returns:
+            tuple: The list of applied schemas, the list of skipped schemas and
+                a dict of the errors of the failed schemas.
+        """
+        self._ensure_progress_table()
+        if not resume:
+            self.reset()
+        completed = self._completed_schemas()
+        skipped = [schema for schema in schemas if schema in completed]
+
+        pending = queue.Queue()
+        for schema in schemas:
+            if schema not in completed:
+                pending.put(schema)
+        results = {}
+        self.lock = threading.Lock()
+        threads = [
+            threading.Thread(
+                target=self._work, args=[pending, results, callback]
+            )
+            for _ in range(min(self.concurrency, pending.qsize()))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        applied = [
+            schema
+            for schema in schemas
+            if schema in results and results[schema] is None
+        ]
+        failures = {
+            schema: results[schema]
+            for schema in schemas
+            if results.get(schema) is not None
+        }
+        return applied, skipped, failures
@@ -0,0 +1,321 @@
+"""SQLite implementation of the QuerysetConstraint triggers.
+
+SQLite has neither deferred triggers nor stored functions, thus the check is
+inlined into :code:`AFTER INSERT` and :code:`AFTER UPDATE` row triggers, which
+run right after each row is written rather than at commit. Only the 'enforce'
+mode is supported, constraints in other modes are skipped with a warning, and
+the PostgreSQL specific features, such as bulk loads, checkpoints and
+partitions, are unavailable.
+
+Django's SQLite schema editor adds and removes constraints by remaking the
+table, via. :code:`create_model`, thus the triggers are created by
+:code:`QuerysetConstraint.constraint_sql` as deferred SQL, and dropped along
+with the old table. Since SQLite 3.26, renaming the remade table fails if the
+triggers of other tables read the table it replaces, thus the triggers reading
+other tables are dropped throughout :code:`migrate`, or
+:code:`suspended_triggers`, and recreated at the end of it, via. the
+:code:`pre_migrate` and :code:`post_migrate` receivers connected by the app.
+"""
+import warnings
+from contextlib import contextmanager
+
+from django.apps import apps as global_apps
+from django.db import DEFAULT_DB_ALIAS, connections, router
+
+# Prefix of the tables, and the models, Django remakes SQLite tables as
+REMADE_TABLE_PREFIX = "new__"
+REMADE_MODEL_PREFIX = "New"
+# Aliases of the databases whose triggers reading other tables are dropped
+_suspended = set()
+
+
+def check_supported(constraint):
+    """Warn of the parts of constraint which cannot be checked on SQLite.
+
+    The options tuning the checks on PostgreSQL, i.e. 'concurrency',
+    'materialize' and 'strategy', are ignored, as SQLite serializes writes
+    and checks each row as it is written.
+
+    Returns:
+        bool: Whether the triggers of constraint are installed, i.e. unless
+            it is not in 'enforce' mode.
+    """
+    if constraint.mode != "enforce":
+        warnings.warn(
+            "Constraint '{}' is in '{}' mode, only 'enforce' is supported on "
+            "SQLite, thus it is not installed".format(
+                constraint.name, constraint.mode
+            ),
+            RuntimeWarning,
+        )
+        return False
+    if constraint.check_deletes:
+        warnings.warn(
+            "Constraint '{}' sets 'check_deletes', which is not supported on "
+            "SQLite, thus deletes are not checked".format(constraint.name),
+            RuntimeWarning,
+        )
+    return True
+
+
+def compile_query(queryset, connection):
+    """Render queryset as SQL, with its parameters inlined as literals."""
+    compiler = queryset.query.get_compiler(connection=connection)
+    sql, params = compiler.as_sql()
+    schema_editor = connection.SchemaEditorClass(connection)
+    return sql % tuple(schema_editor.quote_value(param) for param in params)
+
+
+def create_trigger_sql(trigger_name, event, table, query, error):
+    """Generate the SQL creating a trigger aborting if query returns rows."""
+    return """
+        CREATE TRIGGER {} AFTER {} ON "{}"
+        FOR EACH ROW
+        BEGIN
+            SELECT RAISE(ABORT, '{}') WHERE EXISTS (
+                {}
+            );
+        END;
+    """.format(
+        trigger_name, event, table, error.replace("'", "''"), query
+    )
+
+
+def get_triggers(constraint, model, connection, error=None):
+    """Generate the triggers of constraint.
+
+    Returns:
+        list of tuple: The name, the table and the SQL creating each trigger.
+    """
+    if not check_supported(constraint):
+        return []
+    table = model._meta.db_table
+    if table.startswith(REMADE_TABLE_PREFIX):
+        # The triggers are created after the table is renamed back
+        table = table[len(REMADE_TABLE_PREFIX) :]
+        model = global_apps.get_model(
+            model._meta.app_label,
+            model._meta.object_name[len(REMADE_MODEL_PREFIX) :],
+        )
+    if error is None:
+        error = "Invariant broken: " + constraint.name
+    queryset = constraint.get_queryset(model)
+    query = compile_query(queryset, connection)
+    _, trigger_name = constraint._generate_names(table)
+    triggers = [
+        (name, table, create_trigger_sql(name, event, table, query, error))
+        for name, event in [
+            (trigger_name + "__insert", "INSERT"),
+            (trigger_name + "__update", "UPDATE"),
+        ]
+    ]
+    # Re-check the rows referencing updated rows of the tables read via. joins
+    for dep_table, path, columns in constraint._get_dependencies(
+        model, queryset
+    ):
+        _, dep_trigger_name = constraint._generate_names(table + ":" + path)
+        dep_queryset, _ = constraint._get_dependency_queryset(
+            model, queryset, path, connection
+        )
+        event = "UPDATE OF " + ", ".join(
+            '"{}"'.format(column) for column in columns
+        )
+        triggers.append(
+            (
+                dep_trigger_name,
+                dep_table,
+                create_trigger_sql(
+                    dep_trigger_name,
+                    event,
+                    dep_table,
+                    compile_query(dep_queryset, connection),
+                    error,
+                ),
+            )
+        )
+    return triggers
+
+
+def _reads_other_tables(sql, table, tables):
+    """Check whether the trigger of table created by sql reads other tables."""
+    return any(
+        '"{}"'.format(other) in sql for other in tables if other != table
+    )
+
+
+def _creatable_triggers(triggers, connection):
+    """Skip the triggers reading other tables, while these are suspended."""
+    if connection.alias not in _suspended:
+        return triggers
+    tables = connection.introspection.table_names()
+    return [
+        (name, table, sql)
+        for name, table, sql in triggers
+        if not _reads_other_tables(sql, table, tables)
+    ]
+
+
+def deferred_sql(constraint, model, schema_editor):
+    """Generate the deferred SQL creating the triggers of constraint.
+
+    Deferred SQL is run with parameters, thus literal '%' are escaped.
+    """
+    connection = schema_editor.connection
+    return [
+        statement.replace("%", "%%")
+        for trigger_name, _, sql in _creatable_triggers(
+            get_triggers(constraint, model, connection), connection
+        )
+        for statement in [
+            "DROP TRIGGER IF EXISTS {};".format(trigger_name),
+            sql,
+        ]
+    ]
+
+
+def install_triggers(constraint, schema_editor, model, error=None):
+    """(Re)create the triggers of constraint."""
+    connection = schema_editor.connection
+    for trigger_name, _, sql in _creatable_triggers(
+        get_triggers(constraint, model, connection, error), connection
+    ):
+        # Without params, as the SQL may contain literal '%' characters
+        schema_editor.execute(
+            "DROP TRIGGER IF EXISTS {};".format(trigger_name), params=None
+        )
+        schema_editor.execute(sql, params=None)
+
+
+def remove_triggers(constraint, schema_editor, model):
+    """Drop the triggers of constraint, including those of joined tables."""
+    connection = schema_editor.connection
+    for trigger_name, _, _ in get_triggers(constraint, model, connection):
+        schema_editor.execute(
+            "DROP TRIGGER IF EXISTS {};".format(trigger_name), params=None
+        )
+
+
+def suspend_triggers(using=DEFAULT_DB_ALIAS):
+    """Drop the constraint triggers reading other tables, until resumed.
+
+    Until :code:`resume_triggers`, such triggers are not created either.
+    Connected to :code:`pre_migrate`, such that the tables they read can be
+    remade.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return
+    _suspended.add(using)
+    tables = connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name, tbl_name, sql FROM sqlite_master "
+            "WHERE type = 'trigger' AND name LIKE 'dct\\_\\_%' ESCAPE '\\';"
+        )
+        names = [
+            name
+            for name, table, sql in cursor.fetchall()
+            if _reads_other_tables(sql, table, tables)
+        ]
+        for name in names:
+            cursor.execute("DROP TRIGGER IF EXISTS {};".format(name))
+
+
+def resume_triggers(app_configs, using=DEFAULT_DB_ALIAS):
+    """(Re)create the triggers of the constraints of the apps' models.
+
+    Args:
+        app_configs (list of AppConfig):
+            Apps whose constraints to install, of the registry of the models
+            as they are installed, e.g. the state of the migrations applied.
+    """
+    from django_queryset_constraint.constraints import QuerysetConstraint
+
+    _suspended.discard(using)
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return
+    tables = connection.introspection.table_names()
+    with connection.schema_editor() as schema_editor:
+        for app_config in app_configs:
+            for model in app_config.get_models():
+                if (
+                    model._meta.db_table not in tables
+                    or not router.allow_migrate_model(using, model)
+                ):
+                    continue
+                for constraint in model._meta.constraints:
+                    if isinstance(constraint, QuerysetConstraint):
+                        install_triggers(constraint, schema_editor, model)
+
+
+@contextmanager
+def suspended_triggers(using=DEFAULT_DB_ALIAS, apps=global_apps):
+    """Suspend the constraint triggers reading other tables, within the block.
+
+    Required to remake the tables read by such triggers, e.g. to alter
+    their fields, via. schema editors outside of :code:`migrate`. The
+    triggers of the constraints of the models of apps are recreated
+    afterwards, thus those of constraints removed in the block are not.
+    """
+    suspend_triggers(using)
+    try:
+        yield
+    finally:
+        resume_triggers(apps.get_app_configs(), using)
+
+
+def suspend_app_triggers(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Suspend the triggers reading other tables, connected to pre_migrate."""
+    suspend_triggers(using)
+
+
+def install_app_triggers(sender, using=DEFAULT_DB_ALIAS, apps=None, **kwargs):
+    """(Re)create the triggers of the constraints of an app's models.
+
+    Connected to :code:`post_migrate`, using the state of the migrations
+    applied, such that the triggers of constraints removed by the migrations
+    are not.
+    """
+    app_configs = [sender]
+    if apps is not None:
+        try:
+            app_configs = [apps.get_app_config(sender.label)]
+        except LookupError:
+            # Without models in the migrations
+            app_configs = []
+    resume_triggers(app_configs, using)
+
+
+class SQLiteBackend:
+    """Install constraints as triggers aborting writes which violate them.
+
+    See :code:`django_queryset_constraint.backends.PostgreSQLBackend` for
+    the methods.
+    """
+
+    def check_supported(self, constraint):
+        return check_supported(constraint)
+
+    def compile_query(self, queryset, connection):
+        return compile_query(queryset, connection)
+
+    def install_function(self, constraint, schema_editor, model, error=None):
+        # The check is part of the triggers themselves
+        install_triggers(constraint, schema_editor, model, error)
+
+    def install_trigger(
+        self, constraint, schema_editor, model, defer=True, error=None
+    ):
+        # Triggers are never deferred on SQLite
+        install_triggers(constraint, schema_editor, model, error)
+
+    def remove_trigger(self, constraint, schema_editor, model):
+        remove_triggers(constraint, schema_editor, model)
+
+    def constraint_sql(self, constraint, model, schema_editor):
+        # Created along with the table, once it is renamed back if remade
+        schema_editor.deferred_sql.extend(
+            deferred_sql(constraint, model, schema_editor)
+        )
+        return ""
@@ -0,0 +1,280 @@
+import json
+from collections import namedtuple
+
+from django_queryset_constraint.generated import compile_row_sql
+
+# Table recording the strategies chosen for constraints with strategy="auto"
+STRATEGY_TABLE = "dct__strategy"
+# Number of groups assumed to be written per statement, weighing checking
+# the entire queryset once per statement against checking each group
+GROUPS_PER_STATEMENT = 10
+
+Decision = namedtuple(
+    "Decision",
+    ["strategy", "reason", "reltuples", "row_cost", "statement_cost"],
+)
+Decision.__new__.__defaults__ = (None, None, None)
+
+
+def _quote(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+def check_expression(constraint, model, connection):
+    """Compile a row-local constraint to the expression of a CHECK constraint.
+
+    Returns:
+        str: The expression, or :code:`None` if the constraint is not
+            row-local, i.e. cannot be enforced by a CHECK constraint.
+    """
+    if constraint.get_predicate(model) is None:
+        return None
+    query = constraint.get_queryset(model).query
+    where = compile_row_sql(query.where, query, connection)
+    if not where:
+        return None
+    return "NOT ({})".format(where)
+
+
+def explain_cost(queryset, connection):
+    """Estimate the total cost of queryset, as per EXPLAIN."""
+    sql, params = queryset.query.get_compiler(connection=connection).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]["Total Cost"]
+
+
+def estimate_rows(model, connection):
+    """Estimate the number of rows of model's table, as per pg_class."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s);",
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # Tables which were never analyzed have -1 reltuples
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+def decide(
+    constraint,
+    model,
+    connection,
+    groups_per_statement=GROUPS_PER_STATEMENT,
+    defer=True,
+):
+    """Choose the cheapest correct strategy of enforcing constraint.
+
+    Strategies are:
+
+    * 'check', a native CHECK constraint, for row-local constraints in
+      'enforce' mode, which need neither triggers nor queries. CHECK
+      constraints are checked immediately, thus only chosen for triggers
+      which would not be deferred either, see :code:`defer`.
+    * 'statement', a trigger checking the entire queryset once per statement.
+    * 'row', a trigger checking the group of each written row, for querysets
+      whose violations are confined to the groups written to, if checking
+      :code:`groups_per_statement` groups is estimated to cost less than
+      checking the entire queryset.
+
+    Costs are estimated by EXPLAIN, against the group of an existing row,
+    thus depend upon the size of the table.
+
+    Args:
+        defer (bool, optional):
+            Whether the triggers are deferred until commit, allowing
+            transactions to fix violating rows before then.
+
+    Returns:
+        Decision: The strategy, the reason it was chosen, the estimated rows
+            of the table, and the estimated costs of both trigger strategies.
+    """
+    if constraint.strategy != "auto":
+        return Decision(constraint.strategy, "Set explicitly")
+    if connection.vendor != "postgresql":
+        return Decision(
+            "statement",
+            "Only statement checks are supported on " + connection.vendor,
+        )
+    if (
+        not defer
+        and constraint.mode == "enforce"
+        and constraint.concurrency is None
+        and check_expression(constraint, model, connection) is not None
+    ):
+        return Decision(
+            "check", "The queryset is row-local, thus a CHECK constraint"
+        )
+    queryset = constraint.get_queryset(model, using=connection.alias)
+    if constraint._uses_trigger_row(queryset):
+        return Decision(
+            "statement", "The queryset already refers to the trigger row"
+        )
+    reltuples = estimate_rows(model, connection)
+    statement_cost = explain_cost(queryset, connection)
+    try:
+        constraint._get_row_queryset(model, queryset)
+    except ValueError:
+        return Decision(
+            "statement",
+            "The queryset cannot be checked per group",
+            reltuples,
+            None,
+            statement_cost,
+        )
+    key = constraint._get_key_field(model, queryset)
+    sample = (
+        model._base_manager.using(connection.alias)
+        .values_list(key.attname, flat=True)
+        .first()
+    )
+    if sample is None:
+        return Decision(
+            "row",
+            "The table is empty, checking groups scales as it grows",
+            reltuples,
+            None,
+            statement_cost,
+        )
+    row_cost = explain_cost(
+        queryset.filter(**{key.attname: sample}), connection
+    )
+    if row_cost * groups_per_statement < statement_cost:
+        strategy, comparison = "row", "more than"
+    else:
+        strategy, comparison = "statement", "at most"
+    return Decision(
+        strategy,
+        "Checking the queryset costs {:.2f}, {} {} groups at {:.2f} "
+        "each".format(
+            statement_cost, comparison, groups_per_statement, row_cost
+        ),
+        reltuples,
+        row_cost,
+        statement_cost,
+    )
+
+
+def recorded_decision(constraint, model, connection):
+    """Find the decision recorded upon installing constraint, if any."""
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s);", [STRATEGY_TABLE])
+        if cursor.fetchone()[0] is None:
+            return None
+        cursor.execute(
+            "SELECT strategy, reason, reltuples, row_cost, statement_cost "
+            "FROM {} WHERE constraint_name = %s AND table_name = %s;".format(
+                STRATEGY_TABLE
+            ),
+            [constraint.name, model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return None if row is None else Decision(*row)
+
+
+def resolve_strategy(constraint, model, connection, defer=True):
+    """Find the strategy constraint is, or is to be, installed with."""
+    if constraint.strategy != "auto":
+        return constraint.strategy
+    decision = recorded_decision(constraint, model, connection)
+    if decision is None:
+        decision = decide(constraint, model, connection, defer=defer)
+    return decision.strategy
+
+
+def record_sql(constraint, model, decision):
+    """Generate the SQL recording decision, run along with the install."""
+    return """
+        CREATE TABLE IF NOT EXISTS {table} (
+            constraint_name text NOT NULL,
+            table_name text NOT NULL,
+            strategy text NOT NULL,
+            reason text NOT NULL,
+            reltuples real,
+            row_cost double precision,
+            statement_cost double precision,
+            decided_at timestamptz NOT NULL DEFAULT now(),
+            PRIMARY KEY (constraint_name, table_name)
+        );
+        INSERT INTO {table} VALUES ({values}, now())
+        ON CONFLICT (constraint_name, table_name) DO UPDATE SET
+            strategy = EXCLUDED.strategy,
+            reason = EXCLUDED.reason,
+            reltuples = EXCLUDED.reltuples,
+            row_cost = EXCLUDED.row_cost,
+            statement_cost = EXCLUDED.statement_cost,
+            decided_at = EXCLUDED.decided_at;
+    """.format(
+        table=STRATEGY_TABLE,
+        values=", ".join(
+            _quote(value)
+            for value in [constraint.name, model._meta.db_table]
+            + list(decision)
+        ),
+    )
+
+
+def forget_sql(constraint, model):
+    """Generate the SQL forgetting the decision, run along with the removal."""
+    return """
+        DO $$
+        BEGIN
+            IF to_regclass('{table}') IS NOT NULL THEN
+                DELETE FROM {table}
+                WHERE constraint_name = {name} AND table_name = {model_table};
+            END IF;
+        END
+        $$;
+    """.format(
+        table=STRATEGY_TABLE,
+        name=_quote(constraint.name),
+        model_table=_quote(model._meta.db_table),
+    )
+
+
+def reevaluate(
+    model,
+    constraint,
+    connection,
+    groups_per_statement=GROUPS_PER_STATEMENT,
+    apply=True,
+):
+    """Decide the strategy of constraint again, e.g. as its table grew.
+
+    If the strategy changed, and apply is set, the constraint is reinstalled
+    using the new strategy, in a single transaction.
+
+    Returns:
+        tuple: The previously recorded strategy, if any, and the new
+            decision.
+    """
+    if constraint.strategy != "auto":
+        raise ValueError(
+            "Constraint '{}' does not use strategy='auto'".format(
+                constraint.name
+            )
+        )
+    previous = recorded_decision(constraint, model, connection)
+    decision = decide(constraint, model, connection, groups_per_statement)
+    previous_strategy = previous.strategy if previous is not None else None
+    if not apply:
+        return previous_strategy, decision
+    with connection.schema_editor() as editor:
+        if previous_strategy != decision.strategy:
+            editor.remove_constraint(model, constraint)
+            editor.execute(record_sql(constraint, model, decision), params=None)
+            editor.add_constraint(model, constraint)
+        else:
+            editor.execute(record_sql(constraint, model, decision), params=None)
+    return previous_strategy, decision
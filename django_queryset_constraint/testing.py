@@ -0,0 +1,296 @@
+import hashlib
+import os
+import sys
+from contextlib import ExitStack, contextmanager
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import DatabaseError, connections, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.test.runner import DiscoverRunner
+
+from django_queryset_constraint.constraints import (
+    BULK_LOAD_SETTING,
+    CHECKED_TABLE,
+    QUEUE_TABLE,
+    SHADOW_LOG_TABLE,
+)
+
+# Helper tables holding data written by the triggers, emptied by fast_flush()
+HELPER_TABLES = [SHADOW_LOG_TABLE, QUEUE_TABLE, CHECKED_TABLE]
+
+
+def schema_digest(connection):
+    """Digest everything the migrated schema of connection is built from.
+
+    That is, the migration files of all apps, the modules generating the
+    trigger SQL and the version of Django. Comments are skipped, as the
+    header of generated migrations contains the time they were generated.
+    """
+    hasher = hashlib.sha256(django.get_version().encode("utf8"))
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    files = [
+        sys.modules[type(migration).__module__].__file__
+        for migration in loader.disk_migrations.values()
+    ]
+    package = os.path.dirname(__file__)
+    files += [
+        os.path.join(package, name)
+        for name in os.listdir(package)
+        if name.endswith(".py")
+    ]
+    for path in sorted(files):
+        hasher.update(path.encode("utf8"))
+        with open(path, "rb") as handle:
+            for line in handle:
+                if not line.lstrip().startswith(b"#"):
+                    hasher.update(line)
+    hasher.update(connection.settings_dict["ENGINE"].encode("utf8"))
+    return hasher.hexdigest()[:12]
+
+
+class TemplateDatabaseCreationMixin:
+    """Create the PostgreSQL test databases as clones of a template database.
+
+    The first run migrates the test database as usual, and then snapshots it
+    into a template database named after the test database and the
+    :code:`schema_digest`. Later runs, and the :code:`--parallel` workers,
+    clone the template using :code:`CREATE DATABASE ... TEMPLATE`, which
+    copies the files of the database, rather than replaying the migrations
+    and compiling and installing every constraint trigger again.
+
+    Stale templates of the test database are dropped as a new one is built.
+    """
+
+    def _get_template_db_name(self):
+        return "{}_template_{}".format(
+            self._get_test_db_name(), schema_digest(self.connection)
+        )
+
+    def _template_exists(self, name):
+        with self._nodb_connection.cursor() as cursor:
+            return self._database_exists(cursor, name)
+
+    def _clone_database(self, source, target, keepdb=False):
+        """Create target as a copy of source, replacing any existing one."""
+        with self._nodb_connection.cursor() as cursor:
+            if self._database_exists(cursor, target):
+                if keepdb:
+                    return
+                cursor.execute(
+                    "DROP DATABASE {};".format(self._quote_name(target))
+                )
+            cursor.execute(
+                "CREATE DATABASE {} {};".format(
+                    self._quote_name(target),
+                    self._get_database_create_suffix(template=source),
+                )
+            )
+
+    def _build_template(self, source, template, verbosity):
+        """Snapshot the migrated source database into template."""
+        if verbosity >= 1:
+            self.log("Building template database {}...".format(template))
+        # CREATE DATABASE ... TEMPLATE requires closing connections to source
+        self.connection.close()
+        with self._nodb_connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT datname FROM pg_database "
+                "WHERE datname LIKE %s AND datname <> %s;",
+                [source.replace("_", "\\_") + "\\_template\\_%", template],
+            )
+            for (stale,) in cursor.fetchall():
+                cursor.execute(
+                    "DROP DATABASE IF EXISTS {};".format(
+                        self._quote_name(stale)
+                    )
+                )
+        try:
+            self._clone_database(source, template)
+        except DatabaseError as exc:
+            # Another run may be building the same template concurrently
+            self.log("Got an error building the template database: %s" % exc)
+
+    def create_test_db(
+        self, verbosity=1, autoclobber=False, serialize=True, keepdb=False
+    ):
+        test_database_name = self._get_test_db_name()
+        # Named before creating, which changes the name of the database
+        template = self.template_name = self._get_template_db_name()
+        with self._nodb_connection.cursor() as cursor:
+            exists = self._database_exists(cursor, test_database_name)
+        if keepdb or (exists and not autoclobber):
+            # Leave keeping, or prompting before replacing, to Django
+            name = super().create_test_db(
+                verbosity, autoclobber, serialize, keepdb
+            )
+            if not self._template_exists(template):
+                self._build_template(name, template, verbosity)
+            return name
+        if not self._template_exists(template):
+            name = super().create_test_db(
+                verbosity, autoclobber, serialize, keepdb
+            )
+            self._build_template(name, template, verbosity)
+            self.connection.ensure_connection()
+            return name
+
+        if verbosity >= 1:
+            self.log(
+                "Cloning test database for alias {} from {}...".format(
+                    self._get_database_display_str(
+                        verbosity, test_database_name
+                    ),
+                    template,
+                )
+            )
+        self.connection.close()
+        self._clone_database(template, test_database_name)
+        settings.DATABASES[self.connection.alias]["NAME"] = test_database_name
+        self.connection.settings_dict["NAME"] = test_database_name
+        if serialize:
+            self.connection._test_serialized_contents = (
+                self.serialize_db_to_string()
+            )
+        call_command("createcachetable", database=self.connection.alias)
+        self.connection.ensure_connection()
+        return test_database_name
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        template = getattr(self, "template_name", None)
+        if template is None or not self._template_exists(template):
+            return super()._clone_test_db(suffix, verbosity, keepdb)
+        self.connection.close()
+        target = self.get_test_db_clone_settings(suffix)["NAME"]
+        self._clone_database(template, target, keepdb)
+
+
+def use_template_database(connection):
+    """Make connection create its test databases from a template database.
+
+    Has no effect on other databases than PostgreSQL.
+    """
+    creation_class = type(connection.creation)
+    if connection.vendor != "postgresql" or issubclass(
+        creation_class, TemplateDatabaseCreationMixin
+    ):
+        return
+    connection.creation = type(
+        "Template" + creation_class.__name__,
+        (TemplateDatabaseCreationMixin, creation_class),
+        {},
+    )(connection)
+
+
+class TemplateDatabaseMixin:
+    """Test runner mixin creating the test databases from a template.
+
+    See :code:`TemplateDatabaseCreationMixin`. To be mixed into
+    :code:`DiscoverRunner`, or a subclass thereof::
+
+        class TestRunner(TemplateDatabaseMixin, DiscoverRunner):
+            pass
+    """
+
+    def setup_databases(self, **kwargs):
+        for connection in connections.all():
+            use_template_database(connection)
+        return super().setup_databases(**kwargs)
+
+
+class TemplateDatabaseRunner(TemplateDatabaseMixin, DiscoverRunner):
+    """Test runner creating the test databases from a template."""
+
+
+@contextmanager
+def bypass_triggers(using):
+    """Bypass all constraint triggers of the session within the block.
+
+    Unlike :code:`bulk_load`, the constraints are not checked afterwards,
+    thus this is only meant for loading trusted data, such as fixtures.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config(%s, coalesce(string_agg(tgname, ' '), ''), false) "
+            "FROM pg_trigger WHERE tgname LIKE 'dct\\_\\_trig\\_\\_%%';",
+            [BULK_LOAD_SETTING],
+        )
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config(%s, '', false);", [BULK_LOAD_SETTING]
+            )
+
+
+def fast_flush(using):
+    """Empty all tables of the installed models, and the helper tables.
+
+    Rows are deleted in a single transaction, with the constraint triggers
+    bypassed and foreign keys checked at commit, which is considerably faster
+    than truncating the mostly empty tables of a test database.
+    """
+    connection = connections[using]
+    tables = connection.introspection.django_table_names(
+        only_existing=True, include_views=False
+    )
+    with connection.cursor() as cursor:
+        for table in HELPER_TABLES:
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", [table])
+            if cursor.fetchone()[0]:
+                tables.append(table)
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config(%s, coalesce(string_agg(tgname, ' '), ''), true) "
+                "FROM pg_trigger WHERE tgname LIKE 'dct\\_\\_trig\\_\\_%%';",
+                [BULK_LOAD_SETTING],
+            )
+            cursor.execute("SET CONSTRAINTS ALL DEFERRED;")
+            cursor.execute(
+                "".join(
+                    "DELETE FROM {};".format(connection.ops.quote_name(table))
+                    for table in tables
+                )
+            )
+
+
+class FastFlushMixin:
+    """TransactionTestCase mixin loading and flushing without the triggers.
+
+    Fixtures, and the serialized contents of :code:`serialized_rollback`, are
+    loaded with the constraint triggers bypassed, and the database is flushed
+    using :code:`fast_flush`, rather than the :code:`flush` command.
+    Databases other than PostgreSQL, and test cases limiting their
+    :code:`available_apps`, are flushed as usual.
+    """
+
+    def _fixture_setup(self):
+        names = list(self._databases_names(include_mirrors=False))
+        with ExitStack() as stack:
+            for name in names:
+                stack.enter_context(bypass_triggers(name))
+            super()._fixture_setup()
+
+    def _fixture_teardown(self):
+        names = list(self._databases_names(include_mirrors=False))
+        if self.available_apps is not None or any(
+            connections[name].vendor != "postgresql" for name in names
+        ):
+            return super()._fixture_teardown()
+        for name in names:
+            fast_flush(name)
+            inhibit_post_migrate = self.serialized_rollback and hasattr(
+                connections[name], "_test_serialized_contents"
+            )
+            if not inhibit_post_migrate:
+                emit_post_migrate_signal(
+                    verbosity=0, interactive=False, db=name
+                )
@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TransactionTestCase
+from parameterized import parameterized
+
+from django_queryset_constraint.constraints import get_queryset_constraint
+from django_queryset_constraint.models import (
+    AllowAll,
+    AllowOnly1ObjectQC,
+    Disallow1QC,
+    Disallow12InQC,
+    PizzaNC,
+    PizzaTopping,
+    PizzaToppingNC,
+    ToppingNC,
+)
+from django_queryset_constraint.tests.test_validation import without_triggers
+
+
+class IterViolationsTests(TransactionTestCase):
+    def setUp(self):
+        for age in [0, 1, 2, 1]:
+            AllowAll.objects.create(age=age)
+
+    @parameterized.expand([[1], [2], [100]])
+    def test_rows(self, chunk_size):
+        constraint = Disallow1QC._meta.constraints[0]
+        rows = list(constraint.iter_violations(AllowAll, chunk_size=chunk_size))
+        self.assertEqual([row["age"] for row in rows], [1, 1])
+        self.assertEqual(set(rows[0]), {"id", "age"})
+
+    def test_sliced_queryset(self):
+        constraint = AllowOnly1ObjectQC._meta.constraints[0]
+        rows = list(constraint.iter_violations(AllowAll))
+        self.assertEqual(len(rows), 3)
+
+    def test_is_lazy(self):
+        constraint = Disallow1QC._meta.constraints[0]
+        with self.assertNumQueries(0):
+            constraint.iter_violations(AllowAll)
+
+    def test_grouped_rows(self):
+        at_most_5 = get_queryset_constraint(PizzaTopping, "At most 5 toppings")
+        pizza = PizzaNC.objects.create(name="Soggy")
+        for x in range(6):
+            topping = ToppingNC.objects.create(name=str(x))
+            PizzaToppingNC.objects.create(pizza=pizza, topping=topping)
+        rows = list(at_most_5.iter_violations(PizzaToppingNC))
+        self.assertEqual(rows, [{"pizza": pizza.pk, "num_toppings": 6}])
+
+
+class AuditCommandTests(TransactionTestCase):
+    def setUp(self):
+        def create_invalid():
+            Disallow1QC.objects.create(age=1)
+            Disallow12InQC.objects.create(age=1)
+            Disallow12InQC.objects.create(age=2)
+
+        without_triggers(create_invalid)
+
+    @parameterized.expand([[1], [4]])
+    def test_audit(self, workers):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "audit.jsonl")
+            err = StringIO()
+            call_command(
+                "audit_constraints",
+                "django_queryset_constraint.Disallow1QC",
+                "django_queryset_constraint.Disallow12InQC",
+                "--workers={}".format(workers),
+                "--chunk-size=1",
+                "--output={}".format(path),
+                stderr=err,
+            )
+            with open(path) as output:
+                lines = [json.loads(line) for line in output]
+        self.assertEqual(
+            sorted((line["constraint"], line["row"]["age"]) for line in lines),
+            [
+                ("QC: Disallow age in list", 1),
+                ("QC: Disallow age in list", 2),
+                ("QC: Disallow age=1", 1),
+            ],
+        )
+        self.assertEqual(
+            lines[0]["model"][: len("django_queryset_constraint.")],
+            "django_queryset_constraint.",
+        )
+        self.assertIn("QC: Disallow age in list: 2 violations", err.getvalue())
+
+    def test_audit_stdout(self):
+        out = StringIO()
+        call_command(
+            "audit_constraints",
+            "django_queryset_constraint.Disallow1QC",
+            stdout=out,
+            stderr=StringIO(),
+        )
+        line = json.loads(out.getvalue())
+        self.assertEqual(line["constraint"], "QC: Disallow age=1")
+
+    def test_invalid_workers(self):
+        with self.assertRaises(CommandError):
+            call_command("audit_constraints", "--workers=0")
@@ -0,0 +1,128 @@
+from django.db import connection, transaction
+from django.db.transaction import TransactionManagementError
+from django.db.utils import IntegrityError
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from django_queryset_constraint.bulk import bulk_create_isolating, bulk_load
+from django_queryset_constraint.checkpoint import constraint_checkpoint
+from django_queryset_constraint.exceptions import QuerysetConstraintViolation
+from django_queryset_constraint.models import (
+    Disallow1QC,
+    Disallow1TriggerNewQC,
+    Pizza,
+    PizzaTopping,
+    Topping,
+)
+
+
+class BulkLoadTests(TransactionTestCase):
+    def setUp(self):
+        self.pizzas = [Pizza.objects.create(name=str(x)) for x in range(3)]
+        self.toppings = [Topping.objects.create(name=str(x)) for x in range(6)]
+
+    def pizza_toppings(self, num_toppings):
+        return [
+            PizzaTopping(pizza=pizza, topping=topping)
+            for pizza in self.pizzas
+            for topping in self.toppings[:num_toppings]
+        ]
+
+    def test_valid_load(self):
+        with bulk_load():
+            PizzaTopping.objects.bulk_create(self.pizza_toppings(5))
+            Disallow1QC.objects.create(age=2)
+        self.assertEqual(PizzaTopping.objects.count(), 15)
+
+    def test_invalid_load(self):
+        with self.assertRaisesMessage(
+            IntegrityError, "Invariant broken: At most 5 toppings"
+        ) as context:
+            with bulk_load():
+                PizzaTopping.objects.bulk_create(self.pizza_toppings(6))
+        self.assertFalse(PizzaTopping.objects.exists())
+        self.assertIsInstance(context.exception, QuerysetConstraintViolation)
+        self.assertEqual(
+            context.exception.constraint_name, "At most 5 toppings"
+        )
+
+    def test_triggers_are_bypassed(self):
+        with bulk_load(["At most 5 toppings"]):
+            PizzaTopping.objects.bulk_create(self.pizza_toppings(6))
+            # The checkpoint would raise, had the trigger not been bypassed
+            constraint_checkpoint(["At most 5 toppings"])
+            PizzaTopping.objects.filter(topping=self.toppings[5]).delete()
+        self.assertEqual(PizzaTopping.objects.count(), 15)
+
+    def test_other_triggers_are_not_bypassed(self):
+        with self.assertRaises(IntegrityError):
+            with bulk_load(["No pineapple"]):
+                PizzaTopping.objects.bulk_create(self.pizza_toppings(6))
+                constraint_checkpoint(["At most 5 toppings"])
+
+    def test_trigger_row_constraints_are_not_bypassed(self):
+        with self.assertRaises(IntegrityError):
+            with bulk_load():
+                Disallow1TriggerNewQC.objects.create(age=1)
+                constraint_checkpoint()
+
+    def test_bypass_ends_with_transaction(self):
+        with bulk_load():
+            pass
+        with self.assertRaises(IntegrityError):
+            Disallow1QC.objects.create(age=1)
+
+    def test_outermost_only(self):
+        with self.assertRaises(TransactionManagementError):
+            with transaction.atomic():
+                with bulk_load():
+                    pass
+
+
+class BulkCreateIsolatingTests(TransactionTestCase):
+    def test_isolates_violating_rows(self):
+        rows = [Disallow1QC(age=age % 7) for age in range(100)]
+        failed = bulk_create_isolating(Disallow1QC, rows, batch_size=30)
+        self.assertEqual(len(failed), 15)
+        self.assertEqual(Disallow1QC.objects.count(), 85)
+        self.assertFalse(Disallow1QC.objects.filter(age=1).exists())
+        for row, error in failed:
+            self.assertEqual(row.age, 1)
+            self.assertIsNone(row.pk)
+            self.assertTrue(row._state.adding)
+            self.assertIsInstance(error, QuerysetConstraintViolation)
+            self.assertEqual(error.constraint_name, "QC: Disallow age=1")
+
+    def test_isolates_rows_exceeding_groups(self):
+        pizza = Pizza.objects.create(name="Hawaii")
+        toppings = [Topping.objects.create(name=str(x)) for x in range(8)]
+        rows = [
+            PizzaTopping(pizza=pizza, topping=topping) for topping in toppings
+        ]
+        failed = bulk_create_isolating(PizzaTopping, rows)
+        # The rows after the first five exceed the limit by themselves
+        self.assertEqual([row for row, _ in failed], rows[5:])
+        self.assertEqual(failed[0][1].keys, [pizza.pk])
+        self.assertEqual(PizzaTopping.objects.count(), 5)
+
+    def test_other_integrity_errors(self):
+        pizza = Pizza.objects.create(name="Hawaii")
+        topping = Topping.objects.create(name="Ham")
+        rows = [PizzaTopping(pizza=pizza, topping=topping) for _ in range(2)]
+        failed = bulk_create_isolating(PizzaTopping, rows)
+        self.assertEqual([row for row, _ in failed], rows[1:])
+        self.assertNotIsInstance(failed[0][1], QuerysetConstraintViolation)
+        self.assertIsInstance(failed[0][1], IntegrityError)
+
+    def test_trigger_names_resolved_once(self):
+        rows = [Disallow1QC(age=age % 7) for age in range(20)]
+        with CaptureQueriesContext(connection) as queries:
+            failed = bulk_create_isolating(Disallow1QC, rows, batch_size=5)
+        self.assertEqual(len(failed), 3)
+        self.assertEqual(
+            sum("pg_trigger" in query["sql"] for query in queries), 1
+        )
+
+    def test_invalid_batch_size(self):
+        with self.assertRaises(ValueError):
+            bulk_create_isolating(Disallow1QC, [], batch_size=0)
@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.db.utils import IntegrityError
+from django.test import TransactionTestCase
+
+from django_queryset_constraint.checkpoint import (
+    constraint_checkpoint,
+    get_trigger_names,
+)
+from django_queryset_constraint.constraints import get_queryset_constraints
+from django_queryset_constraint.models import (
+    Disallow1QC,
+    Pizza,
+    PizzaTopping,
+    Topping,
+)
+
+
+class CheckpointTests(TransactionTestCase):
+    def setUp(self):
+        self.pizza = Pizza.objects.create(name="Django Special")
+        self.toppings = [Topping.objects.create(name=str(x)) for x in range(6)]
+
+    def add_toppings(self, toppings):
+        for topping in toppings:
+            PizzaTopping.objects.create(pizza=self.pizza, topping=topping)
+
+    def test_trigger_names(self):
+        self.assertGreaterEqual(
+            len(get_trigger_names()), len(get_queryset_constraints())
+        )
+        self.assertEqual(len(get_trigger_names(["At most 5 toppings"])), 1)
+        # Along with the trigger of the toppings read via. the join
+        constraint = PizzaTopping._meta.constraints[1]
+        self.assertEqual(
+            get_trigger_names(["No pineapple"]),
+            [
+                constraint._generate_names(PizzaTopping._meta.db_table)[1],
+                constraint._generate_names(
+                    PizzaTopping._meta.db_table + ":topping"
+                )[1],
+            ],
+        )
+        constraint = Disallow1QC._meta.constraints[0]
+        self.assertEqual(
+            get_trigger_names([constraint]),
+            [constraint._generate_names(Disallow1QC._meta.db_table)[1]],
+        )
+        self.assertEqual(get_trigger_names([]), [])
+        # Only those installed upon the toppings
+        self.assertEqual(
+            get_trigger_names(
+                ["No pineapple"], tables=[Topping._meta.db_table]
+            ),
+            [
+                PizzaTopping._meta.constraints[1]._generate_names(
+                    PizzaTopping._meta.db_table + ":topping"
+                )[1]
+            ],
+        )
+
+    def test_checkpoint_raises_early(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                self.add_toppings(self.toppings)
+                constraint_checkpoint(["At most 5 toppings"])
+                # Never reached
+                self.fail()
+
+    def test_checkpoint_only_checks_given_constraints(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                self.add_toppings(self.toppings)
+                constraint_checkpoint(["No pineapple"])
+                constraint_checkpoint([])
+            # Commit raises instead
+        self.assertFalse(PizzaTopping.objects.exists())
+
+    def test_checkpoint_valid(self):
+        with transaction.atomic():
+            self.add_toppings(self.toppings[:5])
+            constraint_checkpoint()
+            Disallow1QC.objects.create(age=2)
+            constraint_checkpoint()
+        self.assertEqual(PizzaTopping.objects.count(), 5)
+
+    def test_context_manager(self):
+        with transaction.atomic():
+            with constraint_checkpoint():
+                self.add_toppings(self.toppings[:5])
+            with self.assertRaises(IntegrityError):
+                with constraint_checkpoint(["At most 5 toppings"]):
+                    self.add_toppings(self.toppings[5:])
+            transaction.set_rollback(True)
+
+    def test_checkpoint_after_join_table_update(self):
+        self.add_toppings(self.toppings[:1])
+        with self.assertRaisesMessage(IntegrityError, "No pineapple"):
+            with transaction.atomic():
+                Topping.objects.filter(pk=self.toppings[0].pk).update(
+                    name="Pineapple"
+                )
+                constraint_checkpoint(["No pineapple"])
+                # Never reached
+                self.fail()
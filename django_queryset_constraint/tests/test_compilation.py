@@ -0,0 +1,143 @@
+import copy
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection, models
+from django.db.migrations.state import ModelState, ProjectState
+from django.test import TestCase, TransactionTestCase
+
+from django_queryset_constraint import M, QuerysetConstraint, constraints
+from django_queryset_constraint.compilation import compile_constraints
+from django_queryset_constraint.models import Disallow1QC, Pizza, Topping
+from django_queryset_constraint.tests.test_rollout import count_compilations
+from django_queryset_constraint.utils import model_context
+
+
+def all_constraints():
+    return [
+        (model, constraint)
+        for model in apps.get_app_config(
+            "django_queryset_constraint"
+        ).get_models()
+        for constraint in model._meta.constraints
+        if isinstance(constraint, QuerysetConstraint)
+    ]
+
+
+class ModelContextTests(TestCase):
+    def test_defaults_to_context(self):
+        m_object = copy.deepcopy(M().objects.all())
+        token = model_context.set(("django_queryset_constraint", "pizza"))
+        try:
+            self.assertEqual(m_object.construct_queryset().model, Pizza)
+            # Nested reconstructions restore the context of their caller
+            queryset = m_object.construct_queryset(
+                "django_queryset_constraint", "topping"
+            )
+            self.assertEqual(queryset.model, Topping)
+            self.assertEqual(
+                model_context.get(), ("django_queryset_constraint", "pizza")
+            )
+        finally:
+            model_context.reset(token)
+        self.assertEqual(model_context.get(), (None, None))
+
+    def test_concurrent_reconstruction(self):
+        def compile_all(_):
+            return [
+                str(constraint.get_queryset(model).query)
+                for model, constraint in all_constraints()
+            ]
+
+        expected = compile_all(None)
+        with ThreadPoolExecutor(4) as executor:
+            for queries in executor.map(compile_all, range(8)):
+                self.assertEqual(queries, expected)
+
+    def test_pickle(self):
+        for model, constraint in all_constraints():
+            # Compiled predicates are not pickled
+            constraint.get_predicate(model)
+            unpickled = pickle.loads(pickle.dumps(constraint))
+            self.assertEqual(unpickled, constraint)
+            self.assertEqual(
+                str(unpickled.get_queryset(model).query),
+                str(constraint.get_queryset(model).query),
+            )
+
+
+class CompileConstraintsTests(TransactionTestCase):
+    def setUp(self):
+        constraints._function_sql_cache.clear()
+
+    def test_compile_constraints(self):
+        constraint = Disallow1QC._meta.constraints[0]
+        self.assertEqual(
+            compile_constraints([(Disallow1QC, constraint)], processes=2), 1
+        )
+        self.assertEqual(len(constraints._function_sql_cache), 1)
+        sql = list(constraints._function_sql_cache.values())[0]
+        compilations = count_compilations(
+            lambda: self.assertEqual(constraint._function_sql(Disallow1QC), sql)
+        )
+        self.assertEqual(compilations, [])
+        self.assertEqual(compile_constraints([]), 0)
+
+    def test_connections_kept_open(self):
+        connection.ensure_connection()
+        opened = connection.connection
+        constraint = Disallow1QC._meta.constraints[0]
+        compile_constraints([(Disallow1QC, constraint)], processes=1)
+        self.assertIs(connection.connection, opened)
+        self.assertFalse(opened.closed)
+
+    def test_historical_models(self):
+        constraint = Disallow1QC._meta.constraints[0]
+        model_state = ModelState.from_model(Disallow1QC)
+        model_state.fields.append(("extra", models.IntegerField(null=True)))
+        state = ProjectState()
+        state.add_model(model_state)
+        historical = state.apps.get_model(
+            "django_queryset_constraint", "Disallow1QC"
+        )
+        # Left to be compiled against the historical model
+        self.assertEqual(
+            compile_constraints([(historical, constraint)], processes=1), 0
+        )
+        # Unchanged models compile as their current counterparts
+        state = ProjectState.from_apps(apps)
+        historical = state.apps.get_model(
+            "django_queryset_constraint", "Disallow1QC"
+        )
+        self.assertEqual(
+            compile_constraints([(historical, constraint)], processes=1), 1
+        )
+        compilations = count_compilations(
+            lambda: constraint._function_sql(historical)
+        )
+        self.assertEqual(compilations, [])
+
+    def sqlmigrate(self, *args):
+        out = StringIO()
+        call_command(
+            "sqlmigrate",
+            "django_queryset_constraint",
+            "0001",
+            *args,
+            stdout=out
+        )
+        return out.getvalue()
+
+    def test_sqlmigrate(self):
+        output = []
+        compilations = count_compilations(
+            lambda: output.append(self.sqlmigrate("--processes=2"))
+        )
+        # All constraints were compiled by the workers
+        self.assertEqual(compilations, [])
+        for model, constraint in all_constraints():
+            _, trigger_name = constraint._generate_names(model._meta.db_table)
+            self.assertIn(trigger_name, output[0])
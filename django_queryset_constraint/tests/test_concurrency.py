@@ -0,0 +1,60 @@
+import threading
+
+from django.db import connection, transaction
+from django.db.utils import IntegrityError
+from django.test import TestCase, TransactionTestCase
+from parameterized import parameterized
+
+from django_queryset_constraint import M, QuerysetConstraint
+from django_queryset_constraint.models import UniqueAgeLockedQC
+
+
+class AdvisoryLockArgumentTests(TestCase):
+    def test_invalid_concurrency(self):
+        with self.assertRaises(ValueError):
+            QuerysetConstraint(M().objects.all(), "name", concurrency="lock")
+
+    def test_lock_is_taken_before_check(self):
+        constraint = UniqueAgeLockedQC._meta.constraints[0]
+        sql = constraint._function_sql(UniqueAgeLockedQC)
+        self.assertIn("pg_advisory_xact_lock", sql)
+        self.assertIn('hashtext(NEW."age"::text)', sql)
+        self.assertLess(sql.index("pg_advisory"), sql.index("IF EXISTS"))
+        self.assertNotIn(
+            "pg_advisory",
+            constraint.clone(concurrency=None)._function_sql(UniqueAgeLockedQC),
+        )
+
+
+class AdvisoryLockTests(TransactionTestCase):
+    def write_concurrently(self, ages):
+        """Write each age in its own transaction, committing together."""
+        barrier = threading.Barrier(len(ages))
+        errors = []
+
+        def write(age):
+            try:
+                with transaction.atomic():
+                    UniqueAgeLockedQC.objects.create(age=age)
+                    barrier.wait()
+            except IntegrityError as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write, args=[age]) for age in ages]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    @parameterized.expand([[2], [4]])
+    def test_same_group_is_serialized(self, num_writers):
+        errors = self.write_concurrently([5] * num_writers)
+        self.assertEqual(len(errors), num_writers - 1)
+        self.assertEqual(UniqueAgeLockedQC.objects.count(), 1)
+
+    def test_other_groups_are_independent(self):
+        self.assertEqual(self.write_concurrently([1, 2, 3]), [])
+        self.assertEqual(UniqueAgeLockedQC.objects.count(), 3)
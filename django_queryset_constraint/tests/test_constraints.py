@@ -1,8 +1,27 @@
+from unittest import mock
+
+from django.apps import apps
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import connection
+from django.db.models.signals import post_save, pre_save
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from parameterized import parameterized
 
 from django_queryset_constraint import M, QuerysetConstraint
-from django_queryset_constraint.models import Pizza
+from django_queryset_constraint.models import (
+    AllowOnly1ObjectQC,
+    Disallow1QC,
+    Disallow1TriggerNewQC,
+    Disallow12InQC,
+    Pizza,
+    PizzaTopping,
+    Topping,
+)
+
+
+def disallow_1():
+    return M().objects.filter(age=1)
 
 
 class QuerysetConstraintTests(TestCase):
@@ -58,3 +77,169 @@ class QuerysetConstraintTests(TestCase):
         reconstructed = QuerysetConstraint(*args, **kwargs)
         self.assertEqual(constraint, reconstructed)
         self.assertEqual(str(constraint), str(reconstructed))
+
+    @parameterized.expand(
+        [
+            ["Disallow1SubqueryQC"],
+            ["Disallow13SubquerySliceQC"],
+            ["Disallow1SubqueryWith7SubqueryQC"],
+        ]
+    )
+    def test_get_queryset_nested_m_objects(self, model_name):
+        model = apps.get_model("django_queryset_constraint", model_name)
+        constraint = model._meta.constraints[0]
+        self.assertFalse(constraint.m_object.finalized)
+        self.assertFalse(constraint.get_queryset(model).exists())
+        # The recorded M object is left untouched
+        self.assertFalse(constraint.m_object.finalized)
+
+    @parameterized.expand(
+        [
+            [disallow_1],
+            ["django_queryset_constraint.tests.test_constraints.disallow_1"],
+        ]
+    )
+    def test_lazy_queryset(self, queryset):
+        with mock.patch(
+            __name__ + ".disallow_1", side_effect=disallow_1
+        ) as counted:
+            # The dotted path is imported, thus patched, once evaluated
+            if callable(queryset):
+                queryset = counted
+            constraint = QuerysetConstraint(queryset, name="QC: Disallow age=1")
+            self.assertEqual(counted.mock_calls, [])
+            eager = Disallow1QC._meta.constraints[0]
+            self.assertEqual(constraint, eager)
+            _, _, kwargs = constraint.deconstruct()
+            self.assertEqual(
+                str(constraint.get_queryset(Disallow1QC).query),
+                str(eager.get_queryset(Disallow1QC).query),
+            )
+            # Evaluated only once
+            self.assertEqual(len(counted.mock_calls), 1)
+        self.assertEqual(kwargs["queryset"], disallow_1())
+
+    def test_lazy_queryset_not_m_object(self):
+        with self.assertRaises(ValueError):
+            QuerysetConstraint(42, name="n1")
+        constraint = QuerysetConstraint(lambda: 42, name="n1")
+        with self.assertRaisesMessage(ValueError, "should evaluate to an M"):
+            constraint.deconstruct()
+
+
+class ValidateTests(TestCase):
+    def validate(self, model, **kwargs):
+        instance = model(**kwargs)
+        model._meta.constraints[0].validate(model, instance)
+        # Validation never leaves anything behind
+        self.assertIsNone(instance.pk)
+        self.assertTrue(instance._state.adding)
+        self.assertFalse(model.objects.exists())
+
+    @parameterized.expand(
+        [
+            [Disallow1QC, 0, False],
+            [Disallow1QC, 1, True],
+            [Disallow12InQC, 1, True],
+            [Disallow12InQC, 2, True],
+            [Disallow12InQC, 3, False],
+            # Trigger-only constraints are left for the trigger
+            [Disallow1TriggerNewQC, 1, False],
+        ]
+    )
+    def test_validate(self, model, age, raises):
+        if raises:
+            with self.assertRaisesMessage(ValidationError, "Invariant broken"):
+                self.validate(model, age=age)
+        else:
+            self.validate(model, age=age)
+
+    def test_validate_whole_table(self):
+        AllowOnly1ObjectQC.objects.create(age=0)
+        constraint = AllowOnly1ObjectQC._meta.constraints[0]
+        with self.assertRaises(ValidationError):
+            constraint.validate(AllowOnly1ObjectQC, AllowOnly1ObjectQC(age=0))
+        self.assertEqual(AllowOnly1ObjectQC.objects.count(), 1)
+
+    def test_validate_exclude(self):
+        constraint = Disallow1QC._meta.constraints[0]
+        constraint.validate(Disallow1QC, Disallow1QC(age=1), exclude=["age"])
+        with self.assertRaises(ValidationError):
+            constraint.validate(Disallow1QC, Disallow1QC(age=1), exclude=["id"])
+
+    def test_validate_exclude_joined(self):
+        pineapple = Topping.objects.create(name="Pineapple")
+        constraint = PizzaTopping._meta.constraints[1]
+        instance = PizzaTopping(pizza=Pizza.objects.create(), topping=pineapple)
+        constraint.validate(PizzaTopping, instance, exclude=["topping"])
+        with self.assertRaises(ValidationError):
+            constraint.validate(PizzaTopping, instance, exclude=["pizza"])
+
+    def test_validate_writes_nothing(self):
+        saved = []
+
+        def receiver(**kwargs):
+            saved.append(kwargs["instance"])
+
+        pre_save.connect(receiver)
+        post_save.connect(receiver)
+        try:
+            with CaptureQueriesContext(connection) as context:
+                with self.assertRaises(ValidationError):
+                    self.validate(Disallow1QC, age=1)
+        finally:
+            pre_save.disconnect(receiver)
+            post_save.disconnect(receiver)
+        self.assertEqual(saved, [])
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn("INSERT", context.captured_queries[0]["sql"])
+        self.assertNotIn("SAVEPOINT", context.captured_queries[0]["sql"])
+
+    def test_validate_not_null(self):
+        # Invalid field values are left to full_clean
+        self.validate(Disallow1QC, age=None)
+
+    def test_validate_existing(self):
+        obj = Disallow12InQC.objects.create(age=3)
+        constraint = Disallow12InQC._meta.constraints[0]
+        obj.age = 1
+        with self.assertRaises(ValidationError):
+            constraint.validate(Disallow12InQC, obj)
+        obj.age = 4
+        constraint.validate(Disallow12InQC, obj)
+        obj.refresh_from_db()
+        self.assertEqual(obj.age, 3)
+
+
+class FullCleanTests(TestCase):
+    def setUp(self):
+        self.pizza = Pizza.objects.create(name="Django Special")
+        self.other_pizza = Pizza.objects.create(name="Django Simple")
+        for name in ["Cheese", "Ham", "Pepperoni", "Mushrooms", "Onions"]:
+            topping = Topping.objects.create(name=name)
+            PizzaTopping.objects.create(pizza=self.pizza, topping=topping)
+        self.garlic = Topping.objects.create(name="Garlic")
+        self.pineapple = Topping.objects.create(name="Pineapple")
+
+    def test_full_clean_valid(self):
+        PizzaTopping(pizza=self.other_pizza, topping=self.garlic).full_clean()
+        PizzaTopping(pizza=self.pizza, topping=self.garlic).full_clean(
+            exclude=["pizza"]
+        )
+
+    def test_full_clean_invalid(self):
+        with self.assertRaises(ValidationError) as context:
+            PizzaTopping(pizza=self.pizza, topping=self.garlic).full_clean()
+        self.assertEqual(
+            context.exception.message_dict[NON_FIELD_ERRORS],
+            ["Invariant broken: At most 5 toppings"],
+        )
+        with self.assertRaises(ValidationError) as context:
+            PizzaTopping(
+                pizza=self.other_pizza, topping=self.pineapple
+            ).full_clean()
+        self.assertEqual(
+            context.exception.message_dict[NON_FIELD_ERRORS],
+            ["Invariant broken: No pineapple"],
+        )
+        self.assertEqual(PizzaTopping.objects.count(), 5)
@@ -0,0 +1,189 @@
+from contextlib import contextmanager
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.utils import IntegrityError
+from django.test import TestCase, TransactionTestCase
+from parameterized import parameterized
+
+from django_queryset_constraint.checkpoint import constraint_checkpoint
+from django_queryset_constraint.constraints import (
+    CHECKED_TABLE,
+    get_queryset_constraint,
+)
+from django_queryset_constraint.models import (
+    Disallow1QC,
+    Disallow1ShadowQC,
+    Disallow1TriggerNewQC,
+    Pizza,
+    PizzaTopping,
+    Topping,
+)
+from django_queryset_constraint.tests.test_shadow import shadow_log
+
+
+class DedupeSqlTests(TestCase):
+    @parameterized.expand(
+        [
+            ["SELECT 1", "''"],
+            ['WHERE "age" = NEW."age"', 'ROW(NEW."age")::text'],
+            ["WHERE age = NEW.age OR NEW.age = 2", "ROW(NEW.age)::text"],
+            ['WHERE NEW."b" = OLD."a"', 'ROW(NEW."b", OLD."a")::text'],
+        ]
+    )
+    def test_key(self, body, key):
+        constraint = Disallow1QC._meta.constraints[0]
+        sql = constraint._dedupe_sql("dct__func__x()", body)
+        self.assertIn("VALUES ('dct__func__x()', {},".format(key), sql)
+
+    def test_whole_row(self):
+        constraint = Disallow1QC._meta.constraints[0]
+        self.assertEqual(constraint._dedupe_sql("f()", "SELECT NEW::text"), "")
+
+
+def prepared_transactions():
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW max_prepared_transactions;")
+        return int(cursor.fetchone()[0]) > 0
+
+
+@contextmanager
+def immediate_triggers(model, name):
+    """Install constraint name with triggers which cannot be deferred."""
+    constraint = get_queryset_constraint(model, name)
+    with connection.schema_editor() as editor:
+        editor.remove_constraint(model, constraint)
+        constraint._install_trigger(editor, model, defer=False)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(model, constraint)
+            editor.add_constraint(model, constraint)
+
+
+class DedupeTests(TransactionTestCase):
+    def setUp(self):
+        call_command("shadow_report", "--reset", stdout=StringIO())
+
+    def test_checked_once_per_firing(self):
+        with transaction.atomic():
+            for _ in range(3):
+                Disallow1ShadowQC.objects.create(age=1)
+        self.assertEqual(len(shadow_log()), 1)
+
+    def test_checked_again_after_checkpoint(self):
+        with transaction.atomic():
+            Disallow1ShadowQC.objects.create(age=1)
+            Disallow1ShadowQC.objects.create(age=1)
+            constraint_checkpoint()
+            Disallow1ShadowQC.objects.create(age=1)
+        self.assertEqual(len(shadow_log()), 2)
+
+    def test_violation_among_many_rows(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Disallow1QC.objects.create(age=0)
+                Disallow1QC.objects.create(age=1)
+                Disallow1QC.objects.create(age=2)
+
+    def test_violation_after_checkpoint(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Disallow1QC.objects.create(age=0)
+                constraint_checkpoint()
+                Disallow1QC.objects.create(age=1)
+
+    def test_violation_when_immediate(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET CONSTRAINTS ALL IMMEDIATE;")
+                Disallow1QC.objects.create(age=0)
+                Disallow1QC.objects.create(age=1)
+
+    def test_trigger_row_checked_per_row(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Disallow1TriggerNewQC.objects.create(age=0)
+                Disallow1TriggerNewQC.objects.create(age=1)
+
+    def insert_toppings(self, sql=""):
+        """Add 4 toppings to a pizza, and 2 more in one query, after sql."""
+        pizza = Pizza.objects.create(name="Everything")
+        toppings = [Topping.objects.create(name=str(i)) for i in range(6)]
+        for topping in toppings[:4]:
+            PizzaTopping.objects.create(pizza=pizza, topping=topping)
+        insert = "INSERT INTO {} (pizza_id, topping_id) VALUES (%s, %s);"
+        insert = insert.format(PizzaTopping._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                sql + insert + insert,
+                [pizza.pk, toppings[4].pk, pizza.pk, toppings[5].pk],
+            )
+
+    def test_statements_of_one_query_when_immediate(self):
+        with self.assertRaisesMessage(IntegrityError, "At most 5 toppings"):
+            self.insert_toppings("SET CONSTRAINTS ALL IMMEDIATE;")
+        self.assertEqual(PizzaTopping.objects.count(), 4)
+
+    def test_statements_of_one_query_not_deferrable(self):
+        with immediate_triggers(PizzaTopping, "At most 5 toppings"):
+            with self.assertRaisesMessage(IntegrityError, "At most 5 toppings"):
+                self.insert_toppings()
+            self.assertEqual(PizzaTopping.objects.count(), 4)
+
+    def test_statements_of_one_query_deferred(self):
+        with self.assertRaisesMessage(IntegrityError, "At most 5 toppings"):
+            self.insert_toppings()
+        self.assertEqual(PizzaTopping.objects.count(), 4)
+
+    def checked_txids(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT txid FROM {};".format(CHECKED_TABLE))
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_forget_finished_transactions(self):
+        # Left by a backend which exited
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO {} VALUES ('f()', '', 1, 0);".format(CHECKED_TABLE)
+            )
+        other = connection.copy()
+        try:
+            with other.cursor() as cursor:
+                cursor.execute("BEGIN;")
+                cursor.execute("SELECT txid_current();")
+                running = cursor.fetchone()[0]
+                cursor.execute(
+                    "INSERT INTO {} (age) VALUES (0);".format(
+                        Disallow1QC._meta.db_table
+                    )
+                )
+                cursor.execute("SET CONSTRAINTS ALL IMMEDIATE;")
+                with transaction.atomic():
+                    Disallow1QC.objects.create(age=0)
+                cursor.execute("COMMIT;")
+            # Those of the then running transaction were kept
+            self.assertNotIn(1, self.checked_txids())
+            self.assertIn(running, self.checked_txids())
+            with transaction.atomic():
+                Disallow1QC.objects.create(age=0)
+            self.assertNotIn(running, self.checked_txids())
+        finally:
+            other.close()
+
+    @skipUnless(prepared_transactions(), "Prepared transactions are disabled")
+    def test_prepare_transaction(self):
+        with connection.cursor() as cursor:
+            cursor.execute("BEGIN;")
+            cursor.execute(
+                "INSERT INTO {} (age) VALUES (0), (0);".format(
+                    Disallow1QC._meta.db_table
+                )
+            )
+            cursor.execute("PREPARE TRANSACTION 'dct_dedupe';")
+            cursor.execute("COMMIT PREPARED 'dct_dedupe';")
+        self.assertEqual(Disallow1QC.objects.count(), 2)
@@ -0,0 +1,174 @@
+from django.db import connection, transaction
+from django.db.utils import IntegrityError
+from django.test import TestCase, TransactionTestCase
+
+from django_queryset_constraint.checkpoint import (
+    constraint_checkpoint,
+    get_trigger_names,
+)
+from django_queryset_constraint.constraints import get_queryset_constraint
+from django_queryset_constraint.models import (
+    Disallow1QC,
+    Disallow1SubqueryQC,
+    Order,
+    OrderLine,
+    PizzaTopping,
+)
+
+LINE_TABLE = OrderLine._meta.db_table
+
+
+def delete_checks(model, name, **kwargs):
+    constraint = get_queryset_constraint(model, name)
+    if kwargs:
+        constraint = constraint.clone(**kwargs)
+    queryset = constraint.get_queryset(model)
+    return [
+        (table, events)
+        for _, table, events, _, _ in constraint._get_delete_checks(
+            model, queryset, connection
+        )
+    ]
+
+
+def delete_triggers():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM pg_trigger WHERE tgrelid = %s::regclass "
+            "AND tgname LIKE 'dct\\_\\_trig\\_\\_%%' "
+            "AND tgtype & 8 = 8;",
+            [LINE_TABLE],
+        )
+        return cursor.fetchone()[0]
+
+
+class DeleteChecksTests(TestCase):
+    def test_minimum_per_group(self):
+        self.assertEqual(
+            delete_checks(OrderLine, "At least 2 items per order"),
+            [(LINE_TABLE, 'DELETE OR UPDATE OF "order_id"')],
+        )
+
+    def test_maximum_per_group(self):
+        self.assertEqual(
+            delete_checks(OrderLine, "At most 3 lines per order"), []
+        )
+        self.assertEqual(
+            delete_checks(
+                PizzaTopping, "At most 5 toppings", check_deletes=True
+            ),
+            [],
+        )
+
+    def test_reverse_relation(self):
+        self.assertEqual(
+            delete_checks(Order, "Orders have lines"),
+            [(LINE_TABLE, 'DELETE OR UPDATE OF "order_id"')],
+        )
+
+    def test_row_local(self):
+        self.assertEqual(
+            delete_checks(
+                Disallow1QC, "QC: Disallow age=1", check_deletes=True
+            ),
+            [],
+        )
+
+    def test_subquery(self):
+        table = Disallow1SubqueryQC._meta.db_table
+        self.assertEqual(
+            delete_checks(
+                Disallow1SubqueryQC,
+                "QC: Disallow age=1 via subquery",
+                check_deletes=True,
+            ),
+            [(table, "DELETE")],
+        )
+
+    def test_disabled(self):
+        self.assertEqual(
+            delete_checks(
+                OrderLine, "At least 2 items per order", check_deletes=False
+            ),
+            [],
+        )
+
+    def test_deconstruct(self):
+        constraint = get_queryset_constraint(
+            OrderLine, "At least 2 items per order"
+        )
+        self.assertTrue(constraint.deconstruct()[2]["check_deletes"])
+        self.assertNotIn(
+            "check_deletes",
+            constraint.clone(check_deletes=False).deconstruct()[2],
+        )
+
+
+class DeleteTriggerTests(TransactionTestCase):
+    def setUp(self):
+        with transaction.atomic():
+            self.order = Order.objects.create(reference="A")
+            self.lines = [
+                OrderLine.objects.create(order=self.order, quantity=1)
+                for _ in range(3)
+            ]
+
+    def test_delete_above_minimum(self):
+        self.lines[0].delete()
+
+    def test_delete_below_minimum(self):
+        self.lines[0].delete()
+        with self.assertRaisesMessage(
+            IntegrityError, "Invariant broken: At least 2 items per order"
+        ):
+            self.lines[1].delete()
+
+    def test_delete_last_line(self):
+        with self.assertRaisesMessage(
+            IntegrityError, "Invariant broken: Orders have lines"
+        ):
+            OrderLine.objects.filter(order=self.order).delete()
+
+    def test_move_line(self):
+        self.lines[0].delete()
+        with transaction.atomic():
+            other = Order.objects.create(reference="B")
+            OrderLine.objects.create(order=other, quantity=2)
+        with self.assertRaisesMessage(
+            IntegrityError, "Invariant broken: At least 2 items per order"
+        ):
+            OrderLine.objects.filter(pk=self.lines[1].pk).update(order=other)
+
+    def test_delete_order(self):
+        self.order.delete()
+        self.assertFalse(OrderLine.objects.exists())
+
+    def test_checkpoint(self):
+        name = "At least 2 items per order"
+        constraint = get_queryset_constraint(OrderLine, name)
+        self.assertEqual(
+            get_trigger_names([name]),
+            [
+                constraint._generate_names(LINE_TABLE)[1],
+                constraint._generate_names(LINE_TABLE + ":delete")[1],
+            ],
+        )
+        with self.assertRaisesMessage(IntegrityError, name):
+            with transaction.atomic():
+                self.lines[0].delete()
+                self.lines[1].delete()
+                constraint_checkpoint([name])
+                # Never reached
+                self.fail()
+
+    def test_remove_constraint(self):
+        constraint = get_queryset_constraint(Order, "Orders have lines")
+        self.assertEqual(delete_triggers(), 2)
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(Order, constraint)
+        try:
+            self.assertEqual(delete_triggers(), 1)
+        finally:
+            with connection.schema_editor() as editor:
+                editor.add_constraint(Order, constraint)
+        self.assertEqual(delete_triggers(), 2)
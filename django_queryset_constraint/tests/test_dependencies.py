@@ -0,0 +1,75 @@
+from django.db import connection
+from django.db.utils import IntegrityError
+from django.test import TestCase, TransactionTestCase
+
+from django_queryset_constraint.constraints import get_queryset_constraint
+from django_queryset_constraint.models import Pizza, PizzaTopping, Topping
+from django_queryset_constraint.tests.test_validation import without_triggers
+
+
+def topping_triggers():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM pg_trigger WHERE tgrelid = %s::regclass "
+            "AND tgname LIKE 'dct\\_\\_trig\\_\\_%%';",
+            [Topping._meta.db_table],
+        )
+        return cursor.fetchone()[0]
+
+
+class GetDependenciesTests(TestCase):
+    def dependencies(self, name):
+        constraint = get_queryset_constraint(PizzaTopping, name)
+        queryset = constraint.get_queryset(PizzaTopping)
+        return constraint._get_dependencies(PizzaTopping, queryset)
+
+    def test_joined_table(self):
+        self.assertEqual(
+            self.dependencies("No pineapple"),
+            [(Topping._meta.db_table, "topping", ["id", "name"])],
+        )
+
+    def test_unused_joins(self):
+        self.assertEqual(self.dependencies("At most 5 toppings"), [])
+
+
+class DependencyTriggerTests(TransactionTestCase):
+    def setUp(self):
+        self.pizza = Pizza.objects.create(name="Hawaii")
+        self.ham = Topping.objects.create(name="Ham")
+        self.cheese = Topping.objects.create(name="Cheese")
+        PizzaTopping.objects.create(pizza=self.pizza, topping=self.ham)
+
+    def test_renaming_referenced_row(self):
+        self.ham.name = "Pineapple"
+        with self.assertRaisesMessage(
+            IntegrityError, "Invariant broken: No pineapple"
+        ):
+            self.ham.save()
+
+    def test_renaming_unreferenced_row(self):
+        self.cheese.name = "Pineapple"
+        self.cheese.save()
+
+    def test_only_referencing_rows_are_checked(self):
+        pineapple = Topping.objects.create(name="Pineapple")
+        without_triggers(
+            lambda: PizzaTopping.objects.create(
+                pizza=self.pizza, topping=pineapple
+            )
+        )
+        # The pre-existing violation does not reference ham
+        self.ham.name = "Bacon"
+        self.ham.save()
+
+    def test_remove_constraint(self):
+        constraint = get_queryset_constraint(PizzaTopping, "No pineapple")
+        self.assertEqual(topping_triggers(), 1)
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(PizzaTopping, constraint)
+        try:
+            self.assertEqual(topping_triggers(), 0)
+        finally:
+            with connection.schema_editor() as editor:
+                editor.add_constraint(PizzaTopping, constraint)
+        self.assertEqual(topping_triggers(), 1)
@@ -0,0 +1,221 @@
+import random
+
+from django.db.models import Count
+from django.test import SimpleTestCase, TransactionTestCase
+
+from django_queryset_constraint.constraints import get_queryset_constraint
+from django_queryset_constraint.equivalence import (
+    Case,
+    apply_writes,
+    find_counterexample,
+    generate_writes,
+    seed_corpus,
+)
+from django_queryset_constraint.models import (
+    AllowAll,
+    AllowOnly0CC,
+    AllowOnly0QC,
+    Disallow1CC,
+    Disallow1QC,
+    Disallow13WhenQC,
+    OrderLine,
+    Pizza,
+    PizzaTopping,
+    Topping,
+)
+from django_queryset_constraint.utils import M
+
+
+class GenerateWritesTests(SimpleTestCase):
+    def test_deterministic(self):
+        self.assertEqual(
+            generate_writes(random.Random(1), 20),
+            generate_writes(random.Random(1), 20),
+        )
+
+    def test_values(self):
+        writes = generate_writes(random.Random(0), 50, values=[7])
+        self.assertEqual(len(writes), 50)
+        for write in writes:
+            if write[0] == "insert":
+                self.assertEqual(set(write[1]), {7})
+
+    def test_transactions(self):
+        writes = generate_writes(random.Random(0), 50, statements=3)
+        transactions = [write for write in writes if write[0] == "transaction"]
+        self.assertTrue(transactions)
+        for _, statements in transactions:
+            self.assertIn(len(statements), [2, 3])
+            for statement in statements:
+                self.assertNotEqual(statement[0], "transaction")
+        # Only with multiple statements per transaction
+        self.assertNotIn(
+            "transaction",
+            [write[0] for write in generate_writes(random.Random(0), 50)],
+        )
+
+    def test_seed_corpus(self):
+        cases = seed_corpus()
+        self.assertIn(Case(Disallow1CC, Disallow1QC, {}), cases)
+        self.assertIn(Case(AllowOnly0CC, AllowOnly0QC, {}), cases)
+        self.assertEqual(len(cases), 10)
+        grouped = [case for case in cases if case.options]
+        self.assertEqual(
+            [case.baseline for case in grouped],
+            [PizzaTopping, OrderLine, OrderLine],
+        )
+        for case in grouped:
+            model, constraint = case.alternative
+            self.assertEqual(constraint.strategy, "row")
+
+
+class EquivalenceTests(TransactionTestCase):
+    def test_apply_writes(self):
+        writes = [
+            ("insert", (0, 2)),
+            ("insert", (1,)),
+            ("update", 0, 1),
+            ("update_where", 2, 3),
+            ("delete", 5),
+        ]
+        self.assertEqual(
+            apply_writes(Disallow1QC, writes), (True, False, False, True, True)
+        )
+        self.assertFalse(Disallow1QC.objects.exists())
+
+    def test_apply_transaction(self):
+        # The row violating the constraint is fixed before commit
+        writes = [
+            ("transaction", (("insert", (1, 2)), ("update_where", 1, 0))),
+            ("transaction", (("update", 0, 1), ("delete", 0))),
+            ("insert", (3,)),
+        ]
+        self.assertEqual(apply_writes(Disallow1QC, writes), (True, True, True))
+        self.assertEqual(
+            apply_writes(Disallow1QC, writes, immediate=True),
+            (False, True, True),
+        )
+
+    def test_fields(self):
+        pizza = Pizza.objects.create(name="Hawaii")
+        ham, pineapple = [
+            Topping.objects.create(name=name) for name in ["Ham", "Pineapple"]
+        ]
+        writes = [
+            ("insert", ((pizza, ham),)),
+            ("insert", ((pizza, pineapple),)),
+            ("update_where", (pizza, ham), (pizza, pineapple)),
+        ]
+        self.assertEqual(
+            apply_writes(PizzaTopping, writes, field=("pizza", "topping")),
+            (True, False, False),
+        )
+
+    def test_seed_corpus(self):
+        for case in seed_corpus():
+            with self.subTest(model=case.baseline.__name__):
+                # Native constraints are checked per statement
+                self.assertIsNone(
+                    find_counterexample(
+                        case.baseline,
+                        case.alternative,
+                        examples=10,
+                        statements=3,
+                        immediate=True,
+                        seed=0,
+                        **case.options
+                    )
+                )
+                if case.options:
+                    self.assertIsNone(
+                        find_counterexample(
+                            case.baseline,
+                            case.alternative,
+                            examples=10,
+                            statements=3,
+                            seed=0,
+                            **case.options
+                        )
+                    )
+        # The fixtures are deleted
+        self.assertFalse(Pizza.objects.exists())
+
+    def test_grouped_counterexample(self):
+        (case,) = [
+            case
+            for case in seed_corpus()
+            if case.baseline is OrderLine
+            and case.alternative[1].name == "At most 3 lines per order"
+        ]
+        constraint = case.alternative[1].clone(
+            queryset=M()
+            .objects.values("order")
+            .annotate(num_lines=Count("id"))
+            .filter(num_lines__gt=4)
+        )
+        counterexample = find_counterexample(
+            case.baseline,
+            (OrderLine, constraint),
+            examples=10,
+            seed=0,
+            **case.options
+        )
+        self.assertIn(False, counterexample.baseline)
+        self.assertNotIn(False, counterexample.alternative)
+
+    def test_deferred(self):
+        counterexample = find_counterexample(
+            Disallow1CC, Disallow1QC, examples=10, statements=3, seed=0
+        )
+        # Shrunk to a transaction inserting a one, then deleting it
+        (write,) = counterexample.writes
+        self.assertEqual(write[0], "transaction")
+        insert = write[1][0]
+        self.assertEqual(insert[0], "insert")
+        self.assertIn(1, insert[1])
+        self.assertEqual(counterexample.baseline, (False,))
+        self.assertEqual(counterexample.alternative, (True,))
+
+    def test_strategies(self):
+        constraint = get_queryset_constraint(Disallow1QC, "QC: Disallow age=1")
+        for strategy in ["row", "check", "auto"]:
+            with self.subTest(strategy=strategy):
+                self.assertIsNone(
+                    find_counterexample(
+                        Disallow1QC,
+                        (Disallow1QC, constraint.clone(strategy=strategy)),
+                        examples=10,
+                        seed=0,
+                    )
+                )
+
+    def test_materialize(self):
+        constraint = get_queryset_constraint(
+            Disallow13WhenQC, "QC: Disallow age>0 via When"
+        )
+        self.assertIsNone(
+            find_counterexample(
+                Disallow13WhenQC,
+                (Disallow13WhenQC, constraint.clone(materialize=True)),
+                examples=10,
+                seed=0,
+            )
+        )
+
+    def test_counterexample(self):
+        counterexample = find_counterexample(
+            AllowAll, Disallow1QC, examples=10, seed=0
+        )
+        # Shrunk to the single write of a one
+        (write,) = counterexample.writes
+        self.assertEqual(write[0], "insert")
+        self.assertIn(1, write[1])
+        self.assertEqual(counterexample.baseline, (True,))
+        self.assertEqual(counterexample.alternative, (False,))
+
+    def test_unknown_constraint(self):
+        constraint = get_queryset_constraint(PizzaTopping, "No pineapple")
+        with self.assertRaisesMessage(ValueError, "No pineapple"):
+            find_counterexample(
+                Disallow1QC, (Disallow1QC, constraint), examples=1
+            )
@@ -0,0 +1,78 @@
+import copy
+import pickle
+
+from django.db import transaction
+from django.db.utils import IntegrityError
+from django.test import TransactionTestCase
+
+from django_queryset_constraint import QuerysetConstraintViolation
+from django_queryset_constraint.exceptions import raise_violations
+from django_queryset_constraint.models import (
+    Disallow1QC,
+    Pizza,
+    PizzaTopping,
+    Topping,
+)
+
+
+class RaiseViolationsTests(TransactionTestCase):
+    def test_row_key(self):
+        with self.assertRaisesMessage(
+            QuerysetConstraintViolation, "Invariant broken: QC: Disallow age=1"
+        ) as context:
+            with raise_violations():
+                with transaction.atomic():
+                    row = Disallow1QC.objects.create(age=1)
+        violation = context.exception
+        self.assertEqual(violation.constraint_name, "QC: Disallow age=1")
+        self.assertEqual(violation.table, Disallow1QC._meta.db_table)
+        self.assertEqual(violation.column, "id")
+        self.assertEqual(violation.keys, [row.pk])
+        self.assertIn("audit_constraints", violation.hint)
+        self.assertIsInstance(violation.__cause__, IntegrityError)
+
+    def test_group_key(self):
+        pizza = Pizza.objects.create(name="Hawaii")
+        pineapple = Topping.objects.create(name="Pineapple")
+        with self.assertRaises(QuerysetConstraintViolation) as context:
+            with raise_violations():
+                PizzaTopping.objects.create(pizza=pizza, topping=pineapple)
+        self.assertEqual(context.exception.constraint_name, "No pineapple")
+
+    def test_other_errors(self):
+        pizza = Pizza.objects.create(name="Hawaii")
+        topping = Topping.objects.create(name="Ham")
+        PizzaTopping.objects.create(pizza=pizza, topping=topping)
+        with self.assertRaises(IntegrityError) as context:
+            with raise_violations():
+                PizzaTopping.objects.create(pizza=pizza, topping=topping)
+        self.assertNotIsInstance(context.exception, QuerysetConstraintViolation)
+
+    def test_pickle(self):
+        violation = QuerysetConstraintViolation(
+            "Invariant broken",
+            constraint_name="name",
+            table="table",
+            column="column",
+            keys=[1],
+            hint="hint",
+        )
+        for clone in [
+            pickle.loads(pickle.dumps(violation)),
+            copy.copy(violation),
+            copy.deepcopy(violation),
+        ]:
+            self.assertIsInstance(clone, QuerysetConstraintViolation)
+            self.assertEqual(str(clone), str(violation))
+            self.assertEqual(clone.args, violation.args)
+            self.assertEqual(vars(clone), vars(violation))
+            self.assertEqual(
+                vars(clone),
+                {
+                    "constraint_name": "name",
+                    "table": "table",
+                    "column": "column",
+                    "keys": [1],
+                    "hint": "hint",
+                },
+            )
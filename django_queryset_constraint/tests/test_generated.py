@@ -0,0 +1,184 @@
+import warnings
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, IntegerField, Value, When
+from django.db.utils import IntegrityError
+from django.test import TestCase, TransactionTestCase
+
+from django_queryset_constraint import sqlite
+from django_queryset_constraint.constraints import (
+    QuerysetConstraint,
+    get_queryset_constraint,
+)
+from django_queryset_constraint.generated import (
+    compile_row_sql,
+    find_generated_columns,
+    install_sql,
+    rewrite,
+)
+from django_queryset_constraint.models import (
+    Disallow1QC,
+    Disallow1SubqueryQC,
+    Disallow13WhenQC,
+    Reading,
+    Topping,
+)
+from django_queryset_constraint.tests.test_strategies import swapped
+from django_queryset_constraint.utils import M
+
+NAME = "QC: Disallow age>0 via When"
+TABLE = Disallow13WhenQC._meta.db_table
+
+
+def generated_columns(model):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_name = %s AND is_generated = 'ALWAYS';",
+            [model._meta.db_table],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class FindGeneratedColumnsTests(TestCase):
+    def find(self, model, name):
+        constraint = get_queryset_constraint(model, name)
+        return find_generated_columns(
+            constraint, model, constraint.get_queryset(model)
+        )
+
+    def test_case_when(self):
+        columns = self.find(Disallow13WhenQC, NAME)
+        self.assertEqual([column.alias for column in columns], ["block"])
+        self.assertTrue(columns[0].column.startswith("dct__gen__"))
+        self.assertTrue(columns[0].index.startswith("dct__idx__"))
+
+    def test_not_materializable(self):
+        # Without annotations
+        self.assertEqual(self.find(Disallow1QC, "QC: Disallow age=1"), [])
+        # Subqueries read other rows
+        self.assertEqual(
+            self.find(Disallow1SubqueryQC, "QC: Disallow age=1 via subquery"),
+            [],
+        )
+
+    def test_install_sql(self):
+        constraint = get_queryset_constraint(Disallow13WhenQC, NAME)
+        queryset = constraint.get_queryset(Disallow13WhenQC)
+        columns = find_generated_columns(constraint, Disallow13WhenQC, queryset)
+        column = columns[0].column
+        sql = install_sql(Disallow13WhenQC, queryset, columns, connection)
+        self.assertIn(
+            'GENERATED ALWAYS AS (CASE WHEN "age" = 1 THEN "age" '
+            'WHEN "age" > 1 THEN 1 ELSE 0 END) STORED;',
+            sql,
+        )
+        self.assertIn('("{0}") WHERE "{0}" = 1;'.format(column), sql)
+
+    def test_install_sql_pg_version(self):
+        constraint = get_queryset_constraint(Disallow13WhenQC, NAME)
+        queryset = constraint.get_queryset(Disallow13WhenQC)
+        columns = find_generated_columns(constraint, Disallow13WhenQC, queryset)
+        with mock.patch.object(connection, "pg_version", 110000):
+            with self.assertRaisesMessage(ValueError, "PostgreSQL 12"):
+                install_sql(Disallow13WhenQC, queryset, columns, connection)
+
+    def test_install_sql_not_immutable(self):
+        # Comparing dates with timestamps depends upon the time zone
+        since = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        constraint = QuerysetConstraint(
+            name="No readings since 2020",
+            queryset=M()
+            .objects.annotate(
+                recent=Case(
+                    When(
+                        day__gte=Value(since, output_field=DateTimeField()),
+                        then=1,
+                    ),
+                    default=0,
+                    output_field=IntegerField(),
+                )
+            )
+            .filter(recent=1),
+            materialize=True,
+        )
+        queryset = constraint.get_queryset(Reading)
+        columns = find_generated_columns(constraint, Reading, queryset)
+        self.assertEqual([column.alias for column in columns], ["recent"])
+        with self.assertRaisesMessage(ValueError, "'recent'"):
+            install_sql(Reading, queryset, columns, connection)
+        # Nothing was added
+        self.assertEqual(generated_columns(Reading), [])
+
+    def test_compile_row_sql(self):
+        # Only the columns are unqualified, not literals alike
+        literal = '"{}".name'.format(Topping._meta.db_table)
+        query = Topping.objects.filter(name=literal).query
+        self.assertEqual(
+            compile_row_sql(query.where, query, connection),
+            "\"name\" = '{}'".format(literal),
+        )
+
+    def test_rewrite(self):
+        constraint = get_queryset_constraint(Disallow13WhenQC, NAME)
+        queryset = constraint.get_queryset(Disallow13WhenQC)
+        columns = find_generated_columns(constraint, Disallow13WhenQC, queryset)
+        sql = str(rewrite(queryset, columns).query)
+        self.assertNotIn("CASE", sql)
+        self.assertIn(
+            'WHERE "{}"."{}" = 1'.format(TABLE, columns[0].column), sql
+        )
+        # The original queryset is left as is
+        self.assertIn("CASE", str(queryset.query))
+
+    def test_function_sql(self):
+        constraint = get_queryset_constraint(Disallow13WhenQC, NAME)
+        self.assertIn("CASE", constraint._function_sql(Disallow13WhenQC))
+        self.assertNotIn(
+            "CASE",
+            constraint.clone(materialize=True)._function_sql(Disallow13WhenQC),
+        )
+
+    def test_deconstruct(self):
+        constraint = get_queryset_constraint(Disallow13WhenQC, NAME)
+        self.assertNotIn("materialize", constraint.deconstruct()[2])
+        self.assertTrue(
+            constraint.clone(materialize=True).deconstruct()[2]["materialize"]
+        )
+
+    def test_sqlite(self):
+        constraint = get_queryset_constraint(Disallow13WhenQC, NAME)
+        # Ignored, as SQLite checks each row as it is written
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            self.assertTrue(
+                sqlite.check_supported(constraint.clone(materialize=True))
+            )
+        self.assertEqual(caught, [])
+
+
+class MaterializeTests(TransactionTestCase):
+    def test_install(self):
+        with swapped(Disallow13WhenQC, NAME, materialize=True) as constraint:
+            self.assertEqual(len(generated_columns(Disallow13WhenQC)), 1)
+            Disallow13WhenQC.objects.create(age=0)
+            with self.assertRaisesMessage(IntegrityError, NAME):
+                Disallow13WhenQC.objects.create(age=3)
+            with self.assertRaisesMessage(IntegrityError, NAME):
+                Disallow13WhenQC.objects.create(age=1)
+
+            # The check probes the partial index
+            queryset = constraint.get_queryset(Disallow13WhenQC)
+            checked = rewrite(
+                queryset,
+                find_generated_columns(constraint, Disallow13WhenQC, queryset),
+            )
+            sql, params = checked.query.sql_with_params()
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off;")
+                cursor.execute("EXPLAIN " + sql, params)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+            self.assertIn("dct__idx__", plan)
+        self.assertEqual(generated_columns(Disallow13WhenQC), [])
@@ -0,0 +1,168 @@
+import random
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.utils import IntegrityError
+from django.test import SimpleTestCase, TransactionTestCase
+
+from django_queryset_constraint.constraints import get_queryset_constraint
+from django_queryset_constraint.equivalence import installed
+from django_queryset_constraint.loadtest import (
+    choose_key,
+    classify_error,
+    compare_strategies,
+    percentile,
+    run_load_test,
+)
+from django_queryset_constraint.models import (
+    Disallow1QC,
+    Pizza,
+    PizzaTopping,
+    Topping,
+)
+
+
+class HelperTests(SimpleTestCase):
+    def test_choose_key(self):
+        rng = random.Random(0)
+        keys = list(range(100))
+        hot = [choose_key(rng, keys, "hotspot") for _ in range(1000)]
+        self.assertGreater(sum(key < 10 for key in hot), 850)
+        uniform = [choose_key(rng, keys, "uniform") for _ in range(1000)]
+        self.assertLess(sum(key < 10 for key in uniform), 200)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([7], 0.99), 7)
+        self.assertIsNone(percentile([], 0.5))
+
+
+class LoadTestTests(TransactionTestCase):
+    def setUp(self):
+        for i in range(2):
+            Pizza.objects.create(name="loadtest-{}".format(i))
+        for name in ["Ham", "Cheese", "Olives", "Pineapple"]:
+            Topping.objects.create(name=name)
+
+    def raised(self, create):
+        try:
+            with transaction.atomic():
+                create()
+        except IntegrityError as exc:
+            return classify_error(exc)
+        self.fail("Nothing raised")
+
+    def test_classify_error(self):
+        def create():
+            Disallow1QC.objects.create(age=1)
+
+        self.assertEqual(self.raised(create), "violations")
+        # Whatever the message
+        constraint = get_queryset_constraint(Disallow1QC, "QC: Disallow age=1")
+        with installed(Disallow1QC, constraint.clone(strategy="check")):
+            self.assertEqual(self.raised(create), "violations")
+        pizza = Pizza.objects.first()
+        topping = Topping.objects.first()
+        PizzaTopping.objects.create(pizza=pizza, topping=topping)
+        self.assertEqual(
+            self.raised(
+                lambda: PizzaTopping.objects.create(
+                    pizza=pizza, topping=topping
+                )
+            ),
+            "errors",
+        )
+
+    def test_run(self):
+        result = run_load_test(
+            PizzaTopping,
+            "pizza",
+            "topping",
+            processes=2,
+            duration=0.5,
+            distribution="hotspot",
+            mix=(1, 0, 0),
+            seed=0,
+        )
+        self.assertGreater(result["transactions"], 0)
+        # Adding toppings to two pizzas soon runs out of valid toppings
+        self.assertGreater(result["violations"], 0)
+        self.assertEqual(result["errors"], 0)
+        self.assertTrue(PizzaTopping.objects.exists())
+
+    def function_sources(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT proname, prosrc FROM pg_proc "
+                "WHERE proname LIKE 'dct\\_\\_func\\_\\_%%' ORDER BY 1;"
+            )
+            return cursor.fetchall()
+
+    def test_compare_strategies(self):
+        sources = self.function_sources()
+        self.assertTrue(sources)
+        results = compare_strategies(
+            PizzaTopping,
+            "pizza",
+            "topping",
+            ["statement", "row"],
+            processes=2,
+            duration=0.5,
+            # Updates may collide with the unique toppings of the pizza
+            mix=(1, 0, 1),
+            seed=0,
+        )
+        self.assertEqual(list(results), ["statement", "row"])
+        for result in results.values():
+            self.assertGreater(result["transactions"], 0)
+            self.assertEqual(result["errors"], 0)
+        # The constraints are reinstalled as declared afterwards
+        self.assertEqual(self.function_sources(), sources)
+
+    def test_command(self):
+        out = StringIO()
+        call_command(
+            "load_test",
+            "django_queryset_constraint.PizzaTopping",
+            "pizza",
+            "topping",
+            "--processes=2",
+            "--duration=0.5",
+            "--isolation=serializable",
+            "--without-triggers",
+            stdout=out,
+        )
+        self.assertIn("transactions", out.getvalue())
+        self.assertIn("0 violations", out.getvalue())
+
+    def test_command_strategies(self):
+        out = StringIO()
+        call_command(
+            "load_test",
+            "django_queryset_constraint.PizzaTopping",
+            "pizza",
+            "topping",
+            "--processes=1",
+            "--duration=0.2",
+            "--strategy",
+            "statement",
+            "row",
+            stdout=out,
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ["statement", "row"])
+        self.assertTrue(lines[1].startswith("Transactions"))
+
+    def test_invalid_arguments(self):
+        arguments = ["django_queryset_constraint.PizzaTopping", "pizza"]
+        with self.assertRaisesMessage(CommandError, "'mix'"):
+            call_command("load_test", *arguments, "topping", "--mix=1:2")
+        with self.assertRaisesMessage(CommandError, "foreign key"):
+            call_command("load_test", *arguments, "id")
+        with self.assertRaises(CommandError):
+            call_command("load_test", *arguments, "missing")
+        with self.assertRaises(ValueError):
+            run_load_test(PizzaTopping, "pizza", "topping", processes=0)
@@ -0,0 +1,146 @@
+from django.db import connection, transaction
+from django.db.utils import IntegrityError
+from django.test import SimpleTestCase, TransactionTestCase
+
+from django_queryset_constraint import metrics
+from django_queryset_constraint.checkpoint import constraint_checkpoint
+from django_queryset_constraint.metrics import (
+    COMMIT_SECONDS,
+    STATEMENT_SECONDS,
+    VIOLATIONS,
+    ConstraintMetrics,
+    InMemoryBackend,
+    MetricsBackend,
+)
+from django_queryset_constraint.models import (
+    AllowAll,
+    Disallow1QC,
+    Pizza,
+    PizzaTopping,
+    Topping,
+)
+
+
+class InMemoryBackendTests(SimpleTestCase):
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            MetricsBackend()
+
+    def test_render(self):
+        backend = InMemoryBackend(buckets=(0.1, 1.0))
+        backend.increment(VIOLATIONS, {"constraint": 'Say "hi"'})
+        backend.increment(VIOLATIONS, {"constraint": 'Say "hi"'})
+        backend.observe(STATEMENT_SECONDS, 0.05)
+        backend.observe(STATEMENT_SECONDS, 0.5)
+        self.assertEqual(
+            backend.get_count(VIOLATIONS, constraint='Say "hi"'), 2
+        )
+        self.assertEqual(
+            backend.render(),
+            "# TYPE queryset_constraint_violations counter\n"
+            'queryset_constraint_violations_total{constraint="Say \\"hi\\""} 2\n'
+            "# TYPE queryset_constraint_statement_seconds histogram\n"
+            'queryset_constraint_statement_seconds_bucket{le="0.1"} 1\n'
+            'queryset_constraint_statement_seconds_bucket{le="1.0"} 2\n'
+            'queryset_constraint_statement_seconds_bucket{le="+Inf"} 2\n'
+            "queryset_constraint_statement_seconds_count 2\n"
+            "queryset_constraint_statement_seconds_sum 0.55\n"
+            "# EOF\n",
+        )
+        backend.reset()
+        self.assertEqual(backend.render(), "# EOF\n")
+
+
+class MetricsTests(TransactionTestCase):
+    def setUp(self):
+        self.backend = metrics.install()
+
+    def tearDown(self):
+        metrics.uninstall()
+
+    def statements(self):
+        return len(self.backend.histograms[STATEMENT_SECONDS])
+
+    def commits(self):
+        return len(self.backend.histograms[COMMIT_SECONDS])
+
+    def violations(self, name="QC: Disallow age=1"):
+        return self.backend.get_count(VIOLATIONS, constraint=name)
+
+    def test_violation_at_commit(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Disallow1QC.objects.create(age=1)
+        self.assertEqual(self.violations(), 1)
+        self.assertEqual(self.statements(), 1)
+        self.assertEqual(self.commits(), 1)
+
+    def test_violation_at_checkpoint(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Disallow1QC.objects.create(age=1)
+                constraint_checkpoint()
+        self.assertEqual(self.violations(), 1)
+        # Rolled back rather than committed
+        self.assertEqual(self.commits(), 0)
+
+    def test_violation_in_autocommit(self):
+        pizza = Pizza.objects.create(name="Hawaii")
+        pineapple = Topping.objects.create(name="Pineapple")
+        with self.assertRaises(IntegrityError):
+            PizzaTopping.objects.create(pizza=pizza, topping=pineapple)
+        self.assertEqual(self.violations("No pineapple"), 1)
+        # Only the pizza topping is constrained
+        self.assertEqual(self.statements(), 1)
+        # Checked as part of the statement
+        self.assertEqual(self.commits(), 0)
+
+    def test_other_errors(self):
+        pizza = Pizza.objects.create(name="Hawaii")
+        topping = Topping.objects.create(name="Ham")
+        PizzaTopping.objects.create(pizza=pizza, topping=topping)
+        with self.assertRaises(IntegrityError):
+            PizzaTopping.objects.create(pizza=pizza, topping=topping)
+        self.assertFalse(self.backend.counters[VIOLATIONS])
+
+    def test_unconstrained_tables(self):
+        with transaction.atomic():
+            AllowAll.objects.create(age=1)
+        AllowAll.objects.create(age=1)
+        self.assertEqual(self.statements(), 0)
+        self.assertEqual(self.commits(), 0)
+
+    def test_statements(self):
+        with transaction.atomic():
+            Disallow1QC.objects.create(age=2)
+            Disallow1QC.objects.filter(age=2).update(age=3)
+        Disallow1QC.objects.all().delete()
+        self.assertEqual(self.statements(), 3)
+        # Deletes run in a transaction of their own
+        self.assertEqual(self.commits(), 2)
+
+    def test_rollback(self):
+        with self.assertRaises(ZeroDivisionError):
+            with transaction.atomic():
+                Disallow1QC.objects.create(age=2)
+                1 / 0
+        with transaction.atomic():
+            AllowAll.objects.create(age=1)
+        self.assertEqual(self.commits(), 0)
+
+    def test_uninstall(self):
+        # Connections are instrumented as they are opened
+        connection.ensure_connection()
+        self.assertEqual(
+            sum(
+                isinstance(wrapper, ConstraintMetrics)
+                for wrapper in connection.execute_wrappers
+            ),
+            1,
+        )
+        metrics.uninstall()
+        self.assertFalse(connection.execute_wrappers)
+        with transaction.atomic():
+            Disallow1QC.objects.create(age=2)
+        self.assertEqual(self.statements(), 0)
+        self.assertEqual(self.commits(), 0)
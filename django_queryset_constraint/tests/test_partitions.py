@@ -0,0 +1,120 @@
+import datetime
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.db.utils import IntegrityError
+from django.test import TestCase, TransactionTestCase
+
+from django_queryset_constraint.constraints import QuerysetConstraint
+from django_queryset_constraint.models import PizzaTopping, Reading
+from django_queryset_constraint.utils import M
+
+TABLE = Reading._meta.db_table
+
+
+def day(year):
+    return datetime.date(year, 1, 1)
+
+
+class PruneTests(TestCase):
+    def test_not_partitioned(self):
+        constraint = Reading._meta.constraints[0]
+        self.assertNotIn('NEW."day"', constraint._function_sql(Reading))
+
+    def test_related_lookup(self):
+        constraint = QuerysetConstraint(
+            name="At most 5 per pizza name",
+            queryset=M()
+            .objects.values("pizza__name")
+            .annotate(n=Count("id"))
+            .filter(n__gt=5),
+        )
+        self.assertIn("GROUP BY", constraint._function_sql(PizzaTopping))
+        # Not grouped by the partition key, as pizza__name is another table's
+        queryset = constraint.get_queryset(PizzaTopping)
+        self.assertIs(
+            constraint._prune_partitions(PizzaTopping, queryset, ["pizza_id"]),
+            queryset,
+        )
+
+
+class PartitionedTableTests(TransactionTestCase):
+    def setUp(self):
+        self.constraint = Reading._meta.constraints[0]
+        self.trigger_name = self.constraint._generate_names(TABLE)[1]
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(Reading, self.constraint)
+            editor.execute("DROP TABLE {};".format(TABLE))
+            editor.execute(
+                "CREATE TABLE {} (id serial, day date NOT NULL) "
+                "PARTITION BY RANGE (day);".format(TABLE)
+            )
+            for year in [2020, 2021]:
+                self.create_partition(editor, year)
+            editor.add_constraint(Reading, self.constraint)
+
+    def tearDown(self):
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(Reading, self.constraint)
+            editor.execute("DROP TABLE {};".format(TABLE))
+            editor.create_model(Reading)
+            editor.add_constraint(Reading, self.constraint)
+
+    def create_partition(self, editor, year):
+        editor.execute(
+            "CREATE TABLE {0}_{1} PARTITION OF {0} "
+            "FOR VALUES FROM ('{1}-01-01') TO ('{2}-01-01');".format(
+                TABLE, year, year + 1
+            )
+        )
+
+    def triggered_tables(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tgrelid::regclass::text FROM pg_trigger "
+                "WHERE tgname = %s ORDER BY 1;",
+                [self.trigger_name],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_triggers_on_partitions(self):
+        self.assertEqual(
+            self.triggered_tables(), [TABLE + "_2020", TABLE + "_2021"]
+        )
+
+    def test_enforced(self):
+        for year in [2020, 2020, 2021, 2021]:
+            Reading.objects.create(day=day(year))
+        with self.assertRaises(IntegrityError):
+            Reading.objects.create(day=day(2021))
+
+    def test_attached_partitions(self):
+        with connection.schema_editor() as editor:
+            self.create_partition(editor, 2022)
+            editor.execute(
+                "CREATE TABLE {0}_2023 (LIKE {0});"
+                "ALTER TABLE {0} ATTACH PARTITION {0}_2023 "
+                "FOR VALUES FROM ('2023-01-01') TO ('2024-01-01');".format(
+                    TABLE
+                )
+            )
+        self.assertEqual(len(self.triggered_tables()), 4)
+        for _ in range(2):
+            Reading.objects.create(day=day(2023))
+        with self.assertRaises(IntegrityError):
+            Reading.objects.create(day=day(2023))
+
+    def test_sync_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DROP TRIGGER {} ON {}_2021;".format(self.trigger_name, TABLE)
+            )
+        self.assertEqual(len(self.triggered_tables()), 1)
+        call_command("sync_partition_triggers")
+        self.assertEqual(len(self.triggered_tables()), 2)
+
+    def test_check_is_pruned(self):
+        self.assertIn(
+            '"day" = ((NEW."day"))', self.constraint._function_sql(Reading)
+        )
@@ -0,0 +1,164 @@
+from django.apps import apps
+from django.db import models
+from django.db.models import Q
+from django.db.utils import IntegrityError
+from django.test import TestCase, TransactionTestCase
+from parameterized import parameterized
+
+from django_queryset_constraint import M
+from django_queryset_constraint.constraints import get_queryset_constraints
+from django_queryset_constraint.models import (
+    AllowAll,
+    AllowOnly1ObjectQC,
+    Disallow12InQC,
+    Disallow12RangeQC,
+    PizzaTopping,
+)
+from django_queryset_constraint.predicates import (
+    BatchValidationError,
+    PrevalidatingQuerySet,
+    compile_predicate,
+    prevalidate,
+)
+
+# All row-local constraints on the age models, and the ages they disallow
+ROW_LOCAL = [
+    ["Disallow1QC", [1]],
+    ["Disallow1ViaQQC", [1]],
+    ["Disallow12InQC", [1, 2]],
+    ["Disallow12ViaQQC", [1, 2]],
+    ["Disallow12OneFilterQC", [1, 2]],
+    ["Disallow12AndFilterQC", [1, 2]],
+    ["Disallow12MultiFilterQC", [1, 2]],
+    ["Disallow12RangeQC", [1, 2]],
+    ["AllowOnly0QC", [1, 2, 3]],
+]
+
+
+class PredicateTests(TestCase):
+    ages = [0, 1, 2, 3, 1]
+
+    @parameterized.expand(ROW_LOCAL)
+    def test_instances(self, model_name, disallow):
+        model = apps.get_model("django_queryset_constraint", model_name)
+        expected = [i for i, age in enumerate(self.ages) if age in disallow]
+        violations = set()
+        for _, constraint in get_queryset_constraints([model]):
+            predicate = constraint.get_predicate(model)
+            violations.update(
+                predicate.violations([model(age=age) for age in self.ages])
+            )
+        self.assertEqual(sorted(violations), expected)
+
+    @parameterized.expand(ROW_LOCAL)
+    def test_columns(self, model_name, disallow):
+        model = apps.get_model("django_queryset_constraint", model_name)
+        expected = [i for i, age in enumerate(self.ages) if age in disallow]
+        violations = set()
+        for _, constraint in get_queryset_constraints([model]):
+            predicate = constraint.get_predicate(model)
+            violations.update(predicate.evaluate_columns({"age": self.ages}))
+        self.assertEqual(sorted(violations), expected)
+
+    @parameterized.expand(
+        [
+            ["AllowOnly1ObjectQC"],
+            ["Disallow1AnnotateQC"],
+            ["Disallow1SubqueryQC"],
+            ["Disallow1TriggerNewQC"],
+            ["Disallow13SubquerySliceQC"],
+            ["Disallow13WhenQC"],
+        ]
+    )
+    def test_not_row_local(self, model_name):
+        model = apps.get_model("django_queryset_constraint", model_name)
+        self.assertIsNone(model._meta.constraints[0].get_predicate(model))
+
+    def test_relations(self):
+        at_most_5, no_pineapple = PizzaTopping._meta.constraints
+        self.assertIsNone(at_most_5.get_predicate(PizzaTopping))
+        self.assertIsNone(no_pineapple.get_predicate(PizzaTopping))
+        predicate = compile_predicate(
+            PizzaTopping, M().objects.filter(pizza__in=[1, 2])
+        )
+        self.assertEqual(
+            predicate.evaluate_columns({"pizza_id": [1, 3, 2, None]}), [0, 2]
+        )
+
+    @parameterized.expand(
+        [
+            [M().objects.filter(age__isnull=True), [1]],
+            [M().objects.filter(age__isnull=False), [0, 2]],
+            [M().objects.filter(age=None), [1]],
+            [M().objects.exclude(age=None), [0, 2]],
+            [M().objects.filter(age__iexact=None), [1]],
+            [M().objects.filter(age__gt=2), [2]],
+            [M().objects.exclude(age__gt=2), [0, 1]],
+            [M().objects.filter(~Q(age=0)), [1, 2]],
+            [M().objects.filter(Q(age=0) | ~Q(age__lt=3)), [0, 1, 2]],
+            [M().objects.all(), [0, 1, 2]],
+        ]
+    )
+    def test_null_semantics(self, m_object, expected):
+        predicate = compile_predicate(AllowAll, m_object)
+        self.assertEqual(
+            predicate.evaluate_columns({"age": [0, None, 5]}), expected
+        )
+
+    def test_missing_column(self):
+        predicate = compile_predicate(AllowAll, M().objects.filter(age=1))
+        with self.assertRaises(KeyError):
+            predicate.evaluate_columns({"id": [1]})
+
+    def test_nested_m_object(self):
+        nested = M().objects.values("age")
+        operations = list(nested.operations)
+        with self.assertRaises(ValueError):
+            compile_predicate(AllowAll, M().objects.filter(age__in=nested))
+        # Left as recorded
+        self.assertEqual(nested.operations, operations)
+        self.assertFalse(nested.finalized)
+
+    @parameterized.expand(
+        [
+            [M().objects.filter(age=models.F("id"))],
+            [M().objects.filter(age__year=1)],
+            [M().objects.filter(age__in=[1]).order_by("age")],
+            [M("Pizza").objects.filter(age=1)],
+        ]
+    )
+    def test_compile_errors(self, m_object):
+        with self.assertRaises(ValueError):
+            compile_predicate(AllowAll, m_object)
+
+
+class PrevalidateTests(TransactionTestCase):
+    def test_reports_all_indices(self):
+        instances = [Disallow12InQC(age=age) for age in [0, 1, 3, 2, 2]]
+        with self.assertRaises(BatchValidationError) as context:
+            prevalidate(Disallow12InQC, instances)
+        self.assertEqual(
+            context.exception.violations,
+            {"QC: Disallow age in list": [1, 3, 4]},
+        )
+        self.assertEqual(
+            context.exception.messages,
+            ["Invariant broken: QC: Disallow age in list (rows 1, 3, 4)"],
+        )
+        prevalidate(Disallow12InQC, [Disallow12InQC(age=0)])
+
+    def test_queryset(self):
+        queryset = PrevalidatingQuerySet(Disallow12RangeQC)
+        with self.assertNumQueries(0):
+            with self.assertRaises(BatchValidationError):
+                queryset.bulk_create(
+                    Disallow12RangeQC(age=age) for age in [0, 1]
+                )
+        queryset.bulk_create(Disallow12RangeQC(age=age) for age in [0, 3])
+        self.assertEqual(Disallow12RangeQC.objects.count(), 2)
+
+    def test_not_row_local_left_for_trigger(self):
+        queryset = PrevalidatingQuerySet(AllowOnly1ObjectQC)
+        queryset.bulk_create([AllowOnly1ObjectQC(age=0)])
+        with self.assertRaises(IntegrityError):
+            queryset.bulk_create([AllowOnly1ObjectQC(age=0)])
@@ -0,0 +1,134 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TransactionTestCase
+
+from django_queryset_constraint import M, QuerysetConstraint
+from django_queryset_constraint.constraints import (
+    QUEUE_TABLE,
+    get_queryset_constraint,
+)
+from django_queryset_constraint.models import (
+    AllowAll,
+    AllowOnly1ObjectQC,
+    Disallow1AsyncQC,
+    Disallow1TriggerNewQC,
+    PizzaNC,
+    PizzaTopping,
+    PizzaToppingNC,
+    ToppingNC,
+)
+from django_queryset_constraint.queueing import check_keys, drain_queue
+
+# Violations reported to record_violation
+recorded = []
+
+
+def record_violation(model, constraint, key, rows):
+    recorded.append((constraint.name, key, [row["age"] for row in rows]))
+
+
+def queue_size():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM {};".format(QUEUE_TABLE))
+        return cursor.fetchone()[0]
+
+
+class AsyncModeTests(TransactionTestCase):
+    name = "QC: Async disallow age=1"
+
+    def setUp(self):
+        drain_queue(lambda *args: None, batch_size=10000)
+        recorded.clear()
+
+    def test_writes_are_queued(self):
+        Disallow1AsyncQC.objects.create(age=1)
+        Disallow1AsyncQC.objects.create(age=2)
+        self.assertEqual(queue_size(), 2)
+        self.assertEqual(drain_queue(record_violation), 2)
+        pk = Disallow1AsyncQC.objects.get(age=1).pk
+        self.assertEqual(recorded, [(self.name, pk, [1])])
+        self.assertEqual(queue_size(), 0)
+
+    def test_keys_are_deduplicated(self):
+        row = Disallow1AsyncQC.objects.create(age=1)
+        for _ in range(3):
+            row.save()
+        self.assertEqual(drain_queue(record_violation), 4)
+        self.assertEqual(recorded, [(self.name, row.pk, [1])])
+
+    def test_batches(self):
+        for age in range(5):
+            Disallow1AsyncQC.objects.create(age=age)
+        self.assertEqual(drain_queue(record_violation, batch_size=2), 2)
+        self.assertEqual(drain_queue(record_violation, batch_size=2), 2)
+        self.assertEqual(drain_queue(record_violation, batch_size=2), 1)
+        self.assertEqual(drain_queue(record_violation, batch_size=2), 0)
+        self.assertEqual(len(recorded), 1)
+
+    def test_failing_handler_requeues(self):
+        Disallow1AsyncQC.objects.create(age=1)
+
+        def handler(*args):
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            drain_queue(handler)
+        self.assertEqual(queue_size(), 1)
+
+    def test_command(self):
+        Disallow1AsyncQC.objects.create(age=1)
+        out = StringIO()
+        call_command(
+            "process_constraint_queue",
+            "--once",
+            "--handler=django_queryset_constraint.tests.test_queueing."
+            "record_violation",
+            stdout=out,
+        )
+        self.assertEqual(out.getvalue(), "Processed 1 entries, 1 violations\n")
+        self.assertEqual(len(recorded), 1)
+
+    def test_command_unknown_handler(self):
+        with self.assertRaises(CommandError):
+            call_command(
+                "process_constraint_queue", "--once", "--handler=unknown.path"
+            )
+
+    def test_trigger_row_constraint(self):
+        constraint = Disallow1TriggerNewQC._meta.constraints[0].clone(
+            mode="async"
+        )
+        with self.assertRaises(ValueError):
+            constraint._function_sql(Disallow1TriggerNewQC)
+
+
+class CheckKeysTests(TransactionTestCase):
+    def test_grouped(self):
+        constraint = get_queryset_constraint(PizzaTopping, "At most 5 toppings")
+        toppings = [ToppingNC.objects.create(name=str(x)) for x in range(6)]
+        pizzas = []
+        for num_toppings in [6, 2, 6]:
+            pizza = PizzaNC.objects.create(name=str(num_toppings))
+            for topping in toppings[:num_toppings]:
+                PizzaToppingNC.objects.create(pizza=pizza, topping=topping)
+            pizzas.append(pizza)
+        keys = {str(pizza.pk) for pizza in pizzas[:2]}
+        violations = check_keys(PizzaToppingNC, constraint, keys)
+        self.assertEqual(list(violations), [pizzas[0].pk])
+
+    def test_without_key(self):
+        constraint = AllowOnly1ObjectQC._meta.constraints[0]
+        AllowAll.objects.create(age=1)
+        self.assertEqual(check_keys(AllowAll, constraint, {None}), {})
+        AllowAll.objects.create(age=2)
+        self.assertEqual(len(check_keys(AllowAll, constraint, {None})[None]), 1)
+
+    def test_null_key(self):
+        constraint = QuerysetConstraint(M().objects.filter(age=1), "name")
+        row = AllowAll.objects.create(age=1)
+        self.assertEqual(check_keys(AllowAll, constraint, {None}), {})
+        self.assertEqual(
+            list(check_keys(AllowAll, constraint, {str(row.pk)})), [row.pk]
+        )
@@ -0,0 +1,178 @@
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.core.management import CommandError, call_command
+from django.db import connection, models
+from django.db.migrations.state import ModelState, ProjectState
+from django.test import TestCase, TransactionTestCase
+
+from django_queryset_constraint import constraints
+from django_queryset_constraint.constraints import QuerysetConstraint
+from django_queryset_constraint.models import Disallow1QC, PizzaTopping
+from django_queryset_constraint.rollout import apply_to_databases
+
+TABLE = Disallow1QC._meta.db_table
+
+
+def count_compilations(test):
+    """Run test, counting the compilations of trigger functions."""
+    compilations = []
+    original = QuerysetConstraint._compile_function_sql
+
+    def compile_function_sql(self, *args):
+        compilations.append(self.name)
+        return original(self, *args)
+
+    QuerysetConstraint._compile_function_sql = compile_function_sql
+    try:
+        test()
+    finally:
+        QuerysetConstraint._compile_function_sql = original
+    return compilations
+
+
+class FunctionCacheTests(TestCase):
+    def setUp(self):
+        constraints._function_sql_cache.clear()
+        self.constraint = Disallow1QC._meta.constraints[0]
+
+    def test_compiled_once(self):
+        sql = []
+        compilations = count_compilations(
+            lambda: sql.extend(
+                self.constraint._function_sql(Disallow1QC, connection=c)
+                for c in [connection, connection]
+            )
+        )
+        self.assertEqual(compilations, [self.constraint.name])
+        self.assertEqual(sql[0], sql[1])
+
+    def test_keyed_by_constraint_and_error(self):
+        compilations = count_compilations(
+            lambda: [
+                self.constraint._function_sql(Disallow1QC),
+                self.constraint._function_sql(Disallow1QC, error="Custom"),
+                self.constraint.clone(mode="shadow")._function_sql(Disallow1QC),
+            ]
+        )
+        self.assertEqual(len(compilations), 3)
+
+    def test_keyed_by_fields(self):
+        # The model as of a migration lacking the field added later on
+        model_state = ModelState.from_model(Disallow1QC)
+        model_state.fields.append(("extra", models.IntegerField(null=True)))
+        state = ProjectState()
+        state.add_model(model_state)
+        historical = state.apps.get_model(
+            "django_queryset_constraint", "Disallow1QC"
+        )
+        compilations = count_compilations(
+            lambda: [
+                self.constraint._function_sql(Disallow1QC),
+                self.constraint._function_sql(historical),
+                self.constraint._function_sql(historical),
+            ]
+        )
+        self.assertEqual(len(compilations), 2)
+
+    def test_keyed_by_joined_models(self):
+        constraint = PizzaTopping._meta.constraints[1]
+        # The joined model as of a migration lacking the field added later on
+        state = ProjectState.from_apps(apps)
+        state.models["django_queryset_constraint", "topping"].fields.append(
+            ("extra", models.IntegerField(null=True))
+        )
+        historical = state.apps.get_model(
+            "django_queryset_constraint", "PizzaTopping"
+        )
+        compilations = count_compilations(
+            lambda: [
+                constraint._function_sql(PizzaTopping),
+                constraint._function_sql(historical),
+                constraint._function_sql(historical),
+            ]
+        )
+        self.assertEqual(len(compilations), 2)
+
+    def test_keyed_by_joined_partitioning(self):
+        constraint = PizzaTopping._meta.constraints[1]
+        compilations = count_compilations(
+            lambda: constraint._function_sql(PizzaTopping)
+        )
+        self.assertEqual(len(compilations), 1)
+        # The joined table partitioned since, e.g. in another database
+        with mock.patch.object(
+            constraints, "is_partitioned", return_value=True
+        ):
+            compilations = count_compilations(
+                lambda: constraint._function_sql(PizzaTopping)
+            )
+        self.assertEqual(len(compilations), 1)
+
+
+class RolloutTests(TransactionTestCase):
+    def setUp(self):
+        self.constraint = Disallow1QC._meta.constraints[0]
+        self.trigger_name = self.constraint._generate_names(TABLE)[1]
+
+    def triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_trigger WHERE tgname = %s;",
+                [self.trigger_name],
+            )
+            return cursor.fetchone()[0]
+
+    def test_remove_and_install(self):
+        failures = apply_to_databases(
+            Disallow1QC, [self.constraint], ["default"], remove=True
+        )
+        self.assertEqual(failures, {})
+        self.assertEqual(self.triggers(), 0)
+        constraints._function_sql_cache.clear()
+        compilations = count_compilations(
+            lambda: failures.update(
+                apply_to_databases(Disallow1QC, [self.constraint], ["default"])
+            )
+        )
+        self.assertEqual(failures, {})
+        self.assertEqual(compilations, [self.constraint.name])
+        self.assertEqual(self.triggers(), 1)
+
+    def test_failures(self):
+        # The trigger already exists
+        failures = apply_to_databases(
+            Disallow1QC, [self.constraint], ["default"]
+        )
+        self.assertEqual(list(failures), ["default"])
+        self.assertIn("already exists", failures["default"])
+        self.assertEqual(self.triggers(), 1)
+
+    def apply(self, *args):
+        out = StringIO()
+        call_command(
+            "apply_constraint_to_databases",
+            "django_queryset_constraint.Disallow1QC",
+            "QC: Disallow age=1",
+            *args,
+            stdout=out,
+            stderr=StringIO()
+        )
+        return out.getvalue()
+
+    def test_command(self):
+        self.assertIn("1 applied, 0 failed", self.apply("--remove"))
+        self.assertEqual(self.triggers(), 0)
+        self.assertIn(
+            "1 applied, 0 failed", self.apply("--databases", "default")
+        )
+        self.assertEqual(self.triggers(), 1)
+        with self.assertRaisesMessage(
+            CommandError, "Failed to apply to 1 databases"
+        ):
+            self.apply()
+
+    def test_unknown_database(self):
+        with self.assertRaisesMessage(CommandError, "Unknown databases: x"):
+            self.apply("--databases", "x")
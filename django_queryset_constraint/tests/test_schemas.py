@@ -0,0 +1,123 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.utils import IntegrityError
+from django.test import TransactionTestCase
+
+from django_queryset_constraint.models import Disallow1QC
+from django_queryset_constraint.schemas import (
+    PROGRESS_TABLE,
+    SchemaApplier,
+    compile_ddl,
+)
+
+TABLE = Disallow1QC._meta.db_table
+SCHEMAS = ["tenant1", "tenant2", "tenant3"]
+NAME = "QC: Disallow age=1"
+
+
+class SchemaTests(TransactionTestCase):
+    def setUp(self):
+        self.constraint = Disallow1QC._meta.constraints[0]
+        self.trigger_name = self.constraint._generate_names(TABLE)[1]
+        with connection.cursor() as cursor:
+            for schema in SCHEMAS:
+                cursor.execute(
+                    "CREATE SCHEMA {0}; "
+                    "CREATE TABLE {0}.{1} (LIKE public.{1} INCLUDING DEFAULTS);".format(
+                        schema, TABLE
+                    )
+                )
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            for schema in SCHEMAS:
+                cursor.execute("DROP SCHEMA {} CASCADE;".format(schema))
+            cursor.execute("DROP TABLE IF EXISTS {};".format(PROGRESS_TABLE))
+
+    def triggered_schemas(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT n.nspname FROM pg_trigger t "
+                "JOIN pg_class c ON c.oid = t.tgrelid "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE t.tgname = %s ORDER BY 1;",
+                [self.trigger_name],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def apply(self, *args):
+        out = StringIO()
+        call_command(
+            "apply_constraint_to_schemas",
+            "django_queryset_constraint.Disallow1QC",
+            NAME,
+            *args,
+            stdout=out,
+            stderr=StringIO()
+        )
+        return out.getvalue()
+
+    def test_install_and_remove(self):
+        out = self.apply("--schemas", *SCHEMAS, "--concurrency=2")
+        self.assertIn("3 applied, 0 skipped, 0 failed", out)
+        self.assertEqual(self.triggered_schemas(), ["public"] + SCHEMAS)
+        # The trigger checks the table of its schema
+        with self.assertRaisesMessage(IntegrityError, NAME):
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL search_path TO tenant2;")
+                    cursor.execute(
+                        "INSERT INTO {} (age) VALUES (1);".format(TABLE)
+                    )
+        out = self.apply("--schemas", *SCHEMAS, "--remove")
+        self.assertIn("3 applied, 0 skipped, 0 failed", out)
+        self.assertEqual(self.triggered_schemas(), ["public"])
+
+    def test_search_path_of_writer(self):
+        self.apply("--schemas", "tenant2")
+        # The public table does not hold the row, the tenant's does
+        with self.assertRaisesMessage(IntegrityError, NAME):
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "INSERT INTO tenant2.{} (age) VALUES (1);".format(TABLE)
+                    )
+        Disallow1QC.objects.create(age=2)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO tenant1.{} (age) VALUES (1);".format(TABLE)
+            )
+
+    def test_defaults_to_schemas_with_table(self):
+        out = self.apply("--schemas", "tenant1")
+        self.assertIn("1 applied", out)
+        # All other schemas, including public, already have the trigger
+        with self.assertRaises(CommandError):
+            self.apply()
+        self.assertEqual(self.triggered_schemas(), ["public"] + SCHEMAS)
+
+    def test_resume(self):
+        self.apply("--schemas", "tenant1")
+        out = self.apply("--schemas", *SCHEMAS)
+        self.assertIn("2 applied, 1 skipped, 0 failed", out)
+        out = self.apply("--schemas", *SCHEMAS)
+        self.assertIn("0 applied, 3 skipped, 0 failed", out)
+
+    def test_failures(self):
+        with self.assertRaisesMessage(
+            CommandError, "Failed to apply to 1 schemas"
+        ):
+            self.apply("--schemas", "tenant1", "missing")
+        self.assertEqual(self.triggered_schemas(), ["public", "tenant1"])
+        # Failed schemas are retried
+        statements = compile_ddl(Disallow1QC, self.constraint)
+        applier = SchemaApplier(statements)
+        applied, skipped, failures = applier.run(["tenant1", "missing"])
+        self.assertEqual((applied, skipped), ([], ["tenant1"]))
+        self.assertEqual(list(failures), ["missing"])
+
+    def test_invalid_concurrency(self):
+        with self.assertRaises(ValueError):
+            SchemaApplier([], concurrency=0)
@@ -0,0 +1,124 @@
+from io import StringIO
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.state import ProjectState
+from django.db.utils import IntegrityError
+from django.test import TestCase, TransactionTestCase
+from parameterized import parameterized
+
+from django_queryset_constraint import M, QuerysetConstraint
+from django_queryset_constraint.constraints import SHADOW_LOG_TABLE
+from django_queryset_constraint.models import Disallow1ShadowQC
+from django_queryset_constraint.operations import AlterQuerysetConstraintMode
+
+
+def shadow_log():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT constraint_name, violated FROM {} ORDER BY id;".format(
+                SHADOW_LOG_TABLE
+            )
+        )
+        return cursor.fetchall()
+
+
+class ShadowModeArgumentTests(TestCase):
+    @parameterized.expand(
+        [
+            [{"mode": "unknown"}],
+            [{"sample_rate": 0}],
+            [{"sample_rate": 1.5}],
+            [{"max_rows": 0}],
+        ]
+    )
+    def test_invalid_arguments(self, kwargs):
+        with self.assertRaises(ValueError):
+            QuerysetConstraint(M().objects.all(), "name", **kwargs)
+
+    def test_deconstruct(self):
+        constraint = QuerysetConstraint(
+            M().objects.all(), "name", mode="shadow", sample_rate=0.1
+        )
+        _, _, kwargs = constraint.deconstruct()
+        self.assertEqual(kwargs["mode"], "shadow")
+        self.assertEqual(kwargs["sample_rate"], 0.1)
+        self.assertNotIn("max_rows", kwargs)
+        self.assertEqual(QuerysetConstraint(**kwargs), constraint)
+        self.assertNotEqual(constraint.clone(mode="enforce"), constraint)
+
+
+class ShadowModeTests(TransactionTestCase):
+    name = "QC: Shadow disallow age=1"
+
+    def setUp(self):
+        call_command("shadow_report", "--reset", stdout=StringIO())
+
+    def test_records_violations(self):
+        Disallow1ShadowQC.objects.create(age=2)
+        Disallow1ShadowQC.objects.create(age=1)
+        self.assertEqual(Disallow1ShadowQC.objects.count(), 2)
+        self.assertEqual(shadow_log(), [(self.name, False), (self.name, True)])
+
+    def test_max_rows(self):
+        for _ in range(5):
+            Disallow1ShadowQC.objects.create(age=1)
+        self.assertEqual(len(shadow_log()), 3)
+
+    def test_validate_never_raises(self):
+        constraint = Disallow1ShadowQC._meta.constraints[0]
+        constraint.validate(Disallow1ShadowQC, Disallow1ShadowQC(age=1))
+
+    def test_report(self):
+        Disallow1ShadowQC.objects.create(age=2)
+        Disallow1ShadowQC.objects.create(age=1)
+        out = StringIO()
+        call_command("shadow_report", "--reset", stdout=out)
+        self.assertIn(
+            self.name + " on django_queryset_constraint_disallow1shadowqc: "
+            "2 checks, 1 violations (50.0%)",
+            out.getvalue(),
+        )
+        self.assertEqual(shadow_log(), [])
+        out = StringIO()
+        call_command("shadow_report", stdout=out)
+        self.assertEqual(out.getvalue(), "No checks recorded.\n")
+
+
+class AlterModeOperationTests(TransactionTestCase):
+    def migrate(self, operation, backwards=False):
+        from_state = ProjectState.from_apps(apps)
+        to_state = from_state.clone()
+        operation.state_forwards("django_queryset_constraint", to_state)
+        with connection.schema_editor() as editor:
+            if backwards:
+                operation.database_backwards(
+                    "django_queryset_constraint", editor, to_state, from_state
+                )
+            else:
+                operation.database_forwards(
+                    "django_queryset_constraint", editor, from_state, to_state
+                )
+        return to_state
+
+    def test_switch_to_enforce(self):
+        operation = AlterQuerysetConstraintMode(
+            "disallow1shadowqc", "QC: Shadow disallow age=1", "enforce"
+        )
+        self.assertEqual(
+            operation.describe(),
+            "Switch constraint QC: Shadow disallow age=1 on model "
+            "disallow1shadowqc to enforce mode",
+        )
+        to_state = self.migrate(operation)
+        model = to_state.apps.get_model(
+            "django_queryset_constraint", "disallow1shadowqc"
+        )
+        self.assertEqual(model._meta.constraints[0].mode, "enforce")
+        try:
+            with self.assertRaises(IntegrityError):
+                Disallow1ShadowQC.objects.create(age=1)
+        finally:
+            self.migrate(operation, backwards=True)
+        Disallow1ShadowQC.objects.create(age=1)
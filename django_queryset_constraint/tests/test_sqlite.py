@@ -0,0 +1,262 @@
+import unittest
+import warnings
+
+from django.apps import apps
+from django.db import connections, models, transaction
+from django.db.migrations import RemoveConstraint
+from django.db.migrations.state import ProjectState
+from django.db.models.signals import post_migrate, pre_migrate
+from django.db.utils import IntegrityError
+from parameterized import parameterized
+
+from django_queryset_constraint import metrics, sqlite
+from django_queryset_constraint.apps import DjangoQuerysetConstraintConfig
+from django_queryset_constraint.models import (
+    Disallow1QC,
+    Disallow1ShadowQC,
+    Disallow1SubqueryQC,
+    Disallow1TriggerNewQC,
+    Order,
+    Pizza,
+    PizzaTopping,
+    Topping,
+    UniqueAgeLockedQC,
+)
+from django_queryset_constraint.sqlite import suspended_triggers
+
+ALIAS = "sqlite"
+MODELS = [
+    Disallow1QC,
+    Disallow1SubqueryQC,
+    Disallow1TriggerNewQC,
+    Topping,
+    Pizza,
+    PizzaTopping,
+]
+
+
+class SQLiteTests(unittest.TestCase):
+    """Constraints on an in-memory SQLite database, outside of any test
+    database transaction.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.databases[ALIAS] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": ":memory:",
+        }
+        # The triggers are created along with the tables
+        with connections[ALIAS].schema_editor() as editor:
+            for model in MODELS:
+                editor.create_model(model)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[ALIAS].close()
+        del connections[ALIAS]
+        del connections.databases[ALIAS]
+        super().tearDownClass()
+
+    def tearDown(self):
+        for model in reversed(MODELS):
+            model.objects.using(ALIAS).all().delete()
+
+    @parameterized.expand(
+        [
+            [Disallow1QC, "QC: Disallow age=1"],
+            [Disallow1SubqueryQC, "QC: Disallow age=1 via subquery"],
+            [Disallow1TriggerNewQC, "QC: Disallow age=1 via trigger NEW"],
+        ]
+    )
+    def test_insert_and_update(self, model, name):
+        instance = model.objects.using(ALIAS).create(age=0)
+        with self.assertRaisesRegex(
+            IntegrityError, "Invariant broken: " + name
+        ):
+            model.objects.using(ALIAS).create(age=1)
+        instance.age = 1
+        with self.assertRaises(IntegrityError):
+            instance.save(using=ALIAS)
+        self.assertEqual(model.objects.using(ALIAS).get().age, 0)
+
+    def test_grouped(self):
+        pizza = Pizza.objects.using(ALIAS).create(name="Everything")
+        for index in range(5):
+            topping = Topping.objects.using(ALIAS).create(name=str(index))
+            PizzaTopping.objects.using(ALIAS).create(
+                pizza=pizza, topping=topping
+            )
+        topping = Topping.objects.using(ALIAS).create(name="One too many")
+        with self.assertRaisesRegex(IntegrityError, "At most 5 toppings"):
+            PizzaTopping.objects.using(ALIAS).create(
+                pizza=pizza, topping=topping
+            )
+
+    def test_joined_table(self):
+        pizza = Pizza.objects.using(ALIAS).create(name="Hawaii")
+        ham = Topping.objects.using(ALIAS).create(name="Ham")
+        PizzaTopping.objects.using(ALIAS).create(pizza=pizza, topping=ham)
+        ham.name = "Pineapple"
+        with self.assertRaisesRegex(IntegrityError, "No pineapple"):
+            ham.save(using=ALIAS)
+
+    def test_checked_per_statement(self):
+        # There are no deferred triggers, thus rows violating the constraint
+        # cannot be fixed later within the same transaction.
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic(using=ALIAS):
+                instance = Disallow1QC.objects.using(ALIAS).create(age=1)
+                instance.age = 0
+                instance.save(using=ALIAS)
+
+    def test_metrics(self):
+        backend = metrics.install()
+        try:
+            with self.assertRaises(IntegrityError):
+                Disallow1QC.objects.using(ALIAS).create(age=1)
+            pizza = Pizza.objects.using(ALIAS).create(name="Hawaii")
+            PizzaTopping.objects.using(ALIAS).create(
+                pizza=pizza,
+                topping=Topping.objects.using(ALIAS).create(name="Ham"),
+            )
+            # Other errors are not counted
+            with self.assertRaises(IntegrityError):
+                Pizza.objects.using(ALIAS).create(pk=pizza.pk, name="Other")
+        finally:
+            metrics.uninstall()
+        self.assertEqual(
+            dict(backend.counters[metrics.VIOLATIONS]),
+            {(("constraint", "QC: Disallow age=1"),): 1},
+        )
+        self.assertEqual(len(backend.histograms[metrics.STATEMENT_SECONDS]), 2)
+
+    def remove_constraint(self, model, name, backwards=False):
+        operation = RemoveConstraint(model._meta.model_name, name)
+        from_state = ProjectState.from_apps(apps)
+        to_state = from_state.clone()
+        operation.state_forwards("django_queryset_constraint", to_state)
+        if backwards:
+            from_state, to_state = to_state, from_state
+        # As migrate does, recreating the triggers of the resulting state
+        with suspended_triggers(ALIAS, apps=to_state.apps):
+            with connections[ALIAS].schema_editor() as editor:
+                if backwards:
+                    operation.database_backwards(
+                        "django_queryset_constraint",
+                        editor,
+                        from_state,
+                        to_state,
+                    )
+                else:
+                    operation.database_forwards(
+                        "django_queryset_constraint",
+                        editor,
+                        from_state,
+                        to_state,
+                    )
+
+    def triggers(self, model):
+        with connections[ALIAS].cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'trigger' AND tbl_name = %s;",
+                [model._meta.db_table],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_remove_constraint(self):
+        self.remove_constraint(Disallow1QC, "QC: Disallow age=1")
+        try:
+            Disallow1QC.objects.using(ALIAS).create(age=1)
+        finally:
+            Disallow1QC.objects.using(ALIAS).all().delete()
+            self.remove_constraint(
+                Disallow1QC, "QC: Disallow age=1", backwards=True
+            )
+        with self.assertRaises(IntegrityError):
+            Disallow1QC.objects.using(ALIAS).create(age=1)
+
+    def test_remove_constraint_of_joined_table(self):
+        ham = Topping.objects.using(ALIAS).create(name="Ham")
+        PizzaTopping.objects.using(ALIAS).create(
+            pizza=Pizza.objects.using(ALIAS).create(name="Hawaii"), topping=ham
+        )
+        self.assertEqual(len(self.triggers(Topping)), 1)
+        self.remove_constraint(PizzaTopping, "No pineapple")
+        try:
+            # The trigger of the joined table is removed along with it
+            self.assertEqual(self.triggers(Topping), [])
+            ham.name = "Pineapple"
+            ham.save(using=ALIAS)
+        finally:
+            ham.name = "Ham"
+            ham.save(using=ALIAS)
+            self.remove_constraint(PizzaTopping, "No pineapple", backwards=True)
+        self.assertEqual(len(self.triggers(Topping)), 1)
+        self.test_joined_table()
+
+    def test_remake_tables(self):
+        # Altering fields remakes the table, which requires suspending the
+        # triggers of the constraints reading it via. joins
+        field = models.CharField(max_length=40)
+        field.set_attributes_from_name("name")
+        with suspended_triggers(ALIAS):
+            with connections[ALIAS].schema_editor() as editor:
+                editor.alter_field(
+                    Topping, Topping._meta.get_field("name"), field
+                )
+        self.test_joined_table()
+        # The triggers reading the remade table were left intact
+        self.test_grouped()
+
+    def test_skipped(self):
+        with self.assertWarnsRegex(RuntimeWarning, "'shadow' mode"):
+            with connections[ALIAS].schema_editor() as editor:
+                editor.create_model(Disallow1ShadowQC)
+        try:
+            self.assertEqual(self.triggers(Disallow1ShadowQC), [])
+            Disallow1ShadowQC.objects.using(ALIAS).create(age=1)
+        finally:
+            with connections[ALIAS].schema_editor() as editor:
+                editor.delete_model(Disallow1ShadowQC)
+
+    def test_ignored_options(self):
+        # Writes are serialized, thus the advisory lock is unnecessary
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            with connections[ALIAS].schema_editor() as editor:
+                editor.create_model(UniqueAgeLockedQC)
+        try:
+            self.assertEqual(caught, [])
+            UniqueAgeLockedQC.objects.using(ALIAS).create(age=1)
+            with self.assertRaises(IntegrityError):
+                UniqueAgeLockedQC.objects.using(ALIAS).create(age=1)
+        finally:
+            with connections[ALIAS].schema_editor() as editor:
+                editor.delete_model(UniqueAgeLockedQC)
+
+    def test_deletes_not_checked(self):
+        with self.assertWarnsRegex(RuntimeWarning, "'check_deletes'"):
+            with connections[ALIAS].schema_editor() as editor:
+                editor.create_model(Order)
+        try:
+            # Inserts and updates are checked nonetheless
+            self.assertEqual(len(self.triggers(Order)), 2)
+        finally:
+            with connections[ALIAS].schema_editor() as editor:
+                editor.delete_model(Order)
+
+    def test_migrate_receivers(self):
+        # Connected by the app, rather than as the module is imported
+        self.assertIsInstance(
+            apps.get_app_config("django_queryset_constraint"),
+            DjangoQuerysetConstraintConfig,
+        )
+        for signal, receiver in [
+            (pre_migrate, "suspend_app_triggers"),
+            (post_migrate, "install_app_triggers"),
+        ]:
+            uids = [key[0] for key, _ in signal.receivers]
+            self.assertIn(sqlite.__name__ + "." + receiver, uids)
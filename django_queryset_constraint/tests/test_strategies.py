@@ -0,0 +1,332 @@
+from contextlib import contextmanager
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.utils import IntegrityError
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from django_queryset_constraint import constraints
+from django_queryset_constraint.checkpoint import get_trigger_names
+from django_queryset_constraint.constraints import (
+    QuerysetConstraint,
+    get_queryset_constraint,
+)
+from django_queryset_constraint.models import (
+    Disallow1QC,
+    Disallow1ShadowQC,
+    Disallow1SubqueryQC,
+    Disallow1TriggerNewQC,
+    Pizza,
+    PizzaTopping,
+    Topping,
+)
+from django_queryset_constraint.strategies import (
+    STRATEGY_TABLE,
+    check_expression,
+    decide,
+    recorded_decision,
+    reevaluate,
+)
+from django_queryset_constraint.utils import M
+
+
+def auto(model, name, **kwargs):
+    constraint = get_queryset_constraint(model, name)
+    return constraint.clone(**dict({"strategy": "auto"}, **kwargs))
+
+
+@contextmanager
+def swapped(model, name, **kwargs):
+    """Install a clone of constraint name in its place, for the block."""
+    original = get_queryset_constraint(model, name)
+    clone = original.clone(**kwargs)
+    constraints = model._meta.constraints
+    with connection.schema_editor() as editor:
+        editor.remove_constraint(model, original)
+        editor.add_constraint(model, clone)
+    model._meta.constraints = [
+        clone if constraint is original else constraint
+        for constraint in constraints
+    ]
+    try:
+        yield clone
+    finally:
+        model._meta.constraints = constraints
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(model, clone)
+            editor.add_constraint(model, original)
+
+
+def check_constraints(model):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM pg_constraint WHERE conrelid = %s::regclass "
+            "AND conname LIKE 'dct\\_\\_check\\_\\_%%';",
+            [model._meta.db_table],
+        )
+        return cursor.fetchone()[0]
+
+
+class StrategyTests(TestCase):
+    def test_validation(self):
+        with self.assertRaisesMessage(ValueError, "'strategy'"):
+            QuerysetConstraint(
+                name="test", queryset=M().objects.all(), strategy="batch"
+            )
+        with self.assertRaisesMessage(ValueError, "strategy='check'"):
+            QuerysetConstraint(
+                name="test",
+                queryset=M().objects.all(),
+                mode="shadow",
+                strategy="check",
+            )
+
+    def test_deconstruct(self):
+        constraint = get_queryset_constraint(Disallow1QC, "QC: Disallow age=1")
+        self.assertNotIn("strategy", constraint.deconstruct()[2])
+        self.assertEqual(
+            constraint.clone(strategy="auto").deconstruct()[2]["strategy"],
+            "auto",
+        )
+
+    def test_check_expression(self):
+        constraint = get_queryset_constraint(Disallow1QC, "QC: Disallow age=1")
+        self.assertEqual(
+            check_expression(constraint, Disallow1QC, connection),
+            'NOT ("age" = 1)',
+        )
+        constraint = get_queryset_constraint(PizzaTopping, "At most 5 toppings")
+        self.assertIsNone(
+            check_expression(constraint, PizzaTopping, connection)
+        )
+
+    def test_row_queryset(self):
+        constraint = get_queryset_constraint(PizzaTopping, "At most 5 toppings")
+        self.assertIn(
+            '= ((NEW."pizza_id"))',
+            constraint.clone(strategy="row")._function_sql(PizzaTopping),
+        )
+        self.assertNotIn(
+            '= ((NEW."pizza_id"))', constraint._function_sql(PizzaTopping)
+        )
+        constraint = get_queryset_constraint(
+            Disallow1SubqueryQC, "QC: Disallow age=1 via subquery"
+        )
+        with self.assertRaisesMessage(
+            ValueError, "cannot be checked per group"
+        ):
+            constraint.clone(strategy="row")._function_sql(Disallow1SubqueryQC)
+
+
+class DecideTests(TestCase):
+    def decide(self, model, name, **kwargs):
+        return decide(auto(model, name), model, connection, **kwargs)
+
+    def test_explicit(self):
+        constraint = get_queryset_constraint(Disallow1QC, "QC: Disallow age=1")
+        self.assertEqual(
+            decide(constraint, Disallow1QC, connection).strategy, "statement"
+        )
+
+    def test_row_local(self):
+        self.assertEqual(
+            self.decide(
+                Disallow1QC, "QC: Disallow age=1", defer=False
+            ).strategy,
+            "check",
+        )
+        # CHECK constraints are not deferrable
+        self.assertNotEqual(
+            self.decide(Disallow1QC, "QC: Disallow age=1").strategy, "check"
+        )
+        # CHECK constraints cannot record violations
+        self.assertEqual(
+            self.decide(
+                Disallow1ShadowQC, "QC: Shadow disallow age=1", defer=False
+            ).strategy,
+            "row",
+        )
+
+    def test_whole_queryset(self):
+        self.assertEqual(
+            self.decide(
+                Disallow1TriggerNewQC, "QC: Disallow age=1 via trigger NEW"
+            ).strategy,
+            "statement",
+        )
+        decision = self.decide(
+            Disallow1SubqueryQC, "QC: Disallow age=1 via subquery"
+        )
+        self.assertEqual(decision.strategy, "statement")
+        self.assertIn("per group", decision.reason)
+
+    def test_costs(self):
+        decision = self.decide(PizzaTopping, "At most 5 toppings")
+        self.assertEqual(decision.strategy, "row")
+        self.assertIn("empty", decision.reason)
+
+        toppings = Topping.objects.bulk_create(
+            [Topping(name=str(i)) for i in range(5)]
+        )
+        for i in range(100):
+            pizza = Pizza.objects.create(name=str(i))
+            PizzaTopping.objects.bulk_create(
+                [PizzaTopping(pizza=pizza, topping=t) for t in toppings]
+            )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE {};".format(PizzaTopping._meta.db_table))
+        decision = self.decide(
+            PizzaTopping, "At most 5 toppings", groups_per_statement=1
+        )
+        self.assertEqual(decision.strategy, "row")
+        self.assertEqual(decision.reltuples, 500)
+        self.assertLess(decision.row_cost, decision.statement_cost)
+        decision = self.decide(
+            PizzaTopping, "At most 5 toppings", groups_per_statement=1000
+        )
+        self.assertEqual(decision.strategy, "statement")
+
+
+class InstallTests(TransactionTestCase):
+    def test_check(self):
+        original = get_queryset_constraint(Disallow1QC, "QC: Disallow age=1")
+        constraint = original.clone(strategy="auto")
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(Disallow1QC, original)
+            constraint._install_trigger(editor, Disallow1QC, defer=False)
+        try:
+            self.assertEqual(check_constraints(Disallow1QC), 1)
+            self.assertEqual(
+                recorded_decision(
+                    auto(Disallow1QC, "QC: Disallow age=1"),
+                    Disallow1QC,
+                    connection,
+                ).strategy,
+                "check",
+            )
+            self.assertNotIn(
+                Disallow1QC._meta.constraints[0]._generate_names(
+                    Disallow1QC._meta.db_table
+                )[1],
+                get_trigger_names(),
+            )
+            Disallow1QC.objects.create(age=2)
+            # Raised immediately, rather than at commit
+            with transaction.atomic():
+                with self.assertRaises(IntegrityError):
+                    with transaction.atomic():
+                        Disallow1QC.objects.create(age=1)
+        finally:
+            with connection.schema_editor() as editor:
+                editor.remove_constraint(Disallow1QC, constraint)
+                editor.add_constraint(Disallow1QC, original)
+        self.assertEqual(check_constraints(Disallow1QC), 0)
+        self.assertIsNone(
+            recorded_decision(
+                auto(Disallow1QC, "QC: Disallow age=1"), Disallow1QC, connection
+            )
+        )
+
+    def test_auto_deferred(self):
+        with swapped(Disallow1QC, "QC: Disallow age=1", strategy="auto"):
+            self.assertEqual(check_constraints(Disallow1QC), 0)
+            # Fixed before commit, as checked by the deferred triggers
+            with transaction.atomic():
+                instance = Disallow1QC.objects.create(age=1)
+                instance.age = 2
+                instance.save()
+            with self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    Disallow1QC.objects.create(age=1)
+
+    def test_row(self):
+        toppings = Topping.objects.bulk_create(
+            [Topping(name=str(i)) for i in range(6)]
+        )
+        pizza = Pizza.objects.create(name="Hawaiian")
+        with swapped(PizzaTopping, "At most 5 toppings", strategy="row"):
+            PizzaTopping.objects.bulk_create(
+                [PizzaTopping(pizza=pizza, topping=t) for t in toppings[:5]]
+            )
+            with self.assertRaisesMessage(
+                IntegrityError, "Invariant broken: At most 5 toppings"
+            ):
+                PizzaTopping.objects.create(pizza=pizza, topping=toppings[5])
+
+    def test_reevaluate(self):
+        name = "At most 5 toppings"
+        with swapped(PizzaTopping, name, strategy="auto") as constraint:
+            previous, decision = reevaluate(
+                PizzaTopping, constraint, connection, groups_per_statement=1
+            )
+            self.assertEqual((previous, decision.strategy), ("row", "row"))
+            PizzaTopping.objects.create(
+                pizza=Pizza.objects.create(name="Margherita"),
+                topping=Topping.objects.create(name="Basil"),
+            )
+            previous, decision = reevaluate(
+                PizzaTopping, constraint, connection, groups_per_statement=1000
+            )
+            self.assertEqual(previous, "row")
+            self.assertEqual(
+                recorded_decision(constraint, PizzaTopping, connection),
+                decision,
+            )
+            out = StringIO()
+            call_command(
+                "reevaluate_strategies",
+                "django_queryset_constraint.PizzaTopping",
+                "--dry-run",
+                stdout=out,
+            )
+            self.assertIn(
+                name + ": " + decision.strategy + " -> ", out.getvalue()
+            )
+        with self.assertRaisesMessage(ValueError, "strategy='auto'"):
+            reevaluate(
+                PizzaTopping,
+                get_queryset_constraint(PizzaTopping, name),
+                connection,
+            )
+
+    def test_decided_once(self):
+        name = "At most 5 toppings"
+        original = get_queryset_constraint(PizzaTopping, name)
+        constraints._function_sql_cache.clear()
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(PizzaTopping, original)
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                with connection.schema_editor() as editor:
+                    editor.add_constraint(
+                        PizzaTopping, auto(PizzaTopping, name)
+                    )
+            # The empty table is only explained for checking all of it
+            self.assertEqual(
+                sum(q["sql"].startswith("EXPLAIN") for q in queries), 1
+            )
+        finally:
+            with connection.schema_editor() as editor:
+                editor.remove_constraint(PizzaTopping, auto(PizzaTopping, name))
+                editor.add_constraint(PizzaTopping, original)
+
+    def test_remove_without_decision(self):
+        name = "QC: Disallow age=1"
+        with swapped(Disallow1QC, name, strategy="auto") as constraint:
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM {};".format(STRATEGY_TABLE))
+            with connection.schema_editor(collect_sql=True) as editor:
+                editor.remove_constraint(Disallow1QC, constraint)
+            # Either might have been installed
+            sql = "".join(editor.collected_sql)
+            self.assertIn("DROP CONSTRAINT IF EXISTS", sql)
+            self.assertIn("DROP TRIGGER IF EXISTS", sql)
+        self.assertEqual(check_constraints(Disallow1QC), 0)
+
+    def test_command_arguments(self):
+        with self.assertRaisesMessage(CommandError, "--groups-per-statement"):
+            call_command("reevaluate_strategies", "--groups-per-statement=0")
+        with self.assertRaises(CommandError):
+            call_command("reevaluate_strategies", "unknown.Model")
@@ -0,0 +1,68 @@
+from django.db import connection
+from django.db.utils import IntegrityError
+from django.test import TransactionTestCase
+
+from django_queryset_constraint.models import AllowAll, Disallow1QC
+from django_queryset_constraint.testing import (
+    FastFlushMixin,
+    TemplateDatabaseCreationMixin,
+    bypass_triggers,
+    fast_flush,
+    schema_digest,
+)
+from django_queryset_constraint.tests.test_validation import without_triggers
+
+
+def database_exists(name):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s;", [name])
+        return cursor.fetchone() is not None
+
+
+class TemplateDatabaseTests(TransactionTestCase):
+    def setUp(self):
+        if not isinstance(connection.creation, TemplateDatabaseCreationMixin):
+            self.skipTest("Not run by TemplateDatabaseRunner")
+
+    def test_schema_digest(self):
+        digest = schema_digest(connection)
+        self.assertEqual(len(digest), 12)
+        self.assertEqual(schema_digest(connection), digest)
+        self.assertTrue(connection.creation.template_name.endswith(digest))
+
+    def test_clone_from_template(self):
+        creation = connection.creation
+        self.assertTrue(database_exists(creation.template_name))
+        clone = creation.get_test_db_clone_settings("clone")["NAME"]
+        creation._clone_test_db("clone", verbosity=0)
+        try:
+            self.assertTrue(database_exists(clone))
+        finally:
+            creation._destroy_test_db(clone, verbosity=0)
+        self.assertFalse(database_exists(clone))
+
+
+class FastFlushTests(FastFlushMixin, TransactionTestCase):
+    def test_bypass_triggers(self):
+        with bypass_triggers("default"):
+            Disallow1QC.objects.create(age=1)
+        with self.assertRaises(IntegrityError):
+            Disallow1QC.objects.create(age=1)
+
+    def test_fast_flush(self):
+        AllowAll.objects.create(age=1)
+        without_triggers(lambda: Disallow1QC.objects.create(age=1))
+        fast_flush("default")
+        self.assertFalse(AllowAll.objects.exists())
+        self.assertFalse(Disallow1QC.objects.exists())
+        # The triggers are only bypassed while flushing
+        with self.assertRaises(IntegrityError):
+            Disallow1QC.objects.create(age=1)
+
+    def test_flushed_between_tests(self):
+        # Either test runs first, the other finds the table empty
+        self.assertFalse(Disallow1QC.objects.exists())
+        without_triggers(lambda: Disallow1QC.objects.create(age=1))
+
+    def test_flushed_between_tests_again(self):
+        self.test_flushed_between_tests()
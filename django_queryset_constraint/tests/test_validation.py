@@ -0,0 +1,187 @@
+from io import StringIO
+
+from django.apps import apps
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.migrations.state import ProjectState
+from django.db.utils import IntegrityError
+from django.test import TransactionTestCase
+from parameterized import parameterized
+
+from django_queryset_constraint.constraints import get_queryset_constraint
+from django_queryset_constraint.models import (
+    AllowAll,
+    AllowOnly1ObjectQC,
+    Disallow1QC,
+    PizzaNC,
+    PizzaTopping,
+    PizzaToppingNC,
+    ToppingNC,
+)
+from django_queryset_constraint.operations import ValidateQuerysetConstraint
+from django_queryset_constraint.validation import (
+    ChunkedValidator,
+    validate_constraint,
+)
+
+
+def without_triggers(code):
+    """Run code without firing any triggers, to create invalid rows."""
+    with connection.cursor() as cursor:
+        cursor.execute("SET session_replication_role = replica;")
+    try:
+        code()
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SET session_replication_role = DEFAULT;")
+
+
+class ChunkedValidatorTests(TransactionTestCase):
+    def setUp(self):
+        self.disallow1 = Disallow1QC._meta.constraints[0]
+        for age in range(10):
+            AllowAll.objects.create(age=age)
+
+    @parameterized.expand([[1, 11], [3, 4], [10, 2], [100, 1]])
+    def test_number_of_chunks(self, chunk_size, num_chunks):
+        validator = ChunkedValidator(
+            AllowAll, self.disallow1, chunk_size=chunk_size
+        )
+        self.assertEqual(len(list(validator.chunks())), num_chunks)
+
+    @parameterized.expand([[1], [3], [100]])
+    def test_finds_violations(self, chunk_size):
+        AllowAll.objects.create(age=1)
+        self.assertEqual(
+            validate_constraint(
+                AllowAll, self.disallow1, chunk_size=chunk_size
+            ),
+            2,
+        )
+
+    def test_unchunkable_queryset(self):
+        constraint = AllowOnly1ObjectQC._meta.constraints[0]
+        validator = ChunkedValidator(AllowAll, constraint, chunk_size=2)
+        self.assertEqual(len(list(validator.chunks())), 1)
+        self.assertEqual(validator.run(), 9)
+
+    def test_resume_from_checkpoint(self):
+        validator = ChunkedValidator(AllowAll, self.disallow1, chunk_size=2)
+        validator._ensure_checkpoint_table()
+        # Pretend we were interrupted after the row with age=1
+        last_pk = AllowAll.objects.get(age=1).pk
+        validator._save_checkpoint(last_pk, 0)
+        self.assertEqual(validator.run(), 0)
+        # Finished checkpoints are restarted, as is the case without resume
+        self.assertEqual(validator.run(), 1)
+        validator._save_checkpoint(last_pk, 0)
+        self.assertEqual(validator.run(resume=False), 1)
+
+    def test_checkpoint_outlives_transaction(self):
+        validator = ChunkedValidator(AllowAll, self.disallow1, chunk_size=2)
+        validator._ensure_checkpoint_table()
+        last_pk = AllowAll.objects.get(age=1).pk
+        with self.assertRaises(ZeroDivisionError):
+            with transaction.atomic():
+                validator._save_checkpoint(last_pk, 3)
+                1 / 0
+        self.assertEqual(validator._load_checkpoint(), (str(last_pk), 3, False))
+        with transaction.atomic():
+            self.assertEqual(validator.run(), 3)
+
+    def test_sleep_in_transaction(self):
+        validator = ChunkedValidator(AllowAll, self.disallow1, sleep=0.1)
+        with self.assertRaisesMessage(ValueError, "'sleep'"):
+            with transaction.atomic():
+                validator.run()
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaises(ValueError):
+            ChunkedValidator(AllowAll, self.disallow1, chunk_size=0)
+
+
+class GroupedValidationTests(TransactionTestCase):
+    def setUp(self):
+        self.at_most_5 = get_queryset_constraint(
+            PizzaTopping, "At most 5 toppings"
+        )
+        toppings = [ToppingNC.objects.create(name=str(x)) for x in range(6)]
+        for num_toppings in [6, 2, 5, 6, 1]:
+            pizza = PizzaNC.objects.create(name=str(num_toppings))
+            for topping in toppings[:num_toppings]:
+                PizzaToppingNC.objects.create(pizza=pizza, topping=topping)
+
+    def test_chunks_by_group(self):
+        queryset = self.at_most_5.get_queryset(PizzaToppingNC)
+        self.assertEqual(
+            self.at_most_5._get_key_field(PizzaToppingNC, queryset).name,
+            "pizza",
+        )
+
+    @parameterized.expand([[1], [4], [7], [100]])
+    def test_groups_are_never_split(self, chunk_size):
+        self.assertEqual(
+            validate_constraint(
+                PizzaToppingNC, self.at_most_5, chunk_size=chunk_size
+            ),
+            2,
+        )
+
+
+class ValidateCommandTests(TransactionTestCase):
+    def test_valid_rows(self):
+        Disallow1QC.objects.create(age=2)
+        out = StringIO()
+        call_command(
+            "validate_constraint",
+            "django_queryset_constraint.Disallow1QC",
+            "--chunk-size=1",
+            stdout=out,
+        )
+        self.assertIn("QC: Disallow age=1: 0 violations", out.getvalue())
+
+    def test_invalid_rows(self):
+        without_triggers(lambda: Disallow1QC.objects.create(age=1))
+        with self.assertRaises(CommandError):
+            call_command(
+                "validate_constraint",
+                "django_queryset_constraint.Disallow1QC",
+                stdout=StringIO(),
+            )
+
+    def test_unknown_constraint(self):
+        with self.assertRaises(CommandError):
+            call_command(
+                "validate_constraint",
+                "django_queryset_constraint.Disallow1QC",
+                "unknown",
+            )
+
+
+class ValidateOperationTests(TransactionTestCase):
+    def apply(self, operation):
+        state = ProjectState.from_apps(apps)
+        with connection.schema_editor() as editor:
+            operation.database_forwards(
+                "django_queryset_constraint", editor, state, state
+            )
+
+    def test_operation(self):
+        operation = ValidateQuerysetConstraint(
+            "disallow1qc", "QC: Disallow age=1", chunk_size=1
+        )
+        self.assertEqual(
+            operation.describe(),
+            "Validate constraint QC: Disallow age=1 on model disallow1qc",
+        )
+        self.assertEqual(operation.deconstruct()[2]["chunk_size"], 1)
+        Disallow1QC.objects.create(age=2)
+        self.apply(operation)
+        without_triggers(lambda: Disallow1QC.objects.create(age=1))
+        with self.assertRaises(IntegrityError):
+            self.apply(operation)
+        # The progress of the rolled back migration is kept
+        validator = ChunkedValidator(
+            Disallow1QC, get_queryset_constraint(Disallow1QC, operation.name)
+        )
+        self.assertEqual(validator._load_checkpoint(), (None, 1, True))
@@ -1,13 +1,16 @@
 from __future__ import unicode_literals
 
+import copy
 import json
-import threading
+from contextvars import ContextVar
 from functools import partial
 
 from django.apps import apps
 
-# Thread local storage used for forwarding model/app to recursive M objects
-tlocals = threading.local()
+# The app label and model name forwarded to recursive M objects. A context
+# variable is local to each thread and asyncio task, and restored as nested
+# reconstructions return.
+model_context = ContextVar("model_context", default=(None, None))
 
 
 class M:
@@ -88,16 +91,20 @@ class M:
                     result, *operation["args"], **operation["kwargs"]
                 )
             elif operation["type"] == "__call__":
-                operation["args"] = list(operation["args"])
-                for idx, arg in enumerate(operation["args"]):
-                    if isinstance(arg, partial):
-                        operation["args"][idx] = self.recursive_unpartial(arg)
-                for arg in operation["kwargs"]:
-                    if isinstance(operation["kwargs"][arg], partial):
-                        operation["kwargs"][arg] = self.recursive_unpartial(
-                            operation["kwargs"][arg]
-                        )
-                result = result(*operation["args"], **operation["kwargs"])
+                # Unfold into copies, as operations may be replayed concurrently
+                args = [
+                    self.recursive_unpartial(arg)
+                    if isinstance(arg, partial)
+                    else arg
+                    for arg in operation["args"]
+                ]
+                kwargs = {
+                    key: self.recursive_unpartial(value)
+                    if isinstance(value, partial)
+                    else value
+                    for key, value in operation["kwargs"].items()
+                }
+                result = result(*args, **kwargs)
             else:
                 raise Exception("Unknown operation!")
         return result
@@ -106,28 +113,19 @@ class M:
         self, app_label_default=None, model_name_default=None
     ):
         # Take default from caller
+        context_app_label, context_model_name = model_context.get()
         app_label = (
-            self.app_label_override or app_label_default or tlocals.app_label
+            self.app_label_override or app_label_default or context_app_label
         )
         model_name = (
-            self.model_name_override or model_name_default or tlocals.model_name
+            self.model_name_override or model_name_default or context_model_name
         )
-        # Update thread-local storage to push it down the stack
-        tlocals.app_label = app_label
-        tlocals.model_name = model_name
-        # Reply to build queryset
-        result = self._construct_queryset(app_label, model_name)
-        # Clean up thread-local storage
+        # Push the model down the stack, restoring the caller's on return
+        token = model_context.set((app_label, model_name))
         try:
-            del tlocals.app_label
-        except AttributeError:
-            pass
-        try:
-            del tlocals.model_name
-        except AttributeError:
-            pass
-        # Return queryset
-        return result
+            return self._construct_queryset(app_label, model_name)
+        finally:
+            model_context.reset(token)
 
     def __getitem__(self, key):
         try:
@@ -173,6 +171,27 @@ class M:
             )
             return self
 
+    def __deepcopy__(self, memo):
+        # Copies are finalized, as is the case when reconstructed from a
+        # migration, such that nested M objects can be replayed.
+        return M(
+            model_name_override=self.model_name_override,
+            app_label_override=self.app_label_override,
+            operations=copy.deepcopy(self.operations, memo),
+        )
+
+    def __reduce__(self):
+        # Pickled like copies, see __deepcopy__. Defined explicitly, as
+        # pickle looks up other hooks, which would be recorded as operations.
+        return (
+            M,
+            (
+                self.model_name_override,
+                self.app_label_override,
+                self.operations,
+            ),
+        )
+
     def deconstruct(self):
         path = "%s.%s" % (self.__class__.__module__, self.__class__.__name__)
         kwargs = {"operations": self.operations}
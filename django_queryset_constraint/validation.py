@@ -0,0 +1,244 @@
+import time
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Table used to remember how far validation of each constraint has come
+CHECKPOINT_TABLE = "dct__validation_checkpoint"
+
+
+class ChunkedValidator:
+    """Validate a :code:`QuerysetConstraint` against pre-existing rows.
+
+    Installing a constraint only guards future writes, thus rows written
+    before the constraint was added may still violate it. Running the
+    constraint queryset as a single query on a large table is prohibitively
+    expensive, so instead the table is walked in keyset-paginated chunks,
+    evaluating the constraint against one chunk at a time.
+
+    Chunks are formed over the primary key, or for grouped querysets over the
+    first grouping field, such that every group is validated within exactly
+    one chunk. Querysets which cannot be filtered (i.e. sliced querysets) are
+    evaluated as a whole.
+
+    Progress is recorded in a checkpoint table after every chunk, such that an
+    interrupted validation can be resumed where it left off. Within a
+    transaction, e.g. that of an atomic migration, progress is recorded over a
+    connection of its own, thus is kept even if the transaction is rolled
+    back.
+    """
+
+    def __init__(
+        self,
+        model,
+        constraint,
+        using=DEFAULT_DB_ALIAS,
+        chunk_size=10000,
+        sleep=0,
+    ):
+        """Construct a validator.
+
+        Args:
+            model (Model):
+                The model upon which the constraint is installed.
+            constraint (QuerysetConstraint):
+                The constraint to validate.
+            using (str, optional):
+                Database alias to validate against.
+            chunk_size (int, optional):
+                Number of rows to include in each chunk.
+            sleep (float, optional):
+                Number of seconds to sleep between chunks. Not allowed within
+                a transaction, which would be held open while sleeping.
+        """
+        if chunk_size < 1:
+            raise ValueError("'chunk_size' should be a positive integer")
+        self.model = model
+        self.constraint = constraint
+        self.using = using
+        self.chunk_size = chunk_size
+        self.sleep = sleep
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    @contextmanager
+    def _checkpoint_cursor(self):
+        """Open a cursor whose writes are committed as they are made."""
+        if not self.connection.in_atomic_block:
+            with self.connection.cursor() as cursor:
+                yield cursor
+            return
+        connection = self.connection.copy()
+        try:
+            with connection.cursor() as cursor:
+                yield cursor
+        finally:
+            connection.close()
+
+    def _ensure_checkpoint_table(self):
+        with self._checkpoint_cursor() as cursor:
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS {} (
+                    table_name TEXT NOT NULL,
+                    constraint_name TEXT NOT NULL,
+                    last_key TEXT,
+                    violations BIGINT NOT NULL DEFAULT 0,
+                    finished BOOLEAN NOT NULL DEFAULT FALSE,
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+                    PRIMARY KEY (table_name, constraint_name)
+                );
+                """.format(
+                    CHECKPOINT_TABLE
+                )
+            )
+
+    def _load_checkpoint(self):
+        with self._checkpoint_cursor() as cursor:
+            cursor.execute(
+                "SELECT last_key, violations, finished FROM {} "
+                "WHERE table_name = %s AND constraint_name = %s;".format(
+                    CHECKPOINT_TABLE
+                ),
+                [self.model._meta.db_table, self.constraint.name],
+            )
+            return cursor.fetchone()
+
+    def _save_checkpoint(self, last_key, violations, finished=False):
+        with self._checkpoint_cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO {} (
+                    table_name, constraint_name, last_key, violations, finished
+                ) VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (table_name, constraint_name) DO UPDATE SET
+                    last_key = EXCLUDED.last_key,
+                    violations = EXCLUDED.violations,
+                    finished = EXCLUDED.finished,
+                    updated_at = now();
+                """.format(
+                    CHECKPOINT_TABLE
+                ),
+                [
+                    self.model._meta.db_table,
+                    self.constraint.name,
+                    None if last_key is None else str(last_key),
+                    violations,
+                    finished,
+                ],
+            )
+
+    def reset(self):
+        """Forget any recorded progress for the constraint."""
+        self._ensure_checkpoint_table()
+        with self._checkpoint_cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM {} "
+                "WHERE table_name = %s AND constraint_name = %s;".format(
+                    CHECKPOINT_TABLE
+                ),
+                [self.model._meta.db_table, self.constraint.name],
+            )
+
+    def _next_upper_bound(self, key, last_key):
+        """Find the largest key of the next chunk, or None if it is the last.
+
+        The chunk is (last_key, upper], with ties on upper included in full.
+        """
+        keys = (
+            self.model._base_manager.using(self.using)
+            .order_by(key.attname)
+            .values_list(key.attname, flat=True)
+        )
+        if last_key is not None:
+            keys = keys.filter(**{key.attname + "__gt": last_key})
+        upper = list(keys[self.chunk_size - 1 : self.chunk_size])
+        if upper:
+            return upper[0]
+        return None
+
+    def chunks(self, start=None):
+        """Generate (queryset, upper_key) pairs for each chunk.
+
+        Args:
+            start (optional):
+                Key value to resume after, or :code:`None` to start from the
+                beginning of the table.
+        """
+        queryset = self.constraint.get_queryset(self.model, using=self.using)
+        key = self.constraint._get_key_field(self.model, queryset)
+        # Unchunkable queryset, check the entire table in one go
+        if key is None:
+            yield queryset, None
+            return
+
+        last_key = start
+        while True:
+            upper = self._next_upper_bound(key, last_key)
+            chunk = queryset
+            if last_key is not None:
+                chunk = chunk.filter(**{key.attname + "__gt": last_key})
+            if upper is not None:
+                chunk = chunk.filter(**{key.attname + "__lte": upper})
+            yield chunk, upper
+            if upper is None:
+                break
+            last_key = upper
+        # Keyset pagination skips NULL keys, thus check these separately
+        if key.null:
+            yield queryset.filter(**{key.attname + "__isnull": True}), None
+
+    def run(self, resume=True):
+        """Validate all pre-existing rows.
+
+        Args:
+            resume (bool, optional):
+                Whether to continue from the last recorded checkpoint.
+                If :code:`False` any recorded progress is discarded.
+
+        Returns:
+            int: The number of violating rows (or groups) found.
+        """
+        if self.sleep and self.connection.in_atomic_block:
+            raise ValueError(
+                "'sleep' would hold the transaction open between chunks, "
+                "validate outside of transactions, e.g. in a migration with "
+                "atomic = False"
+            )
+        self._ensure_checkpoint_table()
+        if not resume:
+            self.reset()
+
+        start = None
+        violations = 0
+        checkpoint = self._load_checkpoint()
+        if checkpoint is not None and not checkpoint[2]:
+            last_key, violations, _ = checkpoint
+            if last_key is not None:
+                queryset = self.constraint.get_queryset(
+                    self.model, using=self.using
+                )
+                key = self.constraint._get_key_field(self.model, queryset)
+                start = key.to_python(last_key)
+
+        for index, (chunk, upper) in enumerate(self.chunks(start)):
+            if index and self.sleep:
+                time.sleep(self.sleep)
+            violations += chunk.count()
+            if upper is not None:
+                self._save_checkpoint(upper, violations)
+        self._save_checkpoint(None, violations, finished=True)
+        return violations
+
+
+def validate_constraint(model, constraint, resume=True, **kwargs):
+    """Validate pre-existing rows against constraint.
+
+    Shorthand for :code:`ChunkedValidator(model, constraint, **kwargs)`.
+
+    Returns:
+        int: The number of violating rows (or groups) found.
+    """
+    return ChunkedValidator(model, constraint, **kwargs).run(resume=resume)
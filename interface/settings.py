@@ -88,6 +88,9 @@ DATABASES = {
     }
 }
 
+# Clone the test databases from a template, rather than migrating them
+TEST_RUNNER = "django_queryset_constraint.testing.TemplateDatabaseRunner"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
@@ -50,7 +50,7 @@ setup(
     include_package_data=True,
     download_url="https://github.com/magenta-aps/django_queryset_constraint/archive/master.zip",
     zip_safe=False,
-    install_requires=["Django"],
+    install_requires=["Django", "contextvars; python_version < '3.7'"],
     classifiers=[
         "Environment :: Web Environment",
         "Framework :: Django",